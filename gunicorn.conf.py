@@ -0,0 +1,7 @@
+# Gunicorn reads this from the working directory. With SERVER_MODE=asgi, the Procfile serves
+# tracker.asgi instead of tracker.wsgi, and its workers are uvicorn's: each one keeps many
+# connections open on an event loop, rather than tying up a sync worker for every slow client.
+import os
+
+if os.environ.get('SERVER_MODE') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
@@ -0,0 +1,50 @@
+import functools
+
+from asgiref.sync import SyncToAsync
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class DatabaseSyncToAsync(SyncToAsync):
+    """sync_to_async() for code that uses the database, run in the thread pool rather than one shared thread.
+
+    Each pool thread keeps its own connection, so connections are tidied up around every call, as
+    request_started and request_finished would for a sync view.
+    """
+
+    def __init__(self, func):
+        super().__init__(func, thread_sensitive=False)
+
+    def thread_handler(self, *args, **kwargs):
+        close_old_connections()
+        try:
+            return super().thread_handler(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+
+database_sync_to_async = DatabaseSyncToAsync
+
+
+class AsyncViewMixin:
+    """Serve the view as a coroutine when ASYNC_VIEWS is on, as it is under tracker.asgi.
+
+    Under ASGI, Django 3.1 runs every sync view in a single thread per process, one request at a
+    time. The ORM is still synchronous, so these views run their usual handlers too, but in the
+    pool of ASGI_THREADS threads, leaving the event loop free to receive and send other requests.
+    Place the mixin first, so that the access mixins' checks run in the pool as well. Under WSGI
+    the view is left sync, as wrapping it in an event loop there only adds overhead.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        if not settings.ASYNC_VIEWS:
+            return view
+        run_view = database_sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            return await run_view(request, *args, **kwargs)
+
+        functools.update_wrapper(async_view, view)
+        return async_view
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from . import instrumentation
+from .models import Attachment, IssueAttachment
+from .thumbnails import delete_derivatives
+from .uploads import StoredUploadedFile, is_s3, s3_key
+
+# Attachments are stored under the SHA-256 of their content, so a file uploaded again, to the same
+# issue or another, is only kept once. Each Attachment counts the IssueAttachments using it, and is
+# deleted along with its file once the last of them is (see collect_garbage()).
+CHUNK_SIZE = 1024 * 1024
+UPLOAD_DIRECTORY = 'attachments/uploads'
+
+
+def get_storage():
+    return Attachment._meta.get_field('file').storage
+
+
+def content_name(sha256, file_name):
+    extension = os.path.splitext(file_name)[1].lower()[:10]
+    return f'attachments/{sha256[:2]}/{sha256}{extension}'
+
+
+def upload_name(file_name):
+    """A fresh name to write an upload to until its hash is known, when it's moved to content_name()."""
+    file_name = get_storage().get_valid_name(os.path.basename(file_name)) or 'upload'
+    return f'{UPLOAD_DIRECTORY}/{uuid.uuid4().hex}/{file_name}'
+
+
+def hash_file(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_stored(storage, name):
+    with storage.open(name, 'rb') as stored:
+        return hash_file(stored)
+
+
+def move(storage, source, target):
+    """Move a stored file without passing it through this process where the storage allows."""
+    if is_s3(storage):
+        storage.bucket.meta.client.copy_object(
+            Bucket=storage.bucket_name,
+            Key=s3_key(storage, target),
+            CopySource={'Bucket': storage.bucket_name, 'Key': s3_key(storage, source)}
+        )
+    elif isinstance(storage, FileSystemStorage):
+        path = storage.path(target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(storage.path(source), path)
+        return target
+    else:
+        with storage.open(source, 'rb') as stored:
+            target = storage.save(target, stored)
+    storage.delete(source)
+    return target
+
+
+def get_or_create_attachment(sha256, file_name, size, content_type, write):
+    """Return the Attachment with this content, calling write(name) to store the file if there's none yet.
+
+    write() returns the name the file ended up under. Two uploads of the same new file may both write
+    it, but they write the same bytes to the same name, and only one of them creates the Attachment.
+    """
+    attachment = Attachment.objects.filter(sha256=sha256).first()
+    if attachment is not None:
+        return attachment, False
+    name = content_name(sha256, file_name)
+    if not get_storage().exists(name):
+        name = write(name)
+    try:
+        with transaction.atomic():
+            attachment = Attachment.objects.create(sha256=sha256, file=name, size=size, content_type=content_type or '')
+        return attachment, True
+    except IntegrityError:
+        return Attachment.objects.get(sha256=sha256), False
+
+
+def store_upload(uploaded):
+    """Return the Attachment for a file received by Django's own upload handlers, storing it if it's new."""
+    def write(name):
+        uploaded.seek(0)
+        return get_storage().save(name, uploaded)
+
+    return get_or_create_attachment(hash_file(uploaded), uploaded.name, uploaded.size, uploaded.content_type, write)[0]
+
+
+def adopt_stored(name, file_name, content_type, sha256=None):
+    """Return the Attachment for a file already written to storage under name, by streaming or a direct upload.
+
+    The file is moved to its content address, or deleted if the same content is already stored.
+    """
+    storage = get_storage()
+    if sha256 is None:
+        sha256 = hash_stored(storage, name)
+    moved = False
+
+    def write(target):
+        nonlocal moved
+        moved = True
+        return move(storage, name, target)
+
+    attachment, _ = get_or_create_attachment(sha256, file_name, storage.size(name), content_type, write)
+    if not moved:
+        storage.delete(name)
+    return attachment
+
+
+def store(uploaded):
+    """Return the Attachment for any uploaded file."""
+    if isinstance(uploaded, StoredUploadedFile):
+        attachment = adopt_stored(uploaded.storage_name, uploaded.name, uploaded.content_type, uploaded.sha256)
+        # The file now belongs to the attachment, so it mustn't be discarded with the request's leftovers.
+        uploaded.storage_name = None
+        return attachment
+    return store_upload(uploaded)
+
+
+def attach(issue, attachment, name):
+    """Attach a file to an issue under the given name, unless it's attached already."""
+    instrumentation.registry.observe_value('upload_bytes', attachment.size)
+    with transaction.atomic():
+        IssueAttachment.objects.get_or_create(issue=issue, attachment=attachment, defaults={'name': name})
+
+
+def count_use(attachment_id, change):
+    Attachment.objects.filter(id=attachment_id).update(ref_count=F('ref_count') + change)
+
+
+def collect_garbage(attachment_ids=None):
+    """Delete attachments that nothing uses any more, with their files. Returns how many were deleted."""
+    unused = Attachment.objects.filter(ref_count=0)
+    if attachment_ids is not None:
+        unused = unused.filter(id__in=attachment_ids)
+    storage = get_storage()
+    deleted = 0
+    for attachment in unused:
+        # Checked again as it's deleted, in case an upload of the same file has just attached it.
+        with transaction.atomic():
+            count, _ = Attachment.objects.filter(id=attachment.id, ref_count=0, uses=None).delete()
+        if count:
+            storage.delete(attachment.file.name)
+            delete_derivatives(attachment.file.name)
+            deleted += 1
+    return deleted
+
+
+def recount():
+    """Set every attachment's ref_count from its uses, in case they've drifted apart."""
+    for attachment in Attachment.objects.annotate(uses_count=Count('uses')).exclude(ref_count=F('uses_count')):
+        Attachment.objects.filter(id=attachment.id).update(ref_count=attachment.uses_count)
@@ -0,0 +1,261 @@
+import math
+import random
+import statistics
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.contrib.sessions.models import Session
+from django.db import connection
+from django.template.defaultfilters import slugify
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Project, Issue, Comment, Reply
+from .permissions import MANAGER_GROUP
+
+# A synthetic dataset for the benchmark command, and the scripted scenarios it times. Each scenario
+# is a list of requests made by one browser session, in order; the scenarios act as a Project
+# Manager assigned to the first project, whose first issue has the deep comment thread.
+BATCH_SIZE = 5000
+PASSWORD = 'benchmark'
+USERNAME_PREFIX = 'bench-user-'
+PERCENTILES = (50, 90, 95, 99)
+TABLE_PARAMS = {'draw': 1, 'start': 0, 'length': 10, 'order[0][column]': 0, 'order[0][dir]': 'asc'}
+
+
+def refetch(queryset, objs):
+    """The objects bulk_create() made, with their primary keys, on backends that don't return them."""
+    if objs and objs[0].pk is None:
+        return list(queryset.order_by('id'))
+    return objs
+
+
+def generate_data(users=200, projects=20, issues=5000, comments=20000, replies=20000, thread=200, seed=0):
+    """Create a dataset of the given size and return the objects the scenarios act on.
+
+    thread of the comments go to the first issue, for the deep thread; the rest, and the replies,
+    are spread at random. Everything is bulk created, so the search index isn't built for it.
+    """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+    users = refetch(User.objects.filter(username__startswith=USERNAME_PREFIX), User.objects.bulk_create([
+        User(username=f'{USERNAME_PREFIX}{i}', email=f'{USERNAME_PREFIX}{i}@example.com', password=password)
+        for i in range(users)
+    ]))
+    manager_group, _ = Group.objects.get_or_create(name=MANAGER_GROUP)
+    managers = users[:max(1, len(users) // 10)]
+    manager_group.user_set.add(*managers)
+
+    projects = refetch(Project.objects.filter(title__startswith='Benchmark Project '), Project.objects.bulk_create([
+        Project(title=f'Benchmark Project {i}', slug=slugify(f'Benchmark Project {i}'), description='Generated.')
+        for i in range(projects)
+    ]))
+    members = {project.id: {users[0]} for project in projects[:1]}
+    # A few users are kept out of the first project, for the project-assign scenario to assign.
+    outsiders = users[-5:] if len(users) > 5 and len(projects) > 1 else []
+    for user in users:
+        choices = projects[1:] if user in outsiders else projects
+        for project in rng.sample(choices, min(len(choices), rng.randint(1, 3))):
+            members.setdefault(project.id, set()).add(user)
+    members = {project_id: sorted(assigned, key=lambda user: user.id) for project_id, assigned in members.items()}
+    ProjectUser = Project.assigned_users.through
+    ProjectUser.objects.bulk_create([
+        ProjectUser(project_id=project_id, user_id=user.id) for project_id, assigned in members.items() for user in assigned
+    ], batch_size=BATCH_SIZE)
+
+    next_nums = {project.id: 1 for project in projects}
+    staffed = [project for project in projects if project.id in members]
+    for start in range(0, issues, BATCH_SIZE):
+        batch = []
+        for i in range(start, min(start + BATCH_SIZE, issues)):
+            project = staffed[0] if i == 0 else rng.choice(staffed)
+            batch.append(Issue(
+                title=f'Generated issue {i}', description='Generated.', num=next_nums[project.id],
+                submitter=rng.choice(members[project.id]), assignee=rng.choice(members[project.id]),
+                project=project, priority=rng.randint(1, 5), issue_type=rng.choice(['bug', 'feature', 'other']),
+                status=Issue.STATUS_OPEN if rng.random() < 0.3 else Issue.STATUS_CLOSED
+            ))
+            next_nums[project.id] += 1
+        Issue.objects.bulk_create(batch)
+    for project in projects:
+        Project.objects.filter(id=project.id).update(next_issue_num=next_nums[project.id])
+
+    issue_rows = list(Issue.objects.filter(project__in=projects).order_by('id').values_list('id', 'project_id'))
+    IssueUser = Issue.assigned_users.through
+    assignments = set()
+    for issue_id, project_id in issue_rows:
+        for user in rng.sample(members[project_id], min(2, len(members[project_id]))):
+            assignments.add((issue_id, user.id))
+        # The acting manager, like any manager assigned to a project, is assigned its issues.
+        if project_id == projects[0].id:
+            assignments.add((issue_id, users[0].id))
+    IssueUser.objects.bulk_create(
+        [IssueUser(issue_id=issue_id, user_id=user_id) for issue_id, user_id in assignments], batch_size=BATCH_SIZE
+    )
+
+    def create_batches(model, make, count):
+        for start in range(0, count, BATCH_SIZE):
+            model.objects.bulk_create([make(i) for i in range(start, min(start + BATCH_SIZE, count))])
+
+    deep_issue_id = issue_rows[0][0]
+    create_batches(Comment, lambda i: Comment(
+        text=f'Generated comment {i}.', author=rng.choice(users),
+        issue_id=deep_issue_id if i < thread else rng.choice(issue_rows)[0]
+    ), max(comments, thread))
+    comment_ids = list(Comment.objects.filter(issue_id__in=[row[0] for row in issue_rows]).values_list('id', flat=True))
+    if comment_ids:
+        create_batches(Reply, lambda i: Reply(
+            text=f'Generated reply {i}.', author=rng.choice(users), comment_id=rng.choice(comment_ids)
+        ), replies)
+
+    return SimpleNamespace(
+        user=users[0],
+        project=projects[0],
+        issue=Issue.objects.select_related('project').get(id=deep_issue_id),
+        outsiders=outsiders,
+        counts={
+            'users': len(users), 'projects': len(projects), 'issues': len(issue_rows),
+            'comments': len(comment_ids), 'replies': replies if comment_ids else 0, 'thread': thread
+        }
+    )
+
+
+def issue_kwargs(data):
+    return {'project_slug': data.project.slug, 'issue_num': data.issue.num}
+
+
+def login_my_issues(data):
+    return [
+        ('log in', 'post', reverse('login'), {'username': data.user.username, 'password': PASSWORD}),
+        ('my issues', 'get', reverse('issues:my-issues'), {}),
+        ('my issues table', 'get', reverse('issues:my-issues-table'), TABLE_PARAMS),
+    ]
+
+
+def project_detail(data):
+    return [
+        ('project detail', 'get', reverse('issues:project-detail', kwargs={'slug': data.project.slug}), {}),
+        ('project issues table', 'get', reverse('issues:project-issues-table', kwargs={'slug': data.project.slug}), TABLE_PARAMS),
+    ]
+
+
+def issue_detail(data):
+    return [('issue detail', 'get', reverse('issues:issue-detail', kwargs=issue_kwargs(data)), {})]
+
+
+def comment_post(data):
+    return [('post comment', 'post', reverse('issues:comment-create', kwargs=issue_kwargs(data)), {'text': 'A benchmark comment.'})]
+
+
+def project_assign(data):
+    if not data.outsiders:
+        raise RuntimeError('Assigning users takes a dataset of more than one project and five users.')
+    url = reverse('issues:project-assign', kwargs={'slug': data.project.slug})
+    selection = [user.id for user in data.outsiders]
+    return [
+        ('assign users', 'post', url, {'action': 'assign', 'selection': selection}),
+        ('unassign users', 'post', url, {'action': 'unassign', 'selection': selection}),
+    ]
+
+
+# Scenarios that log in themselves start each run logged out.
+SCENARIOS = {
+    'login-my-issues': (login_my_issues, False),
+    'project-detail': (project_detail, True),
+    'issue-detail': (issue_detail, True),
+    'comment-post': (comment_post, True),
+    'project-assign': (project_assign, True),
+}
+
+
+def percentile(values, p):
+    """The nearest-rank percentile of a list of values."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def make_request(client, method, url, params):
+    response = getattr(client, method)(url, params)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{method.upper()} {url} returned {response.status_code}.')
+    return response
+
+
+def run_scenario(name, data, repeat=50, warmup=5):
+    """Run a scenario repeat times, after warmup untimed runs, and summarize each of its requests.
+
+    Latency and queries come from the timed runs. Peak memory is traced over one more run, since
+    tracing slows everything else down.
+    """
+    make_steps, logged_in = SCENARIOS[name]
+    steps = make_steps(data)
+    client = Client()
+    timings = {step[0]: [] for step in steps}
+    queries = {step[0]: [] for step in steps}
+    session_queries = {step[0]: [] for step in steps}
+
+    def start_session():
+        if logged_in:
+            client.force_login(data.user)
+        else:
+            client.logout()
+
+    for i in range(warmup + repeat):
+        start_session()
+        for step, method, url, params in steps:
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                make_request(client, method, url, params)
+                elapsed = (time.perf_counter() - start) * 1000
+            if i >= warmup:
+                timings[step].append(elapsed)
+                queries[step].append(len(captured))
+                session_queries[step].append(sum(Session._meta.db_table in query['sql'] for query in captured))
+
+    peak_memory = {}
+    start_session()
+    for step, method, url, params in steps:
+        tracemalloc.start()
+        try:
+            make_request(client, method, url, params)
+            peak_memory[step] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        f'{name}/{step}': {
+            'requests': len(timings[step]),
+            'latency_ms': {
+                **{f'p{p}': round(percentile(timings[step], p), 3) for p in PERCENTILES},
+                'mean': round(statistics.mean(timings[step]), 3),
+                'max': round(max(timings[step]), 3),
+            },
+            'queries': {
+                'mean': round(statistics.mean(queries[step]), 2),
+                'max': max(queries[step]),
+                'session': max(session_queries[step]),
+            },
+            'peak_memory_kb': round(peak_memory[step] / 1024, 1),
+        }
+        for step, *_ in steps
+    }
+
+
+def compare(results, baseline):
+    """Yield (request, metric, before, after) for the headline metrics of requests in both runs."""
+    for key, result in results['requests'].items():
+        before = baseline.get('requests', {}).get(key)
+        if before is None:
+            continue
+        for metric, value in [
+            ('p50 ms', lambda r: r['latency_ms']['p50']),
+            ('p95 ms', lambda r: r['latency_ms']['p95']),
+            ('queries', lambda r: r['queries']['max']),
+            ('session queries', lambda r: r['queries'].get('session', 0)),
+            ('peak KB', lambda r: r['peak_memory_kb']),
+        ]:
+            yield key, metric, value(before), value(result)
@@ -0,0 +1,199 @@
+import base64
+import functools
+import hashlib
+import os
+import posixpath
+import re
+import urllib.request
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+try:
+    import rcssmin
+    import rjsmin
+except ImportError:
+    rcssmin = rjsmin = None
+
+# Pages load a few bundles of static files rather than each library and script separately, and from
+# this site rather than several CDNs. build_assets concatenates and minifies each bundle's sources
+# into static/bundles/, for collectstatic to fingerprint and compress, and WhiteNoise to serve with
+# far-future cache headers. Until a bundle is built, the {% bundle %} tag includes its sources.
+#
+# Third-party sources live under static/vendor/, each pinned to the integrity hash it was published
+# with. jQuery and Popper are committed there. Bootstrap's files are downloaded by build_assets
+# --fetch, which checks them against their hashes, and build() checks every vendored file again.
+# Until a file is here, pages load it from its CDN, passing the hash on for the browser to check.
+#
+# DataTables publishes no hashes, and none can be pinned without its files to compute them from, so
+# they are never downloaded. Pages go on loading them from the DataTables CDN, as they did before
+# the bundles, and the bundles that include them aren't built, until the files are committed here
+# with their hashes pinned.
+BUNDLE_DIRECTORY = 'bundles'
+VENDOR_FILES = {
+    'vendor/jquery/jquery-3.5.1.min.js': (
+        'https://code.jquery.com/jquery-3.5.1.min.js',
+        'sha384-ZvpUoO/+PpLXR1lu4jmpXWu80pZlYUAfxl5NsBMWOEPSjUn/6Z/hRTt8+pR6L4N2',
+    ),
+    'vendor/popper.js/popper-1.16.1.min.js': (
+        'https://cdn.jsdelivr.net/npm/popper.js@1.16.1/dist/umd/popper.min.js',
+        'sha384-9/reFTGAW83EW2RDu2S0VKaIzap3H66lZH81PoYlFhbGU+6BZp6G7niu735Sk7lN',
+    ),
+    'vendor/bootstrap/bootstrap-4.5.2.min.js': (
+        'https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/js/bootstrap.min.js',
+        'sha384-B4gt1jrGC7Jh4AgTPSdUtOBvfO8shuf57BaghqFfPlYxofvL8/KUEfYiJOMMV+rV',
+    ),
+    'vendor/bootstrap/bootstrap-4.5.2.min.css': (
+        'https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/css/bootstrap.min.css',
+        'sha384-JcKb8q3iqJ61gNV9KGb8thSsNjpSL0n8PARn9HuZOnIxN0hoP+VmmDGMN5t9UJ0Z',
+    ),
+    'vendor/datatables/js/jquery.dataTables-1.10.22.min.js': (
+        'https://cdn.datatables.net/1.10.22/js/jquery.dataTables.min.js', None,
+    ),
+    'vendor/datatables/css/jquery.dataTables-1.10.22.min.css': (
+        'https://cdn.datatables.net/1.10.22/css/jquery.dataTables.min.css', None,
+    ),
+}
+BUNDLES = {
+    'base.css': [
+        'vendor/bootstrap/bootstrap-4.5.2.min.css',
+        'vendor/datatables/css/jquery.dataTables-1.10.22.min.css',
+        'css/style.css',
+    ],
+    'base.js': [
+        'vendor/jquery/jquery-3.5.1.min.js',
+        'vendor/popper.js/popper-1.16.1.min.js',
+        'vendor/bootstrap/bootstrap-4.5.2.min.js',
+        'vendor/datatables/js/jquery.dataTables-1.10.22.min.js',
+        'js/script.js',
+    ],
+    'issue-detail.js': ['js/issue_detail.js'],
+    'my-issues.js': ['js/my_issues.js'],
+}
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def bundle_name(name):
+    return f'{BUNDLE_DIRECTORY}/{name}'
+
+
+@functools.lru_cache(maxsize=None)
+def find(path):
+    """finders.find(), cached as bundles are looked for on every page. Building or fetching clears it."""
+    return finders.find(path)
+
+
+@receiver(setting_changed)
+def clear_found(setting, **kwargs):
+    if setting in ('STATICFILES_DIRS', 'STATICFILES_FINDERS'):
+        find.cache_clear()
+
+
+def is_built(name):
+    return find(bundle_name(name)) is not None
+
+
+def is_pinned(source):
+    return source in VENDOR_FILES and VENDOR_FILES[source][1] is not None
+
+
+def cdn_sources(name):
+    """The bundle's vendored sources that can only be loaded from their CDN, having no hash to check them against."""
+    return [
+        source for source in BUNDLES[name]
+        if source in VENDOR_FILES and not is_pinned(source) and find(source) is None
+    ]
+
+
+def get_output_directory():
+    """Bundles and vendored files are written to the project's own static directory."""
+    if not settings.STATICFILES_DIRS:
+        raise ImproperlyConfigured('Building bundles needs a directory in STATICFILES_DIRS to write them to.')
+    directory = settings.STATICFILES_DIRS[0]
+    return directory[1] if isinstance(directory, (list, tuple)) else directory
+
+
+def integrity(content, algorithm='sha384'):
+    """The subresource integrity hash of some content."""
+    return f'{algorithm}-{base64.b64encode(hashlib.new(algorithm, content).digest()).decode()}'
+
+
+def check_integrity(content, expected):
+    return expected is not None and integrity(content, expected.split('-', 1)[0]) == expected
+
+
+def fetch_vendor_files(refetch=False):
+    """Download the vendored files that are missing, checking each against its hash.
+
+    Files with no pinned hash are never downloaded. Yields the name of each file downloaded. Raises
+    ValueError, leaving the file unwritten, if one doesn't match its hash.
+    """
+    directory = get_output_directory()
+    for name, (url, expected) in VENDOR_FILES.items():
+        path = os.path.join(directory, *name.split('/'))
+        if not is_pinned(name) or (os.path.exists(path) and not refetch):
+            continue
+        with urllib.request.urlopen(url, timeout=30) as response:
+            content = response.read()
+        if not check_integrity(content, expected):
+            raise ValueError(f'{url} does not match its integrity hash {expected}.')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        find.cache_clear()
+        yield name
+
+
+def rewrite_css_urls(css, source, target):
+    """Make the relative URLs in a stylesheet at source relative to target, where it's being moved."""
+    source_directory = posixpath.dirname(source)
+    target_directory = posixpath.dirname(target)
+
+    def rewrite(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', url):
+            return match.group(0)
+        path = posixpath.normpath(posixpath.join(source_directory, url))
+        return f'url({quote}{posixpath.relpath(path, target_directory)}{quote})'
+
+    return CSS_URL.sub(rewrite, css)
+
+
+def minify(name, content):
+    if rjsmin is None:
+        return content
+    if name.endswith('.css'):
+        return rcssmin.cssmin(content, keep_bang_comments=True)
+    return rjsmin.jsmin(content, keep_bang_comments=True)
+
+
+def build(name):
+    """Write a bundle from its sources, returning the path it was written to.
+
+    Raises ValueError if a source is missing, or is vendored and doesn't match its pinned hash.
+    """
+    target = bundle_name(name)
+    parts = []
+    for source in BUNDLES[name]:
+        path = finders.find(source)
+        if path is None:
+            raise ValueError(f'{source} is missing; run build_assets --fetch to download the vendored files.')
+        with open(path, 'rb') as f:
+            data = f.read()
+        if source in VENDOR_FILES and not check_integrity(data, VENDOR_FILES[source][1]):
+            raise ValueError(f'{source} does not match its pinned integrity hash.')
+        content = data.decode('utf-8')
+        if name.endswith('.css'):
+            content = rewrite_css_urls(content, source, target)
+        parts.append(minify(name, content))
+    # Scripts are separated with a semicolon, in case one doesn't end its last statement.
+    separator = '\n' if name.endswith('.css') else ';\n'
+    path = os.path.join(get_output_directory(), BUNDLE_DIRECTORY, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(separator.join(parts) + '\n')
+    find.cache_clear()
+    return path
@@ -0,0 +1,88 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import instrumentation
+
+# Cached pages and querysets are keyed by the versions of everything they show, so they never need
+# deleting: a change bumps a version, and the entries made for the old one are no longer looked up.
+CACHE_TIMEOUT = 60 * 60
+
+
+def version_key(scope, pk=None):
+    return f'issues:version:{scope}' if pk is None else f'issues:version:{scope}:{pk}'
+
+
+def new_version():
+    # Versions start from the clock rather than from 1. If a counter is evicted, its replacement
+    # starts past any value the old one reached, so entries cached under that value can't come back.
+    return int(time.time() * 1000000)
+
+
+def get_versions(*scopes):
+    """Return the current version of each (scope, pk) pair, such as ('issue', 3) or ('users', None)."""
+    keys = [version_key(*scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, new_version(), timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key) for key in keys]
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, new_version(), timeout=None)
+
+
+def bump_versions(*scopes):
+    """Invalidate everything cached against the given (scope, pk) pairs.
+
+    The versions are bumped straight away, and again once the current transaction commits, so that
+    a page rendered from the old data by another request in the meantime isn't kept.
+    """
+    keys = [version_key(*scope) for scope in scopes]
+    _bump(keys)
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def versioned_key(name, scopes, *parts):
+    """Build a cache key for 'name' that changes whenever one of the scopes' versions is bumped."""
+    values = ':'.join(str(value) for value in (*get_versions(*scopes), *parts))
+    return f'issues:{name}:{hashlib.md5(values.encode()).hexdigest()}'
+
+
+def record_lookup(key, hit):
+    """Count a lookup of a versioned key, by its name, for the cache hit ratio metrics."""
+    instrumentation.registry.increment('cache_lookups', (key.split(':')[1], 'hit' if hit else 'miss'))
+
+
+def get_or_set(name, scopes, func, *parts):
+    """Return the value cached for 'name' at the current versions, calling func() to make it if need be."""
+    key = versioned_key(name, scopes, *parts)
+    missed = False
+
+    def make():
+        nonlocal missed
+        missed = True
+        return func()
+
+    value = cache.get_or_set(key, make, CACHE_TIMEOUT)
+    record_lookup(key, not missed)
+    return value
+
+
+def project_scopes(project_id):
+    """The versions behind a project's pages: the project, its issues, and the users shown on them."""
+    return [('project', project_id), ('users', None)]
+
+
+def issue_scopes(project_id, issue_id):
+    """The versions behind an issue's page, which also shows the project's data and users."""
+    return [('project', project_id), ('issue', issue_id), ('users', None)]
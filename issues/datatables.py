@@ -0,0 +1,135 @@
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import formats, timezone
+from django.utils.html import format_html, format_html_join
+from django.views.generic.base import View
+
+from .cache import CACHE_TIMEOUT, record_lookup
+from .pagination import InvalidCursor, KeysetPaginator
+
+
+def format_datetime(value):
+    """Format a datetime the way the {{ value }} template tag displays it."""
+    return formats.date_format(timezone.localtime(value), 'DATETIME_FORMAT')
+
+
+def options_list(links):
+    """Render (url, label) pairs as the list of links shown in a table's options column."""
+    return format_html('<ul>{}</ul>', format_html_join('', '<li><a href="{}">{}</a></li>', links))
+
+
+class DataTableView(View):
+    """Serve one page of a table using the DataTables server-side processing protocol.
+
+    Searching, sorting and slicing all happen in the database, so the size of a response depends
+    on the page length rather than on the number of rows in the table.
+
+    Subclasses set 'columns' to a list of (name, order_field) pairs in the order the columns are
+    displayed, using None as the order_field of columns that can't be sorted, and 'search_fields'
+    to the fields matched against the search box. They implement get_queryset() and get_row(),
+    which returns a dict keyed by column name. DataTables inserts cell values as HTML, so get_row()
+    must escape any text it returns.
+
+    Responses are cached if get_cache_key() returns a key, which must change whenever the rows would.
+    """
+    columns = []
+    search_fields = []
+    default_length = 10
+    max_length = 100
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_row(self, obj):
+        raise NotImplementedError
+
+    def get_int_param(self, name, default):
+        try:
+            return int(self.request.GET.get(name, default))
+        except ValueError:
+            return default
+
+    def filter_queryset(self, queryset):
+        search = self.request.GET.get('search[value]', '').strip()
+        if not search:
+            return queryset
+        query = Q()
+        for field in self.search_fields:
+            query |= Q(**{f'{field}__icontains': search})
+        return queryset.filter(query)
+
+    def get_ordering(self):
+        ordering = []
+        i = 0
+        while f'order[{i}][column]' in self.request.GET:
+            column = self.get_int_param(f'order[{i}][column]', -1)
+            if 0 <= column < len(self.columns) and self.columns[column][1]:
+                prefix = '-' if self.request.GET.get(f'order[{i}][dir]') == 'desc' else ''
+                ordering.append(prefix + self.columns[column][1])
+            i += 1
+        # Break ties on the primary key so that rows don't shift between pages.
+        ordering.append('pk')
+        return ordering
+
+    def get_keyset_paginator(self, queryset, ordering, length):
+        """Return a paginator for stepping through the table by cursor, if the ordering allows one."""
+        try:
+            return KeysetPaginator(queryset, ordering, length)
+        except ValueError:
+            return None
+
+    def get_cache_key(self):
+        return None
+
+    def get_table_params(self):
+        """The request's table parameters, in a stable order, for use in a cache key."""
+        return sorted((name, value) for name, value in self.request.GET.items() if name != 'draw')
+
+    def get(self, request, *args, **kwargs):
+        cache_key = self.get_cache_key()
+        data = cache.get(cache_key) if cache_key else None
+        if cache_key:
+            record_lookup(cache_key, data is not None)
+        if data is None:
+            data = self.get_data()
+            if cache_key:
+                cache.set(cache_key, data, CACHE_TIMEOUT)
+        return JsonResponse({'draw': self.get_int_param('draw', 0), **data})
+
+    def get_data(self):
+        queryset = self.get_queryset()
+        records_total = queryset.count()
+        filtered = self.filter_queryset(queryset)
+        records_filtered = records_total if filtered is queryset else filtered.count()
+
+        start = max(self.get_int_param('start', 0), 0)
+        length = self.get_int_param('length', self.default_length)
+        # DataTables asks for a length of -1 to show all rows, which is capped like any other length.
+        if length < 1 or length > self.max_length:
+            length = self.max_length
+        ordering = self.get_ordering()
+
+        # Clients stepping forward one page at a time send back the cursor from the previous response,
+        # so the database can seek straight to the page instead of counting past all the rows before it.
+        paginator = self.get_keyset_paginator(filtered, ordering, length)
+        page = None
+        cursor = self.request.GET.get('cursor')
+        if paginator and cursor:
+            try:
+                page = paginator.get_page(cursor).object_list
+            except InvalidCursor:
+                pass
+        if page is None:
+            page = list(filtered.order_by(*ordering)[start:start + length])
+
+        next_page = None
+        if paginator and page and start + length < records_filtered:
+            next_page = {'start': start + length, 'cursor': paginator.make_cursor(page[-1], 'next')}
+
+        return {
+            'recordsTotal': records_total,
+            'recordsFiltered': records_filtered,
+            'data': [self.get_row(obj) for obj in page],
+            'next': next_page
+        }
@@ -0,0 +1,293 @@
+import asyncio
+import io
+import json
+import logging
+import queue
+import select
+import threading
+import time
+import uuid
+from functools import lru_cache
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, transaction
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+from .async_views import database_sync_to_async
+from .models import Issue
+from .permissions import UserPermissions
+
+logger = logging.getLogger(__name__)
+
+# Issue activity is pushed to browsers as Server-Sent Events. Each event is published to channels:
+# the issue's, for the people looking at it, and a user's, for the people it's assigned to.
+# Events only say what happened, never the text of a post, and pages fetch what they show of it
+# through the usual views, so nothing is pushed that the viewer couldn't load anyway.
+#
+# Within a process, the Broadcaster hands events to the open streams subscribed to their channels.
+# The backend (EVENTS_BACKEND) carries them between processes: LocalBackend only delivers within
+# the process, which is all tests and a single-process server need.
+#
+# Streams are only served under ASGI, by EventStreamApp. Under WSGI each would hold a worker, so
+# pages aren't given the stream's URL, and keep polling for new comments instead.
+KEEPALIVE_INTERVAL = 15
+QUEUE_SIZE = 100
+# Sent first: how long the browser waits before reconnecting, in milliseconds.
+STREAM_START = b'retry: 5000\n\n'
+
+
+def issue_channel(issue_id):
+    return f'issue:{issue_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def encode(event):
+    """An event in the text/event-stream format."""
+    return f'id: {event["id"]}\nevent: {event["type"]}\ndata: {json.dumps(event)}\n\n'.encode()
+
+
+class Subscription:
+    """An open stream's queue of events, read from a thread."""
+
+    def __init__(self, channels):
+        self.channels = frozenset(channels)
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A client that can't keep up is dropped, and catches up when its browser reconnects.
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """An open stream's queue of events, read from an event loop."""
+
+    def __init__(self, channels, loop):
+        super().__init__(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def put(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broadcaster:
+    """Hand each event to this process's subscriptions to any of its channels."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def subscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions.setdefault(channel, set()).add(subscription)
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.subscriptions.get(channel, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self.subscriptions.pop(channel, None)
+
+    def deliver(self, channels, event):
+        with self.lock:
+            subscribers = set().union(*(self.subscriptions.get(channel, ()) for channel in channels))
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+class LocalBackend:
+    """Deliver events to the streams open in this process only."""
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+
+    def start(self):
+        pass
+
+    def publish(self, channels, event):
+        self.broadcaster.deliver(channels, event)
+
+
+class PostgresBackend:
+    """Deliver events to every process with PostgreSQL's LISTEN/NOTIFY.
+
+    Events are sent on the default database connection, and a thread in each process that has
+    streams open listens on a connection of its own.
+    """
+    channel = 'issue_events'
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self.lock = threading.Lock()
+        self.listener = None
+
+    def start(self):
+        with self.lock:
+            if self.listener is None or not self.listener.is_alive():
+                self.listener = threading.Thread(target=self.listen, name='issue-events', daemon=True)
+                self.listener.start()
+
+    def publish(self, channels, event):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, json.dumps([sorted(channels), event])])
+
+    def listen(self):
+        while True:
+            try:
+                self.listen_once()
+            except Exception:
+                logger.exception('Lost the connection listening for issue events; reconnecting.')
+                time.sleep(5)
+
+    def listen_once(self):
+        with connection.temporary_connection() as cursor:
+            # The connection is this thread's own, so it's left in autocommit to receive notifications.
+            cursor.execute(f'LISTEN {self.channel}')
+            pg_connection = cursor.connection
+            while True:
+                if select.select([pg_connection], [], [], KEEPALIVE_INTERVAL) == ([], [], []):
+                    continue
+                pg_connection.poll()
+                while pg_connection.notifies:
+                    notify = pg_connection.notifies.pop(0)
+                    channels, event = json.loads(notify.payload)
+                    self.broadcaster.deliver(channels, event)
+
+
+broadcaster = Broadcaster()
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.EVENTS_BACKEND)(broadcaster)
+
+
+def is_enabled():
+    """Whether pages should open the stream: only under tracker.asgi, which turns ASYNC_VIEWS on."""
+    return settings.ASYNC_VIEWS
+
+
+def publish(event_type, channels, **data):
+    """Publish an event to the given channels once the current transaction commits."""
+    event = {'id': uuid.uuid4().hex, 'type': event_type, **data}
+    channels = list(channels)
+    transaction.on_commit(lambda: get_backend().publish(channels, event))
+
+
+def subscribe(subscription):
+    get_backend().start()
+    broadcaster.subscribe(subscription)
+    return subscription
+
+
+def unsubscribe(subscription):
+    broadcaster.unsubscribe(subscription)
+
+
+def get_channels(request, issue_id=None):
+    """The channels the request's user may follow: their own, and the issue's if they can see its project."""
+    channels = [user_channel(request.user.id)]
+    if issue_id is not None:
+        issue = Issue.objects.select_related('project').filter(id=issue_id).first()
+        if issue is not None and request.permissions.can_view_project(issue.project):
+            channels.append(issue_channel(issue.id))
+    return channels
+
+
+def parse_issue_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class EventStreamApp:
+    """Serve the event stream under ASGI, passing other requests on to the Django application.
+
+    Django 3.1 can't stream a response asynchronously, so this serves the stream path itself. It
+    holds streams open as long as the browser does, and each costs the process no more than a queue.
+    """
+
+    def __init__(self, application, path):
+        self.application = application
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            return await self.application(scope, receive, send)
+        request = ASGIRequest(scope, io.BytesIO())
+        channels = await database_sync_to_async(self.authorize)(request)
+        if channels is None:
+            await send({'type': 'http.response.start', 'status': 403, 'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Log in to follow issue activity.'})
+            return
+        subscription = subscribe(AsyncSubscription(channels, asyncio.get_running_loop()))
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]})
+            await send({'type': 'http.response.body', 'body': STREAM_START, 'more_body': True})
+            while not subscription.overflowed:
+                getting = asyncio.ensure_future(subscription.get(KEEPALIVE_INTERVAL))
+                await asyncio.wait([getting, disconnected], return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    getting.cancel()
+                    return
+                event = getting.result()
+                body = b': keepalive\n\n' if event is None else encode(event)
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        except OSError:
+            pass
+        finally:
+            disconnected.cancel()
+            unsubscribe(subscription)
+
+    @staticmethod
+    async def wait_for_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    def authorize(request):
+        engine = import_module(settings.SESSION_ENGINE)
+        request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        request.user = get_user(request)
+        if not request.user.is_authenticated:
+            return None
+        request.permissions = SimpleLazyObject(lambda: UserPermissions(request.user))
+        return get_channels(request, parse_issue_id(request.GET.get('issue')))
@@ -1,11 +1,18 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.models import User, Group
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+from .attachments import adopt_stored, attach, get_storage, store
 from .models import (
     Project,
     Issue,
     Comment,
-    Reply
+    Reply,
+    Attachment,
+    IssueAttachment
 )
+from .uploads import StoredUploadedFile, image_format, read_head, unsign_direct_upload
 
 import re
 
@@ -90,7 +97,119 @@ class ProjectForm(forms.ModelForm):
         self.fields['description'].widget.attrs = {'cols':'60', 'rows':'10'}
 
 
-class ProjectIssueForm(forms.ModelForm):
+class AttachmentField(forms.ImageField):
+    """An ImageField that also accepts uploads streamed to storage as they were received.
+
+    Those are checked from the start of the file only, so that they're never read back.
+    """
+
+    def to_python(self, data):
+        if data and data.size > settings.ATTACHMENT_MAX_UPLOAD_SIZE:
+            raise forms.ValidationError(
+                f'The attachment may be at most {filesizeformat(settings.ATTACHMENT_MAX_UPLOAD_SIZE)}.',
+                code='too_large'
+            )
+        if not isinstance(data, StoredUploadedFile):
+            return super().to_python(data)
+        data = forms.FileField.to_python(self, data)
+        if data is not None:
+            image_type = image_format(data.head)
+            if image_type is None:
+                raise forms.ValidationError(self.error_messages['invalid_image'], code='invalid_image')
+            data.content_type = Image.MIME.get(image_type)
+        return data
+
+
+class MultipleFileInput(forms.FileInput):
+
+    def __init__(self, attrs=None):
+        super().__init__({'multiple': True, **(attrs or {})})
+
+    def value_from_datadict(self, data, files, name):
+        return files.getlist(name) if hasattr(files, 'getlist') else files.get(name)
+
+
+class MultipleAttachmentField(AttachmentField):
+    """Any number of attachments, each cleaned as by AttachmentField, as a list of files."""
+
+    widget = MultipleFileInput
+
+    def clean(self, data, initial=None):
+        if not isinstance(data, (list, tuple)):
+            data = [data] if data else []
+        if not data and self.required:
+            raise forms.ValidationError(self.error_messages['required'], code='required')
+        return [super(MultipleAttachmentField, self).clean(file) for file in data]
+
+
+class AttachmentForm(forms.ModelForm):
+    """Base for the issue forms, adding and removing the issue's attachments.
+
+    New attachments come either as files or as signed keys from direct uploads (see
+    views.AttachmentUploadView), and are saved by save_attachments() once the issue is.
+    """
+
+    new_attachments = MultipleAttachmentField(required=False, label='Attachments')
+    attachment_keys = forms.CharField(required=False, widget=forms.HiddenInput)
+    remove_attachments = forms.ModelMultipleChoiceField(
+        queryset=IssueAttachment.objects.none(),
+        required=False,
+        widget=forms.CheckboxSelectMultiple,
+        label='Remove attachments'
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['remove_attachments'].queryset = self.instance.issue_attachments.all()
+        else:
+            del self.fields['remove_attachments']
+
+    @property
+    def direct_uploads(self):
+        return settings.ATTACHMENT_DIRECT_UPLOADS
+
+    def clean_attachment_keys(self):
+        keys = [key for key in self.cleaned_data['attachment_keys'].split(',') if key]
+        if not settings.ATTACHMENT_DIRECT_UPLOADS:
+            return []
+        uploads = []
+        for key in keys:
+            upload = unsign_direct_upload(key)
+            if not isinstance(upload, dict):
+                upload = None
+            elif 'attachment' in upload:
+                # The same file was already stored, so the browser didn't upload it again.
+                upload['attachment'] = Attachment.objects.filter(id=upload['attachment']).first()
+                if upload['attachment'] is None:
+                    upload = None
+            else:
+                head = read_head(get_storage(), upload['name'])
+                if head is None:
+                    upload = None
+                elif image_format(head) is None:
+                    self.add_error('new_attachments', self.fields['new_attachments'].error_messages['invalid_image'])
+                    continue
+            if upload is None:
+                self.add_error('new_attachments', 'An upload has expired. Please attach the file again.')
+            else:
+                uploads.append(upload)
+        return uploads
+
+    def save_attachments(self, issue):
+        """Attach the new files to the saved issue, and detach the ones ticked for removal."""
+        for uploaded in self.cleaned_data.get('new_attachments', []):
+            attach(issue, store(uploaded), uploaded.name)
+        for upload in self.cleaned_data.get('attachment_keys', []):
+            attachment = upload.get('attachment')
+            if attachment is None:
+                attachment = adopt_stored(upload['name'], upload['file_name'], upload['content_type'])
+            attach(issue, attachment, upload['file_name'])
+        for issue_attachment in self.cleaned_data.get('remove_attachments', []):
+            issue_attachment.delete()
+
+
+class ProjectIssueForm(AttachmentForm):
     class Meta:
         model = Issue
         exclude = (
@@ -100,6 +219,7 @@ class ProjectIssueForm(forms.ModelForm):
             'submitter',
             'num',
             'assigned_users',
+            'attachments',
             'project'
         )
 
@@ -109,7 +229,7 @@ class ProjectIssueForm(forms.ModelForm):
         self.fields['description'].widget.attrs = {'cols':'60', 'rows':'10'}
 
 
-class IssueForm(forms.ModelForm):
+class IssueForm(AttachmentForm):
     class Meta:
         model = Issue
         exclude = (
@@ -119,6 +239,7 @@ class IssueForm(forms.ModelForm):
             'submitter',
             'num',
             'assigned_users',
+            'attachments',
         )
 
     def __init__(self, user=None, *args, **kwargs):
@@ -0,0 +1,394 @@
+import asyncio
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+# Each request's latency, database queries and time, template rendering time and response size
+# are measured, sent back in a Server-Timing header, and added to histograms for the view that
+# handled it. Every process keeps its own histograms, and writes them to a file of its own in
+# METRICS_DIR every METRICS_WRITE_INTERVAL seconds, for the request_metrics command and
+# RequestMetricsView to add up across processes, and MetricsView to serve to Prometheus.
+#
+# Other parts of the tracker count things into the same registry: the counters in COUNTERS, by
+# their labels, the histograms in HISTOGRAMS, and gauges, which are read as each snapshot is taken.
+# Counters and histograms only ever grow, so the files of processes that have exited still count;
+# gauges are the current state of a process, so only running processes' are added up. The files of
+# processes that have exited are deleted once they haven't been written for METRICS_RETENTION
+# seconds, so that a server restarted over and over doesn't fill METRICS_DIR.
+INF = float('inf')
+BUCKETS = {
+    'latency_ms': (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, INF),
+    'queries': (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, INF),
+    'query_ms': (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, INF),
+    'template_ms': (1, 5, 10, 25, 50, 100, 250, 500, 1000, INF),
+    'response_bytes': (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, INF),
+}
+COUNTERS = {
+    'requests': ('view', 'status'),
+    'cache_lookups': ('name', 'result'),
+}
+HISTOGRAMS = {
+    'upload_bytes': (16384, 65536, 262144, 1048576, 4194304, 16777216, 52428800, INF),
+}
+
+# The measurements of the request being handled. A context variable, rather than a thread local,
+# so that the queries async views make in their thread pool are counted too.
+current_request = ContextVar('current_request', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.query_time += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        metrics = current_request.get()
+        # Templates rendered while another one is, by a tag, are part of its time already.
+        if metrics is None or metrics.rendering:
+            return super().render(context, request)
+        metrics.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+            metrics.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing how long each request spends rendering."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class Histogram:
+    """Counts of observed values at or below each bucket's upper bound, Prometheus style, with their sum."""
+
+    def __init__(self, buckets, counts=None, total=0.0):
+        self.buckets = buckets
+        self.counts = counts or [0] * len(buckets)
+        self.total = total
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """An upper bound for the value p percent of observations were at or below, or None past the last bucket."""
+        threshold = self.count * p / 100
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= threshold and seen:
+                return bound if bound != INF else None
+        return 0
+
+    def to_dict(self):
+        return {'counts': self.counts, 'sum': self.total}
+
+    @classmethod
+    def from_dict(cls, buckets, data):
+        return cls(buckets, list(data['counts']), data['sum'])
+
+
+def new_histograms():
+    return {name: Histogram(buckets) for name, buckets in BUCKETS.items()}
+
+
+class Registry:
+    """This process's histograms by view, counters, other histograms and gauges."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.last_write = 0.0
+        self.started = time.time()
+
+    def observe(self, view_name, values):
+        with self.lock:
+            histograms = self.views.setdefault(view_name, new_histograms())
+            for name, value in values.items():
+                histograms[name].observe(value)
+        if settings.METRICS_DIR and time.monotonic() - self.last_write >= settings.METRICS_WRITE_INTERVAL:
+            self.write()
+
+    def increment(self, name, labels, amount=1):
+        """Add to the counter name for the given tuple of label values, in the order COUNTERS lists them."""
+        with self.lock:
+            counts = self.counters.setdefault(name, {})
+            counts[labels] = counts.get(labels, 0) + amount
+
+    def observe_value(self, name, value):
+        with self.lock:
+            self.histograms.setdefault(name, Histogram(HISTOGRAMS[name])).observe(value)
+
+    def gauge(self, name, func):
+        """Report the value func() returns as the gauge name."""
+        self.gauges[name] = func
+
+    def snapshot(self):
+        gauges = {name: func() for name, func in self.gauges.items()}
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'views': {
+                    view_name: {name: histogram.to_dict() for name, histogram in histograms.items()}
+                    for view_name, histograms in self.views.items()
+                },
+                'counters': {
+                    name: [[list(labels), value] for labels, value in counts.items()]
+                    for name, counts in self.counters.items()
+                },
+                'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+                'gauges': gauges,
+            }
+
+    def path(self):
+        # The start time keeps a new process from overwriting the file of an old one with the same pid.
+        return os.path.join(settings.METRICS_DIR, f'requests-{os.getpid()}-{int(self.started * 1000)}.json')
+
+    def write(self):
+        """Write this process's histograms to its file, replacing it whole so readers never see half of one."""
+        self.last_write = time.monotonic()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        prune()
+        path = self.path()
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporary, path)
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.counters = {}
+            self.histograms = {}
+
+
+registry = Registry()
+
+
+@atexit.register
+def write_on_exit():
+    if settings.configured and settings.METRICS_DIR and (registry.views or registry.counters or registry.histograms):
+        registry.write()
+
+
+def is_running(pid):
+    if os.name == 'nt':
+        # os.kill() would end the process rather than check on it.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def snapshot_paths():
+    return glob.glob(os.path.join(settings.METRICS_DIR, 'requests-*.json'))
+
+
+def prune():
+    """Delete the files of processes that have exited and haven't been written for METRICS_RETENTION seconds."""
+    expired = time.time() - settings.METRICS_RETENTION
+    for path in snapshot_paths():
+        try:
+            if os.path.getmtime(path) < expired and not is_running(int(os.path.basename(path).split('-')[1])):
+                os.remove(path)
+        except (OSError, ValueError):
+            # Deleted by another process since it was listed, or not one of ours.
+            continue
+
+
+def merge_snapshots(snapshots):
+    """Add up the metrics of several processes, the gauges of running ones only."""
+    merged = SimpleNamespace(views={}, counters={}, histograms={}, gauges={})
+    for snapshot in snapshots:
+        for view_name, data in snapshot.get('views', {}).items():
+            histograms = merged.views.setdefault(view_name, new_histograms())
+            for name, histogram in data.items():
+                if name in histograms:
+                    histograms[name].merge(Histogram.from_dict(BUCKETS[name], histogram))
+        for name, counts in snapshot.get('counters', {}).items():
+            merged_counts = merged.counters.setdefault(name, {})
+            for labels, value in counts:
+                merged_counts[tuple(labels)] = merged_counts.get(tuple(labels), 0) + value
+        for name, histogram in snapshot.get('histograms', {}).items():
+            if name in HISTOGRAMS:
+                merged.histograms.setdefault(name, Histogram(HISTOGRAMS[name])).merge(
+                    Histogram.from_dict(HISTOGRAMS[name], histogram)
+                )
+        if is_running(snapshot.get('pid', 0)):
+            for name, value in snapshot.get('gauges', {}).items():
+                merged.gauges[name] = merged.gauges.get(name, 0) + value
+    return merged
+
+
+def read_snapshots():
+    """The histograms written by every process, this one's as they are now."""
+    snapshots = [registry.snapshot()]
+    if settings.METRICS_DIR:
+        prune()
+        own_path = registry.path()
+        for path in snapshot_paths():
+            if path == own_path:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Deleted by a reset or pruned since it was listed.
+                continue
+    return snapshots
+
+
+def collect():
+    return merge_snapshots(read_snapshots())
+
+
+def clear():
+    """Forget every process's histograms so far."""
+    registry.reset()
+    if settings.METRICS_DIR:
+        for path in snapshot_paths():
+            os.remove(path)
+
+
+def summarize(views):
+    """The count, mean and rough percentiles of each view's measurements, for people to read."""
+    return {
+        view_name: {
+            'requests': histograms['latency_ms'].count,
+            **{
+                name: {
+                    'mean': round(histogram.mean(), 2),
+                    'p50': histogram.percentile(50),
+                    'p95': histogram.percentile(95),
+                    'p99': histogram.percentile(99),
+                }
+                for name, histogram in histograms.items()
+            },
+        }
+        for view_name, histograms in sorted(views.items())
+    }
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unresolved>'
+
+
+class InstrumentationMiddleware:
+    """Measure each request, as described at the top of this module.
+
+    Place it after WhiteNoise, so that static files aren't counted, and before everything else, so
+    that the other middleware's queries are.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        elapsed = metrics.elapsed()
+        values = {
+            'latency_ms': elapsed * 1000,
+            'queries': metrics.queries,
+            'query_ms': metrics.query_time * 1000,
+            'template_ms': metrics.template_time * 1000,
+        }
+        if not response.streaming:
+            values['response_bytes'] = len(response.content)
+        view_name = get_view_name(request)
+        registry.increment('requests', (view_name, str(response.status_code)))
+        registry.observe(view_name, values)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={metrics.query_time * 1000:.1f};desc="{metrics.queries} queries", '
+                f'template;dur={metrics.template_time * 1000:.1f}, '
+                f'total;dur={elapsed * 1000:.1f}'
+            )
+        return response
@@ -0,0 +1,119 @@
+import json
+import platform
+import sys
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from issues import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a throwaway dataset and time scripted browsing scenarios against it, reporting latency "
+        "percentiles, queries and peak memory for each request. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--projects', type=int, default=20)
+        parser.add_argument('--issues', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--replies', type=int, default=20000)
+        parser.add_argument('--thread', type=int, default=200, help='Comments on the issue the issue-detail scenario views.')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs of each scenario.')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed runs of each scenario before those.')
+        parser.add_argument(
+            '--scenario', action='append', choices=list(benchmark.SCENARIOS),
+            help='A scenario to run; may be given more than once. All of them by default.'
+        )
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help="Serve every request without the cache, to measure the work behind each page."
+        )
+        parser.add_argument(
+            '--session-store', choices=['db', 'cached_db', 'signed_cookies'],
+            help='Keep sessions here rather than where SESSION_STORE says, to compare the queries each costs.'
+        )
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='A JSON file written by an earlier run, to report the changes from.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read {options['compare']}: {e}")
+
+        # Requests are served from a cache of their own, so that pages of the rolled-back data never
+        # reach the real one.
+        cache_backend = 'dummy.DummyCache' if options['no_cache'] else 'locmem.LocMemCache'
+        session_store = options['session_store'] or settings.SESSION_STORE
+        overrides = override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            CACHES={'default': {'BACKEND': f'django.core.cache.backends.{cache_backend}', 'LOCATION': 'benchmark'}},
+            SESSION_STORE=session_store,
+            SESSION_ENGINE=f'django.contrib.sessions.backends.{session_store}',
+        )
+        with overrides, transaction.atomic():
+            results = self.run(options)
+            transaction.set_rollback(True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Wrote the results to {options['output']}.")
+        if baseline is not None:
+            self.report_changes(results, baseline)
+
+    def run(self, options):
+        self.stdout.write('Generating the dataset...')
+        data = benchmark.generate_data(
+            users=options['users'], projects=options['projects'], issues=options['issues'],
+            comments=options['comments'], replies=options['replies'], thread=options['thread'], seed=options['seed']
+        )
+        results = {}
+        for name in options['scenario'] or benchmark.SCENARIOS:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            try:
+                scenario_results = benchmark.run_scenario(name, data, options['repeat'], options['warmup'])
+            except RuntimeError as e:
+                raise CommandError(f'The {name} scenario failed: {e}')
+            for key, result in scenario_results.items():
+                latency = result['latency_ms']
+                self.stdout.write(
+                    f"  {key.split('/', 1)[1]}: p50 {latency['p50']:.2f} ms, p95 {latency['p95']:.2f} ms, "
+                    f"p99 {latency['p99']:.2f} ms, {result['queries']['max']} queries "
+                    f"({result['queries']['session']} for the session), "
+                    f"peak {result['peak_memory_kb']:.0f} KB"
+                )
+            results.update(scenario_results)
+        return {
+            'environment': {
+                'date': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'cache': not options['no_cache'],
+                'session_store': settings.SESSION_STORE,
+                'argv': sys.argv[1:],
+            },
+            'dataset': data.counts,
+            'repeat': options['repeat'],
+            'warmup': options['warmup'],
+            'requests': results,
+        }
+
+    def report_changes(self, results, baseline):
+        self.stdout.write(self.style.MIGRATE_HEADING('Changes from the baseline'))
+        for key, metric, before, after in benchmark.compare(results, baseline):
+            change = f'{(after - before) / before:+.0%}' if before else 'new'
+            style = self.style.ERROR if before and after > before * 1.1 else self.style.SUCCESS
+            self.stdout.write(style(f'  {key} {metric}: {before} -> {after} ({change})'))
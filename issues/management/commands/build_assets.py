@@ -0,0 +1,42 @@
+from urllib.error import URLError
+
+from django.core.management.base import BaseCommand, CommandError
+
+from issues import bundles
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the bundles of scripts and stylesheets pages load, into static/bundles/. Run it before '
+        'collectstatic, which fingerprints and compresses them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fetch', action='store_true',
+            help='Download any vendored libraries missing from static/vendor/ first, checking their integrity hashes.'
+        )
+        parser.add_argument('--refetch', action='store_true', help='Download every vendored library again.')
+
+    def handle(self, *args, **options):
+        if bundles.rjsmin is None:
+            self.stdout.write(self.style.WARNING('rjsmin and rcssmin are not installed, so the bundles will not be minified.'))
+        if options['fetch'] or options['refetch']:
+            try:
+                for name in bundles.fetch_vendor_files(refetch=options['refetch']):
+                    self.stdout.write(f'Fetched {name}.')
+            except (URLError, ValueError) as e:
+                raise CommandError(f"Couldn't fetch the vendored files: {e}")
+        for name in bundles.BUNDLES:
+            cdn_sources = bundles.cdn_sources(name)
+            if cdn_sources:
+                # Pages load the bundle's sources instead, these from their CDN.
+                self.stdout.write(self.style.WARNING(
+                    f"Not building {name}: {', '.join(cdn_sources)} can't be bundled until vendored with a pinned hash."
+                ))
+                continue
+            try:
+                path = bundles.build(name)
+            except ValueError as e:
+                raise CommandError(f"Couldn't build {name}: {e}")
+            self.stdout.write(f'Built {path}.')
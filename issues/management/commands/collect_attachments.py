@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from issues.attachments import collect_garbage, recount
+
+
+class Command(BaseCommand):
+    help = 'Delete attachments no issue uses any more, along with their files and resized copies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='Recount the issues using each attachment first, in case the counts have drifted.'
+        )
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            recount()
+        self.stdout.write(f'Deleted {collect_garbage()} unused attachments.')
@@ -0,0 +1,132 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from issues.models import (
+    Project,
+    Issue,
+    Comment,
+    Reply
+)
+
+BATCH_SIZE = 5000
+NUM_PROJECTS = 10
+NUM_USERS = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a throwaway dataset and report the plan and latency of the tracker's hot queries, "
+        "with and without the indexes added for them. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--issues', type=int, default=1000000, help='Number of issues to generate.')
+        parser.add_argument('--comments', type=int, default=2, help='Comments per issue.')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs of each query to time.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        with transaction.atomic():
+            self.generate(options['issues'], options['comments'])
+            self.stdout.write(self.style.MIGRATE_HEADING('With indexes'))
+            self.report(options['repeat'], 'with indexes')
+
+            if connection.features.can_rollback_ddl:
+                self.drop_indexes()
+                self.stdout.write(self.style.MIGRATE_HEADING('Without indexes'))
+                self.report(options['repeat'], 'without indexes')
+            else:
+                self.stdout.write("This database can't roll back DDL, so the indexes weren't dropped for comparison.")
+
+            transaction.set_rollback(True)
+
+    def generate(self, num_issues, comments_per_issue):
+        self.stdout.write(f"Generating {num_issues} issues with {comments_per_issue} comments each...")
+        # A suffix of its own keeps the run's users and projects (and their slugs) from clashing with existing ones.
+        suffix = uuid.uuid4().hex[:8]
+        users = User.objects.bulk_create([User(username=f'explain-{suffix}-{i}') for i in range(NUM_USERS)])
+        projects = [
+            Project.objects.create(title=f'Explain Project {suffix} {i}', description='Generated.')
+            for i in range(NUM_PROJECTS)
+        ]
+        if not users[0].pk:
+            # Backends that don't return primary keys from bulk_create.
+            users = list(User.objects.filter(username__startswith=f'explain-{suffix}-'))
+
+        next_nums = {project.id: 1 for project in projects}
+        for start in range(0, num_issues, BATCH_SIZE):
+            batch = []
+            for _ in range(min(BATCH_SIZE, num_issues - start)):
+                project = random.choice(projects)
+                batch.append(Issue(
+                    title='Generated issue',
+                    description='Generated.',
+                    num=next_nums[project.id],
+                    submitter=random.choice(users),
+                    assignee=random.choice(users),
+                    project=project,
+                    priority=random.randint(1, 5),
+                    # Most issues in an established tracker are closed.
+                    status=Issue.STATUS_OPEN if random.random() < 0.1 else Issue.STATUS_CLOSED
+                ))
+                next_nums[project.id] += 1
+            Issue.objects.bulk_create(batch)
+
+        if comments_per_issue:
+            issue_ids = Issue.objects.filter(project__in=projects).values_list('id', flat=True).iterator()
+            batch = []
+            for issue_id in issue_ids:
+                for _ in range(comments_per_issue):
+                    batch.append(Comment(text='Generated.', author=random.choice(users), issue_id=issue_id))
+                if len(batch) >= BATCH_SIZE:
+                    Comment.objects.bulk_create(batch)
+                    batch = []
+            Comment.objects.bulk_create(batch)
+
+        self.project = projects[0]
+        self.user = users[0]
+        self.issue = Issue.objects.filter(project=self.project).order_by('num').first()
+        self.num = Issue.objects.filter(project=self.project).order_by('-num').values_list('num', flat=True).first() // 2
+
+    def get_queries(self):
+        comments = Comment.objects.filter(issue=self.issue)
+        return [
+            ('Issue by (project, num)', Issue.objects.filter(project=self.project, num=self.num)),
+            ('Open issues in a project', Issue.objects.filter(project=self.project, status=Issue.STATUS_OPEN).values('id')),
+            ('Open issues by priority', Issue.objects.filter(project=self.project, status=Issue.STATUS_OPEN).order_by('priority', 'date_created', 'id')[:25]),
+            ("A user's open issues", Issue.objects.filter(assignee=self.user, status=Issue.STATUS_OPEN).values('id')),
+            ('Comment thread page', comments.order_by('-date_created', '-id')[:25]),
+            ('Replies for a thread page', Reply.objects.filter(comment__in=list(comments.values_list('id', flat=True)[:25])).order_by('date_created')),
+        ]
+
+    def explain(self, queryset, label):
+        # The label keeps the statement text unique to each pass. sqlite3 caches prepared statements by
+        # their text, and a cached EXPLAIN goes on describing the plan from before the indexes were dropped.
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql} -- {label}', params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def report(self, repeat, label):
+        for name, queryset in self.get_queries():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(self.style.SUCCESS(f"{name}: median {statistics.median(timings):.2f} ms, max {max(timings):.2f} ms"))
+            self.stdout.write(self.explain(queryset, label))
+
+    def drop_indexes(self):
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for model in (Issue, Comment, Reply):
+                for index in model._meta.indexes:
+                    cursor.execute(str(index.remove_sql(model, editor)))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from issues.models import Attachment
+from issues.thumbnails import process_attachment
+
+
+class Command(BaseCommand):
+    help = "Make the resized copies of every attachment that doesn't have them yet."
+
+    def handle(self, *args, **options):
+        names = list(Attachment.objects.filter(has_derivatives=False).values_list('file', flat=True))
+        for name in names:
+            process_attachment(name)
+            self.stdout.write(f'Processed {name}')
+        self.stdout.write(f'Processed {len(names)} attachments.')
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired sessions from the session table, a batch at a time so that logins are never '
+        'held up behind one long delete. Run it daily.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Delete every stored session, logging everyone out, e.g. after switching SESSION_STORE to signed_cookies.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        sessions = Session.objects.all()
+        if not options['all']:
+            sessions = sessions.filter(expire_date__lt=timezone.now())
+        deleted = 0
+        while True:
+            keys = list(sessions.values_list('session_key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            Session.objects.filter(session_key__in=keys).delete()
+            if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.cached_db':
+                # Expired sessions drop out of the cache by themselves, but live ones would outlast --all.
+                caches[settings.SESSION_CACHE_ALIAS].delete_many([KEY_PREFIX + key for key in keys])
+            deleted += len(keys)
+        self.stdout.write(f'Deleted {deleted} sessions.')
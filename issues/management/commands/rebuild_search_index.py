@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from issues.models import SearchDocument
+from issues.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search index from every issue, comment and reply, e.g. after loading a fixture.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_index()
+        self.stdout.write(f'Indexed {SearchDocument.objects.count()} documents.')
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from issues import instrumentation
+
+COLUMNS = (
+    ('latency_ms', 'latency ms'),
+    ('queries', 'queries'),
+    ('query_ms', 'query ms'),
+    ('template_ms', 'template ms'),
+    ('response_bytes', 'bytes'),
+)
+
+
+def format_bound(value):
+    return '-' if value is None else f'{value:g}'
+
+
+class Command(BaseCommand):
+    help = (
+        "Report each view's request latency, queries, template time and response size, added up across "
+        "the processes writing to METRICS_DIR. Percentiles are the upper bounds of histogram buckets."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+        parser.add_argument('--reset', action='store_true', help='Delete the metrics written so far afterwards.')
+
+    def handle(self, *args, **options):
+        summary = instrumentation.summarize(instrumentation.collect().views)
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+        elif not summary:
+            self.stdout.write('No requests have been measured yet.')
+        else:
+            for view_name, metrics in summary.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{view_name} ({metrics['requests']} requests)"))
+                for name, label in COLUMNS:
+                    values = metrics[name]
+                    self.stdout.write(
+                        f"  {label}: mean {values['mean']:g}, p50 <= {format_bound(values['p50'])}, "
+                        f"p95 <= {format_bound(values['p95'])}, p99 <= {format_bound(values['p99'])}"
+                    )
+        if options['reset']:
+            instrumentation.clear()
@@ -0,0 +1,94 @@
+import hmac
+
+from django.conf import settings
+
+from .instrumentation import COUNTERS, HISTOGRAMS, INF, Histogram
+
+# The instrumentation's metrics, added up across processes, in Prometheus's text format. Times are
+# turned from milliseconds into seconds, as Prometheus expects.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+VIEW_HISTOGRAMS = {
+    'latency_ms': ('tracker_request_duration_seconds', 'Time taken to respond to requests, by view.', 0.001),
+    'queries': ('tracker_request_db_queries', 'Database queries made by each request, by view.', 1),
+    'query_ms': ('tracker_request_db_duration_seconds', 'Time each request spent on database queries, by view.', 0.001),
+    'template_ms': ('tracker_request_template_duration_seconds', 'Time each request spent rendering templates, by view.', 0.001),
+    'response_bytes': ('tracker_response_size_bytes', 'Size of non-streaming responses, by view.', 1),
+}
+COUNTER_NAMES = {
+    'requests': ('tracker_requests_total', 'Requests answered, by view and status code.'),
+    'cache_lookups': ('tracker_cache_lookups_total', 'Cached pages and querysets looked up, by name and whether they were found.'),
+}
+
+
+def is_authorized(request):
+    """Scrapers send METRICS_TOKEN as a bearer token; without one set, none are let in unless METRICS_PUBLIC is on."""
+    # Not even local ones: behind a reverse proxy on the same host, every request looks local.
+    if settings.METRICS_TOKEN:
+        return hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {settings.METRICS_TOKEN}')
+    return settings.METRICS_PUBLIC
+
+
+def format_value(value):
+    if value == INF:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def header(name, kind, help_text):
+    return [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+
+
+def histogram_lines(name, histogram, labels=None, scale=1):
+    labels = labels or {}
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        le = format_value(bound if bound == INF else round(bound * scale, 6))
+        lines.append(f'{name}_bucket{format_labels({**labels, "le": le})} {cumulative}')
+    lines.append(f'{name}_sum{format_labels(labels)} {format_value(round(histogram.total * scale, 6))}')
+    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+    return lines
+
+
+def render(metrics):
+    """The text exposition of metrics, as returned by instrumentation.collect()."""
+    lines = []
+    for key, (name, help_text, scale) in VIEW_HISTOGRAMS.items():
+        lines += header(name, 'histogram', help_text)
+        for view_name, histograms in sorted(metrics.views.items()):
+            lines += histogram_lines(name, histograms[key], {'view': view_name}, scale)
+
+    for key, (name, help_text) in COUNTER_NAMES.items():
+        lines += header(name, 'counter', help_text)
+        label_names = COUNTERS[key]
+        for labels, value in sorted(metrics.counters.get(key, {}).items()):
+            lines.append(f'{name}{format_labels(dict(zip(label_names, labels)))} {format_value(value)}')
+
+    lines += header('tracker_cache_hit_ratio', 'gauge', 'Share of cache lookups that found what they looked for, by name.')
+    lookups = {}
+    for (cache_name, result), value in metrics.counters.get('cache_lookups', {}).items():
+        lookups.setdefault(cache_name, {'hit': 0, 'miss': 0})[result] += value
+    for cache_name, counts in sorted(lookups.items()):
+        ratio = counts['hit'] / (counts['hit'] + counts['miss'])
+        lines.append(f'tracker_cache_hit_ratio{format_labels({"name": cache_name})} {format_value(round(ratio, 6))}')
+
+    lines += header('tracker_attachment_upload_size_bytes', 'histogram', 'Size of the files attached to issues.')
+    uploads = metrics.histograms.get('upload_bytes', Histogram(HISTOGRAMS['upload_bytes']))
+    lines += histogram_lines('tracker_attachment_upload_size_bytes', uploads)
+
+    lines += header('tracker_attachment_queue_depth', 'gauge', 'Attachments waiting for or having their thumbnails made.')
+    lines.append(f'tracker_attachment_queue_depth {format_value(metrics.gauges.get("attachment_queue", 0))}')
+    return '\n'.join(lines) + '\n'
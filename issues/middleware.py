@@ -0,0 +1,56 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.utils.functional import SimpleLazyObject
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .permissions import UserPermissions
+
+
+class PermissionsMiddleware:
+    """Attach a lazily built UserPermissions to each request as request.permissions.
+
+    Must come after AuthenticationMiddleware, since it reads request.user. It does no I/O itself, so
+    it runs sync or async to suit the rest of the chain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        request.permissions = SimpleLazyObject(lambda: UserPermissions(request.user))
+        # Async, this returns the coroutine for the caller to await.
+        return self.get_response(request)
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoiseMiddleware that can also run in an async chain.
+
+    WhiteNoise itself is sync only, which would make Django run the whole chain below it in one
+    thread under ASGI. Here only static files are served from a thread; other requests pass straight
+    through.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # Without autorefresh, the files are all known up front, so the lookup needs no I/O.
+        if self.autorefresh or request.path_info in self.files:
+            response = await sync_to_async(self.process_request, thread_sensitive=False)(request)
+            if response is not None:
+                return response
+        return await self.get_response(request)
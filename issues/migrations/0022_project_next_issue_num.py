@@ -0,0 +1,41 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:27
+
+from django.db import migrations, models
+
+
+def set_next_issue_num(apps, schema_editor):
+    """Seed each project's counter, renumbering any issues that were given a duplicate number."""
+    Project = apps.get_model('issues', 'Project')
+    Issue = apps.get_model('issues', 'Issue')
+    for project in Project.objects.all():
+        issues = Issue.objects.filter(project=project).order_by('num', 'id')
+        next_num = max([issue.num for issue in issues], default=0) + 1
+        seen = set()
+        for issue in issues:
+            if issue.num in seen:
+                issue.num = next_num
+                next_num += 1
+                issue.save(update_fields=['num'])
+            seen.add(issue.num)
+        project.next_issue_num = next_num
+        project.save(update_fields=['next_issue_num'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issues', '0021_auto_20201111_1500'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='next_issue_num',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(set_next_issue_num, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='issue',
+            constraint=models.UniqueConstraint(fields=('project', 'num'), name='unique_project_issue_num'),
+        ),
+    ]
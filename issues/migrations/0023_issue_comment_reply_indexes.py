@@ -0,0 +1,33 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issues', '0022_project_next_issue_num'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['issue', 'date_created'], name='comment_issue_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['project', 'status'], name='issue_project_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['assignee', 'status'], name='issue_assignee_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(status='open'), fields=['project', 'priority', 'date_created'], name='issue_open_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reply',
+            index=models.Index(fields=['comment', 'date_created'], name='reply_comment_created_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from issues import search
+
+
+def create_fulltext_index(apps, schema_editor):
+    search.create_fulltext_index(schema_editor)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    search.drop_fulltext_index(schema_editor)
+
+
+def index_existing(apps, schema_editor):
+    search.rebuild_index(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issues', '0023_issue_comment_reply_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('issue', 'Issue'), ('comment', 'Comment'), ('reply', 'Reply')], max_length=7)),
+                ('body', models.TextField()),
+                ('comment', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='issues.comment')),
+                ('issue', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='issues.issue')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='issues.project')),
+                ('reply', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='issues.reply')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=40)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='issues.searchdocument')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'document'), name='unique_search_term'),
+        ),
+        migrations.AddIndex(
+            model_name='searchdocument',
+            index=models.Index(fields=['issue', 'kind'], name='searchdocument_issue_kind_idx'),
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
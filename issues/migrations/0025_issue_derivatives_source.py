@@ -0,0 +1,18 @@
+# Generated by Django 3.1.1 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issues', '0024_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='derivatives_source',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
@@ -0,0 +1,139 @@
+# Generated by Django 3.1.1 on 2026-10-18 14:10
+
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def hash_stored(storage, name):
+    # A copy of issues.attachments.hash_stored() as it was, so later changes to it can't change this migration.
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as stored:
+        for chunk in stored.chunks(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def delete_stored(storage, name):
+    """Delete a stored file and the thumbnails made of it, as issues.thumbnails named them then."""
+    derivatives = f'derivatives/{hashlib.sha256(name.encode()).hexdigest()[:32]}'
+    try:
+        derivative_names = storage.listdir(derivatives)[1]
+    except (FileNotFoundError, OSError):
+        derivative_names = []
+    for derivative_name in derivative_names:
+        storage.delete(f'{derivatives}/{derivative_name}')
+    storage.delete(name)
+
+
+def copy_attachments(apps, schema_editor):
+    """Make an Attachment of each issue's file, left where it's stored.
+
+    Files that are missing are logged and dropped. A file stored twice under different names is
+    kept once, under the first of them, and the other copy deleted once the migration commits.
+    """
+    Issue = apps.get_model('issues', 'Issue')
+    Attachment = apps.get_model('issues', 'Attachment')
+    IssueAttachment = apps.get_model('issues', 'IssueAttachment')
+    storage = Issue._meta.get_field('attachment').storage
+    by_name = {}
+    for issue in Issue.objects.exclude(attachment='').only('id', 'attachment', 'derivatives_source').iterator():
+        name = issue.attachment.name
+        if name not in by_name:
+            try:
+                sha256 = hash_stored(storage, name)
+                size = storage.size(name)
+            except (FileNotFoundError, OSError):
+                logger.warning('Issue %s attachment %s is missing from storage and was dropped.', issue.id, name)
+                by_name[name] = None
+                continue
+            by_name[name], created = Attachment.objects.get_or_create(sha256=sha256, defaults={
+                'file': name, 'size': size, 'has_derivatives': issue.derivatives_source == name
+            })
+            if not created:
+                transaction.on_commit(lambda name=name: delete_stored(storage, name), using=schema_editor.connection.alias)
+        attachment = by_name[name]
+        if attachment is not None:
+            IssueAttachment.objects.get_or_create(
+                issue_id=issue.id, attachment=attachment, defaults={'name': name.rsplit('/', 1)[-1]}
+            )
+    for attachment in Attachment.objects.all():
+        attachment.ref_count = attachment.uses.count()
+        attachment.save(update_fields=['ref_count'])
+
+
+def restore_attachments(apps, schema_editor):
+    """Put each issue's first attachment back in its attachment field, which can only hold one.
+
+    The files of its other attachments are left in storage, and logged.
+    """
+    Issue = apps.get_model('issues', 'Issue')
+    IssueAttachment = apps.get_model('issues', 'IssueAttachment')
+    restored = set()
+    uses = IssueAttachment.objects.select_related('attachment').order_by('issue_id', 'date_added', 'id')
+    for use in uses.iterator():
+        name = use.attachment.file.name
+        if use.issue_id in restored:
+            logger.warning('Issue %s attachment %s has no field to go back to; its file is left in storage.', use.issue_id, name)
+            continue
+        restored.add(use.issue_id)
+        Issue.objects.filter(id=use.issue_id).update(
+            attachment=name, derivatives_source=name if use.attachment.has_derivatives else ''
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issues', '0025_issue_derivatives_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Attachment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('size', models.PositiveBigIntegerField()),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('has_derivatives', models.BooleanField(default=False)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IssueAttachment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('attachment', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='uses', to='issues.attachment')),
+                ('issue', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='issue_attachments', to='issues.issue')),
+            ],
+            options={
+                'ordering': ['date_added', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='attachments',
+            field=models.ManyToManyField(related_name='issues', through='issues.IssueAttachment', to='issues.Attachment'),
+        ),
+        migrations.AddConstraint(
+            model_name='issueattachment',
+            constraint=models.UniqueConstraint(fields=('issue', 'attachment'), name='unique_issue_attachment'),
+        ),
+        migrations.RunPython(copy_attachments, restore_attachments),
+        migrations.RemoveField(
+            model_name='issue',
+            name='attachment',
+        ),
+        migrations.RemoveField(
+            model_name='issue',
+            name='derivatives_source',
+        ),
+    ]
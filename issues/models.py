@@ -1,15 +1,18 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.template.defaultfilters import slugify
 from django.utils import timezone
 
 def get_issue_num(project):
-    """Get the most recent issue number of a project and return an incremented value."""
-    last_project_issue = Issue.objects.filter(project=project.id).order_by('id').last()
-    if not last_project_issue:
-        return 1
-    else:
-        return last_project_issue.num + 1
+    """Reserve the next issue number of a project and return it.
+
+    The project row's counter is bumped with a single UPDATE, which holds the row lock until the
+    surrounding transaction ends, so concurrent issue creation in the same project can't hand out
+    the same number twice. Must be called inside a transaction.
+    """
+    Project.objects.filter(id=project.id).update(next_issue_num=F('next_issue_num') + 1)
+    return Project.objects.values_list('next_issue_num', flat=True).get(id=project.id) - 1
 
 
 class Project(models.Model):
@@ -22,6 +25,7 @@ class Project(models.Model):
 
     description = models.TextField()
     slug = models.SlugField(max_length=100, unique=True)
+    next_issue_num = models.PositiveIntegerField(default=1, editable=False)
     assigned_users = models.ManyToManyField(User, related_name='assigned_projects')
 
     def __str__(self):
@@ -110,7 +114,24 @@ class Issue(models.Model):
     )
 
     tag = models.CharField(max_length=40, blank=True, null=True)
-    attachment = models.ImageField(upload_to='img', blank=True, null=True)
+    attachments = models.ManyToManyField('Attachment', through='IssueAttachment', related_name='issues')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'num'], name='unique_project_issue_num'),
+        ]
+        # (project, num) lookups are served by the unique constraint's index.
+        indexes = [
+            models.Index(fields=['project', 'status'], name='issue_project_status_idx'),
+            models.Index(fields=['assignee', 'status'], name='issue_assignee_status_idx'),
+            # Open issues in priority order. Where the backend supports partial indexes, closed issues
+            # (most of an established project) are left out of it.
+            models.Index(
+                fields=['project', 'priority', 'date_created'],
+                name='issue_open_priority_idx',
+                condition=models.Q(status='open')
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -118,9 +139,11 @@ class Issue(models.Model):
     def save(self, *args, **kwargs):
         # Pass the project object to get_issue_num to generate the newest issue number for the project.
         # When editing an issue, the num field already has a value, so don't increment.
-        if not self.num:
-            self.num = get_issue_num(self.project)
-        super(Issue, self).save(*args, **kwargs)
+        # The number is reserved in the same transaction as the insert, so a failed save doesn't use it up.
+        with transaction.atomic():
+            if not self.num:
+                self.num = get_issue_num(self.project)
+            super(Issue, self).save(*args, **kwargs)
 
 
 class Comment(models.Model):
@@ -141,6 +164,11 @@ class Comment(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['issue', 'date_created'], name='comment_issue_created_idx'),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -154,5 +182,95 @@ class Reply(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['comment', 'date_created'], name='reply_comment_created_idx'),
+        ]
+
     def __str__(self):
         return self.text
+
+
+class Attachment(models.Model):
+    """A stored file, kept once however many issues it's attached to (see issues/attachments.py).
+
+    ref_count is the number of IssueAttachments using it; once that drops to zero, the file is deleted.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    # Whether the resized copies shown on the issue page have been made (see issues/thumbnails.py).
+    has_derivatives = models.BooleanField(default=False)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.file.name
+
+
+class IssueAttachment(models.Model):
+    """An attachment of an issue, under the name it was uploaded with."""
+
+    issue = models.ForeignKey(Issue, related_name='issue_attachments', on_delete=models.CASCADE)
+    attachment = models.ForeignKey(Attachment, related_name='uses', on_delete=models.PROTECT)
+    name = models.CharField(max_length=255)
+    date_added = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['date_added', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['issue', 'attachment'], name='unique_issue_attachment'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class SearchDocument(models.Model):
+    """The searchable text of an issue, comment or reply, kept up to date by issues/signals.py.
+
+    Each database searches it its own way (see issues/search.py). On SQLite the full-text index is
+    maintained by triggers on this table, which are lost if a migration has to rebuild the table;
+    such a migration should recreate them with search.create_fulltext_index().
+    """
+
+    KIND_ISSUE = 'issue'
+    KIND_COMMENT = 'comment'
+    KIND_REPLY = 'reply'
+
+    KIND_CHOICES = (
+        (KIND_ISSUE, 'Issue'),
+        (KIND_COMMENT, 'Comment'),
+        (KIND_REPLY, 'Reply'),
+    )
+
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES)
+    # Denormalized so that results can be limited to the user's projects without any joins.
+    project = models.ForeignKey(Project, related_name='+', on_delete=models.CASCADE)
+    issue = models.ForeignKey(Issue, related_name='+', on_delete=models.CASCADE)
+    comment = models.OneToOneField(Comment, related_name='+', null=True, on_delete=models.CASCADE)
+    reply = models.OneToOneField(Reply, related_name='+', null=True, on_delete=models.CASCADE)
+    body = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['issue', 'kind'], name='searchdocument_issue_kind_idx'),
+        ]
+
+    def __str__(self):
+        return self.body[:50]
+
+
+class SearchTerm(models.Model):
+    """How often a word appears in a SearchDocument, for databases without full-text search."""
+
+    term = models.CharField(max_length=40)
+    document = models.ForeignKey(SearchDocument, related_name='terms', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'document'], name='unique_search_term'),
+        ]
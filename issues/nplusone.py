@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import os
+import re
+import sys
+import threading
+import unittest
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.base import Node
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+logger = logging.getLogger(__name__)
+
+# Finds N+1 queries: the same query made over and over from the same place, typically once for
+# each row of a list, as a template follows a relation that wasn't loaded with it. While a Detector
+# is active, each SELECT is grouped by its SQL, with parameters and literals taken out, and the
+# place it was made from: the template line being rendered, if any, and the innermost line of the
+# tracker's own code. A group of more than NPLUSONE_THRESHOLD queries is a repetition.
+#
+# NPLUSONE_DETECTION turns detection on for every request, and for every test run by
+# NPlusOneTestRunner: 'warn' logs repetitions, and 'raise' fails the request or test that made them.
+ACTIONS = ('warn', 'raise')
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'%s(?:\s*,\s*%s)+')
+WHITESPACE = re.compile(r'\s+')
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Middleware only passes requests on, so its lines would be the place every template query came
+# from. Queries made by test code itself are the test's business, not the tracker's.
+IGNORED_PATHS = (
+    os.path.join('issues', 'instrumentation.py'),
+    os.path.join('issues', 'middleware.py'),
+    os.path.join('issues', 'nplusone.py'),
+    'manage.py',
+    'tests' + os.sep,
+)
+
+current_detector = ContextVar('current_detector', default=None)
+
+
+class NPlusOneError(AssertionError):
+
+    def __init__(self, repetitions):
+        self.repetitions = repetitions
+        super().__init__('Repeated queries:\n' + '\n'.join(f'  {repetition}' for repetition in repetitions))
+
+
+def normalize(sql):
+    """The query's SQL with its literals taken out, and IN lists of any length made the same."""
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = PLACEHOLDER_LIST.sub('%s, ...', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def is_own_code(filename):
+    if not filename.startswith(PROJECT_ROOT + os.sep) or 'site-packages' in filename:
+        return False
+    return not os.path.relpath(filename, PROJECT_ROOT).startswith(IGNORED_PATHS)
+
+
+def call_site(frame):
+    """The template line and line of the tracker's code a query was made from, either of them None if there isn't one."""
+    template = code = None
+    while frame is not None and (template is None or code is None):
+        node = frame.f_locals.get('self') if template is None else None
+        # type() rather than isinstance(), which would evaluate lazy objects, and their queries.
+        if issubclass(type(node), Node) and getattr(node, 'origin', None) is not None and hasattr(node, 'token'):
+            template = f'{node.origin.template_name or node.origin.name}:{node.token.lineno}'
+        if code is None and is_own_code(frame.f_code.co_filename):
+            code = f'{os.path.relpath(frame.f_code.co_filename, PROJECT_ROOT)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return template, code
+
+
+class Repetition:
+    """A query made count times from the same place."""
+
+    def __init__(self, sql, template, code):
+        self.sql = sql
+        self.template = template
+        self.code = code
+        self.count = 0
+
+    def __str__(self):
+        places = [f'template {self.template}'] if self.template else []
+        places += [self.code] if self.code else []
+        sql = self.sql if len(self.sql) <= 200 else self.sql[:200] + '...'
+        return f'{self.count} queries from {", ".join(places)}: {sql}'
+
+
+class Detector:
+    """Group the queries made while active, in this context, to find repetitions.
+
+    A context manager, for use around code under test:
+
+        with Detector(threshold=2) as detector:
+            self.client.get(url)
+        self.assertEqual(detector.repetitions(), [])
+
+    Queries are grouped by the innermost active detector. Each request has its own, which hands the
+    repetitions it finds to the detector it was made in, if any, such as the test's; a test making
+    several requests isn't taken for one making the same query several times.
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = settings.NPLUSONE_THRESHOLD if threshold is None else threshold
+        self.lock = threading.Lock()
+        self.groups = {}
+        self.found = []
+        self.parent = None
+        self.token = None
+
+    def __enter__(self):
+        self.parent = current_detector.get()
+        self.token = current_detector.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        current_detector.reset(self.token)
+
+    def adopt(self, repetitions):
+        """Take on repetitions found by a nested detector."""
+        with self.lock:
+            self.found += repetitions
+
+    def record(self, sql, frame):
+        if not sql.lstrip()[:6].upper() == 'SELECT':
+            return
+        template, code = call_site(frame)
+        if template is None and code is None:
+            return
+        key = (normalize(sql), template, code)
+        with self.lock:
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = Repetition(*key)
+            group.count += 1
+
+    def repetitions(self):
+        """The groups of more than threshold queries, and those handed over by nested detectors, largest first."""
+        with self.lock:
+            groups = [group for group in self.groups.values() if group.count > self.threshold] + self.found
+        return sorted(groups, key=lambda group: -group.count)
+
+    def report(self, action, context):
+        """Log the repetitions found, or raise NPlusOneError if there are any and action is 'raise'."""
+        repetitions = self.repetitions()
+        if repetitions and action == 'raise':
+            raise NPlusOneError(repetitions)
+        for repetition in repetitions:
+            logger.warning('%s made %s', context, repetition)
+
+
+def record_query(execute, sql, params, many, context):
+    detector = current_detector.get()
+    if detector is not None and not many:
+        detector.record(sql, sys._getframe(1))
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class NPlusOneMiddleware:
+    """Look for repetitions in each request, if NPLUSONE_DETECTION is on."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.NPLUSONE_DETECTION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with Detector() as detector:
+            response = self.get_response(request)
+        self.report(request, detector)
+        return response
+
+    async def __acall__(self, request):
+        with Detector() as detector:
+            response = await self.get_response(request)
+        self.report(request, detector)
+        return response
+
+    @staticmethod
+    def report(request, detector):
+        # Within a test, it's the test's detector that reports.
+        if detector.parent is not None:
+            detector.parent.adopt(detector.repetitions())
+        else:
+            detector.report(settings.NPLUSONE_DETECTION, f'{request.method} {request.path}')
+
+
+class TestDetector(Detector):
+    """A test's detector, which reports the repetitions of its requests, leaving out the queries the test makes itself."""
+
+    def record(self, sql, frame):
+        pass
+
+
+class NPlusOneTestResult(unittest.TextTestResult):
+    """Look for repetitions in each test's requests, failing the tests that make any if action is 'raise'."""
+    action = 'warn'
+
+    def startTest(self, test):
+        self.detector = TestDetector().__enter__()
+        super().startTest(test)
+
+    def addSuccess(self, test):
+        try:
+            self.detector.report(self.action, test.id())
+        except NPlusOneError:
+            self.addFailure(test, sys.exc_info())
+        else:
+            super().addSuccess(test)
+
+    def stopTest(self, test):
+        self.detector.__exit__(None, None, None)
+        super().stopTest(test)
+
+
+class NPlusOneTestRunner(DiscoverRunner):
+    """Django's test runner, looking for repetitions in each test if NPLUSONE_DETECTION or --nplusone is on."""
+
+    def __init__(self, nplusone=None, nplusone_threshold=None, **kwargs):
+        super().__init__(**kwargs)
+        self.nplusone = settings.NPLUSONE_DETECTION if nplusone is None else nplusone
+        self.nplusone_settings = override_settings(
+            NPLUSONE_DETECTION=self.nplusone,
+            NPLUSONE_THRESHOLD=settings.NPLUSONE_THRESHOLD if nplusone_threshold is None else nplusone_threshold,
+        )
+        if self.nplusone:
+            # Tests run in other processes would make their queries out of the detector's sight.
+            self.parallel = 1
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--nplusone', choices=ACTIONS,
+            help='Warn about, or fail, tests that repeat a query more than NPLUSONE_THRESHOLD times from one place.',
+        )
+        parser.add_argument('--nplusone-threshold', type=int, help='Overrides NPLUSONE_THRESHOLD.')
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # The middleware groups each request's queries on its own.
+        self.nplusone_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.nplusone_settings.disable()
+        super().teardown_test_environment(**kwargs)
+
+    def get_resultclass(self):
+        if not self.nplusone:
+            return super().get_resultclass()
+        return type('NPlusOneTestResult', (NPlusOneTestResult,), {'action': self.nplusone})
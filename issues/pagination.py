@@ -0,0 +1,153 @@
+import datetime
+
+from django.core import signing
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+
+CURSOR_SALT = 'issues.pagination'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def get_field(model, path):
+    """Return the model field at the end of a lookup path such as 'submitter__username'."""
+    field = None
+    for name in path.split(LOOKUP_SEP):
+        field = model._meta.get_field(name)
+        if field.is_relation:
+            model = field.related_model
+    return field
+
+
+def is_nullable(model, path):
+    """Return True if any step of a lookup path can be null."""
+    for name in path.split(LOOKUP_SEP):
+        field = model._meta.get_field(name)
+        if field.null:
+            return True
+        if field.is_relation:
+            model = field.related_model
+    return False
+
+
+def get_value(obj, path):
+    for name in path.split(LOOKUP_SEP):
+        obj = getattr(obj, name)
+    return obj
+
+
+def to_json(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator, with cursors for the pages on either side of it."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """Page through a queryset by filtering on the sort key of a row, rather than by offset.
+
+    Page N costs the same as page 1, however deep into the results it is. 'ordering' is a list
+    of field names as passed to order_by(). None of the fields may be nullable, and the primary key
+    is appended to make each row's position unique. Cursors are opaque signed strings, and are
+    rejected if they were made for a different ordering.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        model = queryset.model
+        pk_name = model._meta.pk.name
+        ordering = [
+            name.replace('pk', pk_name) if name.lstrip('-') == 'pk' else name
+            for name in ordering
+        ]
+        if ordering[-1].lstrip('-') != pk_name:
+            ordering.append(pk_name)
+        for name in ordering:
+            if is_nullable(model, name.lstrip('-')):
+                raise ValueError(f"Keyset pagination can't order on nullable field '{name}'.")
+        self.queryset = queryset
+        self.ordering = ordering
+        self.fields = [name.lstrip('-') for name in ordering]
+        self.per_page = per_page
+
+    def make_cursor(self, obj, direction):
+        values = [to_json(get_value(obj, name)) for name in self.fields]
+        return signing.dumps({'o': self.ordering, 'v': values, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+    def read_cursor(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            raise InvalidCursor('The cursor is not valid.')
+        if data.get('o') != self.ordering or data.get('d') not in ('next', 'previous'):
+            raise InvalidCursor('The cursor was made for a different ordering.')
+        values = [
+            get_field(self.queryset.model, name).to_python(value)
+            for name, value in zip(self.fields, data['v'])
+        ]
+        return values, data['d']
+
+    def keyset_filter(self, values, reverse):
+        """Match the rows that come after 'values' in the ordering, or before them if reversed."""
+        query = Q()
+        for i, name in enumerate(self.ordering):
+            descending = name.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            condition = Q(**{f'{self.fields[i]}__{lookup}': values[i]})
+            for prior_field, prior_value in zip(self.fields[:i], values[:i]):
+                condition &= Q(**{prior_field: prior_value})
+            query |= condition
+        return query
+
+    def get_page(self, cursor=None):
+        """Return the first page, or the page a cursor points to. Raises InvalidCursor."""
+        if not cursor:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            next_cursor = self.make_cursor(rows[-1], 'next') if more else None
+            return KeysetPage(rows, next_cursor, None)
+
+        values, direction = self.read_cursor(cursor)
+        if direction == 'next':
+            queryset = self.queryset.filter(self.keyset_filter(values, reverse=False))
+            rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            next_cursor = self.make_cursor(rows[-1], 'next') if more else None
+            previous_cursor = self.make_cursor(rows[0], 'previous') if rows else None
+        else:
+            reversed_ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+            queryset = self.queryset.filter(self.keyset_filter(values, reverse=True))
+            rows = list(queryset.order_by(*reversed_ordering)[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            next_cursor = self.make_cursor(rows[-1], 'next') if rows else None
+            previous_cursor = self.make_cursor(rows[0], 'previous') if more else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
@@ -0,0 +1,71 @@
+from django.utils.functional import cached_property
+
+ADMIN_GROUP = 'Admin'
+MANAGER_GROUP = 'Project Manager'
+
+
+class UserPermissions:
+    """Resolve what a user may do, loading their groups and assignments at most once.
+
+    An instance lives on the request (see PermissionsMiddleware), so every permission check made
+    while handling that request, including the ones in templates, shares the same few queries.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def group_names(self):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(self.user.groups.values_list('name', flat=True))
+
+    @cached_property
+    def project_ids(self):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(self.user.assigned_projects.values_list('id', flat=True))
+
+    @cached_property
+    def issue_ids(self):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(self.user.assigned_issues.values_list('id', flat=True))
+
+    @property
+    def is_admin(self):
+        return ADMIN_GROUP in self.group_names
+
+    @property
+    def is_manager(self):
+        return MANAGER_GROUP in self.group_names
+
+    @property
+    def is_admin_or_manager(self):
+        return self.is_admin or self.is_manager
+
+    def is_assigned_to_project(self, project):
+        return project.id in self.project_ids
+
+    def is_assigned_to_issue(self, issue):
+        return issue.id in self.issue_ids
+
+    def can_view_project(self, project):
+        """Admins and users assigned to the project."""
+        return self.is_admin or self.is_assigned_to_project(project)
+
+    def can_manage_project(self, project):
+        """Admins and Project Managers assigned to the project."""
+        return self.is_admin or (self.is_manager and self.is_assigned_to_project(project))
+
+    def can_edit_issue(self, issue):
+        """Anyone who can manage the issue's project, plus users assigned to the issue."""
+        return (
+            self.is_admin
+            or (self.is_manager and issue.project_id in self.project_ids)
+            or self.is_assigned_to_issue(issue)
+        )
+
+    def can_edit_post(self, post, project):
+        """Anyone who can manage the project, plus the author of the comment or reply."""
+        return self.can_manage_project(project) or post.author_id == self.user.id
@@ -0,0 +1,289 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+from django.apps import apps as global_apps
+from django.db import connection
+from django.db.models import Count, OuterRef, Subquery, Sum
+
+from .models import SearchDocument, SearchTerm
+
+# Every issue, comment and reply has a SearchDocument holding its text. PostgreSQL and SQLite index
+# the documents themselves (a tsvector column with a GIN index, or an FTS5 table); on any other
+# database the words of each document are kept in SearchTerm, an inverted index of our own.
+FTS_TABLE = 'issues_searchdocument_fts'
+WORD_RE = re.compile(r'\w+')
+EXCERPT_LENGTH = 200
+BATCH_SIZE = 1000
+
+
+def tokenize(text):
+    return [word[:SearchTerm._meta.get_field('term').max_length] for word in WORD_RE.findall(text.lower())]
+
+
+def issue_body(title, description, tag):
+    return '\n'.join(part for part in (title, tag, description) if part)
+
+
+class SearchBackend:
+    """Inverted index search, which works on any database."""
+
+    # Whether index() has to be called with each document's new text.
+    keeps_terms = True
+
+    def index(self, document_id, body):
+        counts = Counter(tokenize(body))
+        SearchTerm.objects.filter(document_id=document_id).delete()
+        SearchTerm.objects.bulk_create([
+            SearchTerm(document_id=document_id, term=term, count=count) for term, count in counts.items()
+        ])
+
+    def rebuild(self, apps):
+        model = apps.get_model('issues', 'SearchTerm')
+        model.objects.all().delete()
+        batch = []
+        documents = apps.get_model('issues', 'SearchDocument').objects.values_list('id', 'body')
+        for document_id, body in documents.iterator():
+            batch.extend(
+                model(document_id=document_id, term=term, count=count)
+                for term, count in Counter(tokenize(body)).items()
+            )
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_create(batch)
+                batch = []
+        model.objects.bulk_create(batch)
+
+    def search(self, queryset, query):
+        terms = set(tokenize(query))
+        if not terms:
+            return queryset.none()
+        # Documents containing every word, found from the terms' side of the (term, document) index.
+        matching = (
+            SearchTerm.objects.filter(term__in=terms).values('document')
+            .annotate(matched=Count('term')).filter(matched=len(terms)).values('document')
+        )
+        score = (
+            SearchTerm.objects.filter(term__in=terms, document=OuterRef('pk')).order_by()
+            .values('document').annotate(score=Sum('count')).values('score')
+        )
+        return queryset.filter(id__in=matching).annotate(rank=Subquery(score)).order_by('-rank', '-id')
+
+
+class PostgresBackend(SearchBackend):
+    """Search the search_vector column added to SearchDocument by create_fulltext_index()."""
+
+    # The column is generated from the body, so PostgreSQL keeps it up to date.
+    keeps_terms = False
+
+    def rebuild(self, apps):
+        pass
+
+    def search(self, queryset, query):
+        if not tokenize(query):
+            return queryset.none()
+        tsquery = "websearch_to_tsquery('english', %s)"
+        return queryset.extra(
+            select={'rank': f'ts_rank(issues_searchdocument.search_vector, {tsquery})'},
+            select_params=[query],
+            where=[f'issues_searchdocument.search_vector @@ {tsquery}'],
+            params=[query]
+        ).order_by('-rank', '-id')
+
+
+class SQLiteBackend(SearchBackend):
+    """Search the FTS5 table made by create_fulltext_index(), which triggers keep up to date."""
+
+    keeps_terms = False
+
+    def rebuild(self, apps):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        # Each word is quoted, so that nothing the user types is read as FTS5 query syntax.
+        match = ' '.join(f'"{term}"' for term in terms)
+        # FTS5's rank is a bm25 score where lower is better.
+        return queryset.extra(
+            select={'rank': f'-{FTS_TABLE}.rank'},
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = issues_searchdocument.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match]
+        ).order_by('-rank', '-id')
+
+
+def has_fts5(cursor):
+    cursor.execute('PRAGMA compile_options')
+    return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+@lru_cache(maxsize=None)
+def _get_backend(vendor, alias):
+    if vendor == 'postgresql':
+        return PostgresBackend()
+    if vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+        return SQLiteBackend()
+    return SearchBackend()
+
+
+def get_backend():
+    return _get_backend(connection.vendor, connection.alias)
+
+
+def create_fulltext_index(schema_editor):
+    """Add the database's own full-text index over SearchDocument.body, if it has one."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "ALTER TABLE issues_searchdocument ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', body)) STORED"
+        )
+        schema_editor.execute(
+            'CREATE INDEX searchdocument_vector_idx ON issues_searchdocument USING GIN (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            if not has_fts5(cursor):
+                return
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(body, content='issues_searchdocument', "
+            "content_rowid='id', tokenize='porter unicode61')"
+        )
+        create_sqlite_triggers(schema_editor)
+        schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _get_backend.cache_clear()
+
+
+def create_sqlite_triggers(schema_editor):
+    delete_row = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, old.body);"
+    insert_row = f'INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, new.body);'
+    schema_editor.execute(
+        f'CREATE TRIGGER IF NOT EXISTS searchdocument_fts_insert AFTER INSERT ON issues_searchdocument '
+        f'BEGIN {insert_row} END'
+    )
+    schema_editor.execute(
+        f'CREATE TRIGGER IF NOT EXISTS searchdocument_fts_delete AFTER DELETE ON issues_searchdocument '
+        f'BEGIN {delete_row} END'
+    )
+    schema_editor.execute(
+        f'CREATE TRIGGER IF NOT EXISTS searchdocument_fts_update AFTER UPDATE ON issues_searchdocument '
+        f'BEGIN {delete_row} {insert_row} END'
+    )
+
+
+def drop_fulltext_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE issues_searchdocument DROP COLUMN IF EXISTS search_vector')
+    elif vendor == 'sqlite':
+        for action in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS searchdocument_fts_{action}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    _get_backend.cache_clear()
+
+
+def save_document(lookup, body, get_fields):
+    """Update the body of the document matching lookup, creating it with get_fields() if it's new.
+
+    An edit only changes the text, so the common case is a single UPDATE, without loading the
+    issue and project the document belongs to.
+    """
+    backend = get_backend()
+    if SearchDocument.objects.filter(**lookup).update(body=body):
+        if backend.keeps_terms:
+            for document_id in SearchDocument.objects.filter(**lookup).values_list('id', flat=True):
+                backend.index(document_id, body)
+    else:
+        document = SearchDocument.objects.create(**lookup, body=body, **get_fields())
+        if backend.keeps_terms:
+            backend.index(document.id, body)
+
+
+def index_issue(issue):
+    save_document(
+        {'kind': SearchDocument.KIND_ISSUE, 'issue_id': issue.id},
+        issue_body(issue.title, issue.description, issue.tag),
+        lambda: {'project_id': issue.project_id}
+    )
+
+
+def index_comment(comment):
+    save_document(
+        {'kind': SearchDocument.KIND_COMMENT, 'comment_id': comment.id},
+        comment.text,
+        lambda: {'issue_id': comment.issue_id, 'project_id': comment.issue.project_id}
+    )
+
+
+def index_reply(reply):
+    def get_fields():
+        issue = reply.comment.issue
+        return {'issue_id': issue.id, 'project_id': issue.project_id}
+
+    save_document({'kind': SearchDocument.KIND_REPLY, 'reply_id': reply.id}, reply.text, get_fields)
+
+
+def rebuild_index(apps=global_apps):
+    """Recreate every SearchDocument from the issues, comments and replies in the database."""
+    Issue = apps.get_model('issues', 'Issue')
+    Comment = apps.get_model('issues', 'Comment')
+    Reply = apps.get_model('issues', 'Reply')
+    Document = apps.get_model('issues', 'SearchDocument')
+
+    Document.objects.all().delete()
+    sources = [
+        (
+            Issue.objects.values_list('id', 'project_id', 'title', 'description', 'tag'),
+            lambda id, project_id, *text: Document(
+                kind=SearchDocument.KIND_ISSUE, issue_id=id, project_id=project_id, body=issue_body(*text)
+            )
+        ),
+        (
+            Comment.objects.values_list('id', 'issue_id', 'issue__project_id', 'text'),
+            lambda id, issue_id, project_id, text: Document(
+                kind=SearchDocument.KIND_COMMENT, comment_id=id, issue_id=issue_id, project_id=project_id, body=text
+            )
+        ),
+        (
+            Reply.objects.values_list('id', 'comment__issue_id', 'comment__issue__project_id', 'text'),
+            lambda id, issue_id, project_id, text: Document(
+                kind=SearchDocument.KIND_REPLY, reply_id=id, issue_id=issue_id, project_id=project_id, body=text
+            )
+        ),
+    ]
+    for rows, make_document in sources:
+        batch = []
+        for row in rows.iterator():
+            batch.append(make_document(*row))
+            if len(batch) >= BATCH_SIZE:
+                Document.objects.bulk_create(batch)
+                batch = []
+        Document.objects.bulk_create(batch)
+    get_backend().rebuild(apps)
+
+
+def search(query, permissions):
+    """Return the documents matching query that the user may see, best matches first."""
+    queryset = SearchDocument.objects.all()
+    if not permissions.is_admin:
+        queryset = queryset.filter(project_id__in=permissions.project_ids)
+    return get_backend().search(queryset, query)
+
+
+def excerpt(body, query, length=EXCERPT_LENGTH):
+    """The part of body around the first word of the query found in it."""
+    start = 0
+    lowered = body.lower()
+    for term in tokenize(query):
+        match = re.search(r'\b' + re.escape(term), lowered)
+        if match:
+            start = max(0, match.start() - length // 4)
+            break
+    text = body[start:start + length]
+    if start > 0:
+        text = '…' + text
+    if start + length < len(body):
+        text += '…'
+    return text
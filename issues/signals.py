@@ -0,0 +1,217 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import attachments, events, search, thumbnails
+from .cache import bump_versions
+from .models import Project, Issue, Comment, Reply, Attachment, IssueAttachment
+
+
+@receiver([post_save, post_delete], sender=Project)
+def project_changed(sender, instance, **kwargs):
+    bump_versions(('project', instance.id), ('projects', None))
+
+
+# Deleting an issue or a comment cascades to its comments, replies and attachments, each of which
+# is sent post_delete. Rather than look up and bump the same issue once for each of them, the ids
+# being deleted are noted on pre_delete, which every object is sent before any is sent post_delete,
+# and the handlers of what they cascade to leave the issue to them.
+#
+# The notes belong to the deletion's transaction: they're kept as one of its on-commit callbacks,
+# which Django drops if the transaction, or the savepoint they were made in, is rolled back. A
+# deletion that fails halfway can't leave ids behind to silence later deletions.
+class Deletions:
+    """The ids of the issues and comments being deleted in a transaction."""
+
+    def __init__(self):
+        self.issues = set()
+        self.comments = set()
+
+    def __call__(self):
+        self.issues.clear()
+        self.comments.clear()
+
+
+def deleting(kind, using=None):
+    """The ids of the issues or comments being deleted in the current transaction."""
+    connection = transaction.get_connection(using)
+    for savepoint_ids, func in connection.run_on_commit:
+        if isinstance(func, Deletions):
+            return getattr(func, kind)
+    deletions = Deletions()
+    # Outside a transaction, on_commit() calls it straight away, and nothing is kept.
+    connection.on_commit(deletions)
+    return getattr(deletions, kind)
+
+
+@receiver(post_save, sender=Issue)
+def issue_changed(sender, instance, **kwargs):
+    # The project's issue table shows the issue too.
+    bump_versions(('project', instance.project_id), ('issue', instance.id))
+
+
+@receiver(pre_delete, sender=Issue)
+def issue_deleting(sender, instance, using, **kwargs):
+    deleting('issues', using).add(instance.id)
+    issue_changed(sender, instance)
+
+
+@receiver(post_delete, sender=Issue)
+def issue_deleted(sender, instance, using, **kwargs):
+    deleting('issues', using).discard(instance.id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    bump_versions(('issue', instance.issue_id))
+
+
+@receiver(pre_delete, sender=Comment)
+def comment_deleting(sender, instance, using, **kwargs):
+    deleting('comments', using).add(instance.id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, using, **kwargs):
+    deleting('comments', using).discard(instance.id)
+    if instance.issue_id not in deleting('issues', using):
+        comment_changed(sender, instance)
+
+
+@receiver(post_save, sender=Reply)
+def reply_changed(sender, instance, **kwargs):
+    if Reply.comment.is_cached(instance):
+        issue_id = instance.comment.issue_id
+    else:
+        issue_id = Comment.objects.filter(id=instance.comment_id).values_list('issue_id', flat=True).first()
+    if issue_id is not None:
+        bump_versions(('issue', issue_id))
+
+
+@receiver(post_delete, sender=Reply)
+def reply_deleted(sender, instance, using, **kwargs):
+    # A reply deleted along with its comment leaves the issue to the comment's deletion.
+    if instance.comment_id not in deleting('comments', using):
+        reply_changed(sender, instance)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logging in saves last_login, which no page shows.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_versions(('users', None))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_versions(('users', None))
+
+
+# Search documents are deleted along with what they index, by the foreign keys' cascades. Fixtures
+# are loaded without indexing; run the rebuild_search_index command afterwards.
+@receiver(post_save, sender=Issue)
+def index_issue(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_issue(instance)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_comment(instance)
+
+
+@receiver(post_save, sender=Reply)
+def index_reply(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_reply(instance)
+
+
+@receiver(post_save, sender=Attachment)
+def process_attachment(sender, instance, created, raw=False, **kwargs):
+    # The worker reads the attachment back, so it's only started once it's committed.
+    if created and not raw and not instance.has_derivatives:
+        name = instance.file.name
+        transaction.on_commit(lambda: thumbnails.schedule(name))
+
+
+# Each Attachment counts the issues using it. Deleting an issue or a project cascades to its
+# IssueAttachments, so this also frees the files of deleted issues.
+@receiver(post_save, sender=IssueAttachment)
+def issue_attachment_added(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        attachments.count_use(instance.attachment_id, 1)
+        bump_versions(('issue', instance.issue_id))
+
+
+@receiver(post_delete, sender=IssueAttachment)
+def issue_attachment_removed(sender, instance, using, **kwargs):
+    attachments.count_use(instance.attachment_id, -1)
+    if instance.issue_id not in deleting('issues', using):
+        bump_versions(('issue', instance.issue_id))
+    attachment_id = instance.attachment_id
+    transaction.on_commit(lambda: attachments.collect_garbage([attachment_id]))
+
+
+# Open pages are told of activity on their issue, and people of activity on the issues assigned to
+# them (see events.py). Events carry ids, for the pages to fetch what changed.
+def issue_event_data(issue):
+    return {'issue': issue.id, 'num': issue.num, 'project': issue.project.slug, 'status': issue.status}
+
+
+@receiver(post_save, sender=Issue)
+def publish_issue_event(sender, instance, created, raw=False, **kwargs):
+    # A new issue has no page open and nobody assigned yet.
+    if created or raw:
+        return
+    event_type = 'issue.closed' if instance.status == Issue.STATUS_CLOSED else 'issue.updated'
+    user_ids = instance.assigned_users.values_list('id', flat=True)
+    channels = [events.issue_channel(instance.id), *map(events.user_channel, user_ids)]
+    events.publish(event_type, channels, **issue_event_data(instance))
+
+
+@receiver(m2m_changed, sender=Issue.assigned_users.through)
+def publish_assignment_event(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    # Assigned from either side: an issue's users, or a user's issues.
+    if reverse:
+        pairs = [(issue, instance.id) for issue in Issue.objects.select_related('project').filter(id__in=pk_set)]
+    else:
+        pairs = [(instance, user_id) for user_id in pk_set]
+    publish_assignments(action == 'post_add', pairs)
+
+
+def publish_assignments(assigned, pairs):
+    """Publish issue.assigned, or issue.unassigned, for each (issue, user id) pair.
+
+    Called by the views that assign users with bulk queries, which don't send m2m_changed.
+    """
+    event_type = 'issue.assigned' if assigned else 'issue.unassigned'
+    for issue, user_id in pairs:
+        channels = [events.issue_channel(issue.id), events.user_channel(user_id)]
+        events.publish(event_type, channels, user=user_id, **issue_event_data(issue))
+
+
+@receiver(post_save, sender=Comment)
+def publish_comment_event(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        event_type = 'comment.created' if created else 'comment.updated'
+        events.publish(event_type, [events.issue_channel(instance.issue_id)], issue=instance.issue_id, comment=instance.id)
+
+
+@receiver(post_save, sender=Reply)
+def publish_reply_event(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if Reply.comment.is_cached(instance):
+        issue_id = instance.comment.issue_id
+    else:
+        issue_id = Comment.objects.filter(id=instance.comment_id).values_list('issue_id', flat=True).first()
+    event_type = 'reply.created' if created else 'reply.updated'
+    events.publish(
+        event_type, [events.issue_channel(issue_id)], issue=issue_id, comment=instance.comment_id, reply=instance.id
+    )
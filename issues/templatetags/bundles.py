@@ -0,0 +1,33 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, mark_safe
+from django.utils.safestring import SafeString
+
+from .. import bundles
+
+register = template.Library()
+
+
+def source_attributes(source):
+    """The URL to load a bundle's source from, and any attributes to load it with.
+
+    Vendored files that aren't here yet are loaded from their CDN, with their integrity hash for the
+    browser to check them against if they have one.
+    """
+    if source in bundles.VENDOR_FILES and bundles.find(source) is None:
+        url, integrity = bundles.VENDOR_FILES[source]
+        if not integrity:
+            return url, SafeString()
+        return url, format_html(' integrity="{}" crossorigin="anonymous"', integrity)
+    return static(source), SafeString()
+
+
+@register.simple_tag
+def bundle(name):
+    """Include a bundle of scripts or stylesheets: the bundle itself once it's built, or else its sources."""
+    if bundles.is_built(name):
+        sources = [(static(bundles.bundle_name(name)), SafeString())]
+    else:
+        sources = [source_attributes(source) for source in bundles.BUNDLES[name]]
+    element = '<link rel="stylesheet" href="{}"{}>' if name.endswith('.css') else '<script src="{}"{}></script>'
+    return mark_safe('\n'.join(format_html(element, url, attributes) for url, attributes in sources))
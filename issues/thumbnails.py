@@ -0,0 +1,161 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import instrumentation
+from .cache import bump_versions
+from .models import Attachment, IssueAttachment
+
+logger = logging.getLogger(__name__)
+
+# Resized copies of attachments, shown inline on the issue page instead of the full-size original.
+# Their names are derived from the original's name and the sizes below, so they can always be found
+# again without a lookup, and changing a size (or VERSION) makes new ones rather than reusing stale ones.
+VERSION = 1
+SIZES = {
+    'thumbnail': (320, 320),
+    'preview': (1024, 1024),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+# Attachments waiting for or being processed by the worker pool.
+_queued = 0
+
+
+def get_storage():
+    return Attachment._meta.get_field('file').storage
+
+
+def derivative_name(original_name, size, fmt):
+    digest = hashlib.sha256(original_name.encode()).hexdigest()[:32]
+    width, height = SIZES[size]
+    return f'derivatives/{digest}/v{VERSION}-{size}-{width}x{height}.{fmt}'
+
+
+def derivative_urls(original_name):
+    """The URLs of an attachment's derivatives, as {size: {format: url}}."""
+    storage = get_storage()
+    return {
+        size: {fmt: storage.url(derivative_name(original_name, size, fmt)) for fmt in FORMATS}
+        for size in SIZES
+    }
+
+
+def open_image(storage, name):
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        # For JPEGs, let the decoder scale down while reading, so a 20 MB photo is never fully decoded.
+        largest = max(SIZES.values())
+        image.draft('RGB', (largest[0] * 2, largest[1] * 2))
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    return image
+
+
+def encode(image, fmt):
+    pil_format, options = FORMATS[fmt]
+    if pil_format == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def generate_derivatives(original_name):
+    """Make any of an attachment's derivatives that aren't in storage yet.
+
+    Returns True if they all exist afterwards, or False if the attachment isn't an image Pillow
+    can read.
+    """
+    storage = get_storage()
+    missing = [
+        (size, fmt) for size in SIZES for fmt in FORMATS
+        if not storage.exists(derivative_name(original_name, size, fmt))
+    ]
+    if not missing:
+        return True
+    try:
+        image = open_image(storage, original_name)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        logger.warning('Could not make derivatives of attachment %s', original_name, exc_info=True)
+        return False
+
+    # Largest first, so that each size is resized from the one before rather than from the original.
+    for size, dimensions in sorted(SIZES.items(), key=lambda item: item[1], reverse=True):
+        image.thumbnail(dimensions, Image.LANCZOS)
+        for fmt in FORMATS:
+            if (size, fmt) in missing:
+                storage.save(derivative_name(original_name, size, fmt), encode(image, fmt))
+    return True
+
+
+def delete_derivatives(original_name):
+    storage = get_storage()
+    for size in SIZES:
+        for fmt in FORMATS:
+            storage.delete(derivative_name(original_name, size, fmt))
+
+
+def process_attachment(original_name):
+    """Generate an attachment's derivatives, then mark it as having them."""
+    if not generate_derivatives(original_name):
+        return
+    attachments = Attachment.objects.filter(file=original_name, has_derivatives=False)
+    issue_ids = set(IssueAttachment.objects.filter(attachment__in=attachments).values_list('issue_id', flat=True))
+    if attachments.update(has_derivatives=True) and issue_ids:
+        bump_versions(*[('issue', issue_id) for issue_id in issue_ids])
+
+
+def _work(original_name):
+    global _queued
+    try:
+        process_attachment(original_name)
+    except Exception:
+        logger.exception('Failed to process attachment %s', original_name)
+    finally:
+        # Workers outlive requests, so nothing else closes their connections.
+        connection.close()
+        with _executor_lock:
+            _queued -= 1
+
+
+def get_executor():
+    global _executor
+    workers = getattr(settings, 'ATTACHMENT_WORKERS', 2)
+    if workers <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='attachments')
+    return _executor
+
+
+def schedule(original_name):
+    """Generate an attachment's derivatives in the worker pool, or straight away if it's disabled."""
+    global _queued
+    executor = get_executor()
+    if executor is None:
+        process_attachment(original_name)
+    else:
+        with _executor_lock:
+            _queued += 1
+        executor.submit(_work, original_name)
+
+
+instrumentation.registry.gauge('attachment_queue', lambda: _queued)
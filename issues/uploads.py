@@ -0,0 +1,283 @@
+import hashlib
+import io
+import os
+import tempfile
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from PIL import Image, UnidentifiedImageError
+
+try:
+    from storages.backends.s3boto3 import S3Boto3Storage
+except ImportError:
+    S3Boto3Storage = None
+
+# Attachments can be streamed to storage while the request is still being received, rather than
+# buffered in memory or a temporary file first (StreamingUploadHandler), or uploaded by the browser
+# straight to storage, with the form only sending back the key it was stored under (presigned_post).
+# Either way, just the start of the file is kept, to check that it's an image.
+HEAD_SIZE = 256 * 1024
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+DIRECT_UPLOAD_SALT = 'issues.uploads.direct'
+DIRECT_UPLOAD_EXPIRES = 60 * 60
+
+
+def image_format(head):
+    """The format of the image that starts with the bytes head, or None if it isn't one Pillow reads."""
+    try:
+        return Image.open(io.BytesIO(head)).format
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return None
+
+
+def is_s3(storage):
+    return S3Boto3Storage is not None and isinstance(storage, S3Boto3Storage)
+
+
+def s3_key(storage, name):
+    return storage._normalize_name(storage._clean_name(name))
+
+
+def read_head(storage, name, size=HEAD_SIZE):
+    """Read the start of a stored file without downloading the rest, or return None if it's missing."""
+    if is_s3(storage):
+        client = storage.bucket.meta.client
+        try:
+            response = client.get_object(Bucket=storage.bucket_name, Key=s3_key(storage, name), Range=f'bytes=0-{size - 1}')
+        except client.exceptions.NoSuchKey:
+            return None
+        return response['Body'].read()
+    try:
+        with storage.open(name, 'rb') as stored:
+            return stored.read(size)
+    except FileNotFoundError:
+        return None
+
+
+class StoredUploadedFile(UploadedFile):
+    """An upload that was written to storage as it was received. Only its first HEAD_SIZE bytes are kept.
+
+    storage_name is None if the upload was larger than ATTACHMENT_MAX_UPLOAD_SIZE, and so wasn't stored,
+    or once the file has been handed over to an Attachment.
+    """
+
+    def __init__(self, storage, storage_name, name, content_type, size, head, sha256=None):
+        super().__init__(io.BytesIO(head), name, content_type, size)
+        self.storage = storage
+        self.storage_name = storage_name
+        self.head = bytes(head)
+        self.sha256 = sha256
+
+    def delete(self):
+        if self.storage_name is not None:
+            self.storage.delete(self.storage_name)
+
+
+class StorageWriter:
+    """Write a file to any storage, holding at most buffer_size bytes in memory and spilling the rest to disk."""
+
+    def __init__(self, storage, name, content_type, buffer_size):
+        self.storage = storage
+        self.name = name
+        self.file = tempfile.SpooledTemporaryFile(max_size=buffer_size)
+
+    def write(self, data):
+        self.file.write(data)
+
+    def complete(self):
+        self.file.seek(0)
+        try:
+            return self.storage.save(self.name, File(self.file, name=self.name))
+        finally:
+            self.file.close()
+
+    def abort(self):
+        self.file.close()
+
+
+class FileSystemWriter:
+    """Write a file straight to its place in a FileSystemStorage."""
+
+    def __init__(self, storage, name, content_type, buffer_size):
+        self.storage = storage
+        while True:
+            # Claim the name with O_EXCL, so that a concurrent upload can't pick it too.
+            self.name = storage.get_available_name(name)
+            self.path = storage.path(self.name)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+            except FileExistsError:
+                continue
+            self.file = os.fdopen(fd, 'wb')
+            break
+
+    def write(self, data):
+        self.file.write(data)
+
+    def complete(self):
+        self.file.close()
+        if self.storage.file_permissions_mode is not None:
+            os.chmod(self.path, self.storage.file_permissions_mode)
+        return self.name.replace('\\', '/')
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.path)
+
+
+class S3MultipartWriter:
+    """Write a file to S3 with a multipart upload, sending a part whenever buffer_size bytes are waiting."""
+
+    def __init__(self, storage, name, content_type, buffer_size):
+        self.storage = storage
+        self.name = storage.get_available_name(name)
+        self.key = s3_key(storage, self.name)
+        self.client = storage.bucket.meta.client
+        # S3 rejects parts smaller than 5 MB, other than the last.
+        self.part_size = max(buffer_size, S3_MIN_PART_SIZE)
+        params = storage._get_write_parameters(self.key, SimpleNamespace(content_type=content_type))
+        response = self.client.create_multipart_upload(Bucket=storage.bucket_name, Key=self.key, **params)
+        self.upload_id = response['UploadId']
+        self.buffer = bytearray()
+        self.parts = []
+
+    def upload_part(self):
+        number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.storage.bucket_name, Key=self.key, UploadId=self.upload_id,
+            PartNumber=number, Body=bytes(self.buffer)
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': number})
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.part_size:
+            self.upload_part()
+
+    def complete(self):
+        if self.buffer or not self.parts:
+            self.upload_part()
+        self.client.complete_multipart_upload(
+            Bucket=self.storage.bucket_name, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts}
+        )
+        return self.name
+
+    def abort(self):
+        self.client.abort_multipart_upload(Bucket=self.storage.bucket_name, Key=self.key, UploadId=self.upload_id)
+
+
+def open_writer(storage, name, content_type):
+    buffer_size = settings.ATTACHMENT_UPLOAD_BUFFER_SIZE
+    if is_s3(storage):
+        writer_class = S3MultipartWriter
+    elif isinstance(storage, FileSystemStorage):
+        writer_class = FileSystemWriter
+    else:
+        writer_class = StorageWriter
+    return writer_class(storage, name, content_type, buffer_size)
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """Write the files posted to the given fields to storage as they're received, hashing them on the way.
+
+    Each file is written under name_for(file_name). Files posted to other fields are left to the
+    handlers after this one.
+    """
+
+    def __init__(self, request, field_names, storage, name_for):
+        super().__init__(request)
+        self.field_names = field_names
+        self.storage = storage
+        self.name_for = name_for
+        self.writer = None
+
+    def new_file(self, field_name, file_name, content_type, *args, **kwargs):
+        super().new_file(field_name, file_name, content_type, *args, **kwargs)
+        self.writer = None
+        if field_name not in self.field_names:
+            return
+        self.head = bytearray()
+        self.digest = hashlib.sha256()
+        self.too_large = False
+        self.writer = open_writer(self.storage, self.name_for(file_name), content_type)
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.writer is None:
+            return raw_data
+        if len(self.head) < HEAD_SIZE:
+            self.head += raw_data[:HEAD_SIZE - len(self.head)]
+        if not self.too_large:
+            if start + len(raw_data) > settings.ATTACHMENT_MAX_UPLOAD_SIZE:
+                # The rest is read and thrown away, and the form reports the upload as too large.
+                self.too_large = True
+                self.writer.abort()
+            else:
+                self.digest.update(raw_data)
+                self.writer.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.writer is None:
+            return None
+        storage_name = None if self.too_large else self.writer.complete()
+        self.writer = None
+        return StoredUploadedFile(
+            self.storage, storage_name, self.file_name, self.content_type, file_size, self.head,
+            sha256=self.digest.hexdigest()
+        )
+
+    def upload_complete(self):
+        # A file whose completion was never reported, because the request was cut short.
+        if self.writer is not None and not self.too_large:
+            self.writer.abort()
+            self.writer = None
+
+
+def discard_unused_uploads(request):
+    """Delete the files a request streamed to storage that weren't made into attachments."""
+    if not hasattr(request, '_files'):
+        return
+    for field_name, files in request._files.lists():
+        for uploaded in files:
+            if isinstance(uploaded, StoredUploadedFile):
+                uploaded.delete()
+
+
+def sign_direct_upload(upload):
+    return signing.dumps(upload, salt=DIRECT_UPLOAD_SALT)
+
+
+def unsign_direct_upload(key):
+    """The value signed by sign_direct_upload(), or None if the key is forged or has expired."""
+    try:
+        return signing.loads(key, salt=DIRECT_UPLOAD_SALT, max_age=DIRECT_UPLOAD_EXPIRES)
+    except signing.BadSignature:
+        return None
+
+
+def presigned_post(storage, name, content_type, max_size):
+    """The URL and form fields a browser can POST a file to, to store it under name without going through us.
+
+    S3 checks the policy itself. Other storages have to implement presigned_post(); see
+    storage_backends.LocalMediaStorage.
+    """
+    if is_s3(storage):
+        return storage.bucket.meta.client.generate_presigned_post(
+            Bucket=storage.bucket_name,
+            Key=s3_key(storage, name),
+            Fields={'Content-Type': content_type},
+            Conditions=[{'Content-Type': content_type}, ['content-length-range', 1, max_size]],
+            ExpiresIn=DIRECT_UPLOAD_EXPIRES
+        )
+    if hasattr(storage, 'presigned_post'):
+        return storage.presigned_post(name, content_type, max_size, DIRECT_UPLOAD_EXPIRES)
+    raise NotImplementedError(f'{type(storage).__name__} does not support direct uploads.')
@@ -5,7 +5,9 @@ from .views import (
     UserCreateView,
     UserUpdateView,
     ProjectsListView,
+    ProjectsTableView,
     ProjectDetailView,
+    ProjectIssuesTableView,
     ProjectCreateView,
     ProjectDeleteView,
     ProjectUpdateView,
@@ -13,10 +15,18 @@ from .views import (
     ProjectIssueCreateView,
     IssueUpdateView,
     IssueCreateView,
+    AttachmentUploadView,
+    DirectUploadView,
     IssueDetailView,
     IssueAssignView,
     IssueDeleteView,
     MyIssuesView,
+    MyIssuesTableView,
+    CommentsSinceView,
+    CommentThreadView,
+    EventStreamView,
+    RequestMetricsView,
+    MetricsView,
     CommentCreateView,
     CommentUpdateView,
     CommentDeleteView,
@@ -26,6 +36,7 @@ from .views import (
     MyProjectsView,
     MyProfileView,
     ProfileDeleteView,
+    SearchView,
     DemoLoginView
 )
 
@@ -37,17 +48,23 @@ urlpatterns = [
     path('<str:username>/update-user/<str:type>/', UserUpdateView.as_view(), name='user-update'),
     path('<str:username>/update-password/<str:type>/', PasswordView.as_view(), name='password-update'),
     path('projects/', ProjectsListView.as_view(), name='projects-list'),
+    path('projects/table/', ProjectsTableView.as_view(), name='projects-table'),
     path('<slug:slug>/view', ProjectDetailView.as_view(), name='project-detail'),
+    path('<slug:slug>/issues-table/', ProjectIssuesTableView.as_view(), name='project-issues-table'),
     path('create-project/', ProjectCreateView.as_view(), name='project-create'),
     path('<slug:slug>/delete/', ProjectDeleteView.as_view(), name='project-delete'),
     path('<slug:slug>/update/', ProjectUpdateView.as_view(), name='project-update'),
     path('<slug:slug>/assign-users/', ProjectAssignView.as_view(), name='project-assign'),
     path('<slug:slug>/create-issue/', ProjectIssueCreateView.as_view(), name='project-issue-create'),
     path('create-issue/', IssueCreateView.as_view(), name='issue-create'),
+    path('attachment-upload/', AttachmentUploadView.as_view(), name='attachment-upload'),
+    path('direct-upload/', DirectUploadView.as_view(), name='direct-upload'),
     path('<slug:project_slug>/issue-<int:issue_num>/update/', IssueUpdateView.as_view(), name='issue-update'),
     path('<slug:project_slug>/issue-<int:issue_num>/assign/', IssueAssignView.as_view(), name='issue-assign'),
     path('<slug:project_slug>/issue-<int:issue_num>/details/', IssueDetailView.as_view(), name='issue-detail'),
     path('<slug:project_slug>/issue-<int:issue_num>/delete/', IssueDeleteView.as_view(), name='issue-delete'),
+    path('<slug:project_slug>/issue-<int:issue_num>/comments-since/', CommentsSinceView.as_view(), name='comments-since'),
+    path('<slug:project_slug>/issue-<int:issue_num>/comment-thread/', CommentThreadView.as_view(), name='comment-thread'),
     path('<slug:project_slug>/issue-<int:issue_num>/create-comment/', CommentCreateView.as_view(), name='comment-create'),
     path('<slug:project_slug>/issue-<int:issue_num>/update-comment/', CommentUpdateView.as_view(), name='comment-update'),
     path('<slug:project_slug>/issue-<int:issue_num>/delete-comment/', CommentDeleteView.as_view(), name='comment-delete'),
@@ -56,7 +73,13 @@ urlpatterns = [
     path('<slug:project_slug>/issue-<int:issue_num>/update-reply/', ReplyUpdateView.as_view(), name='reply-update'),
     path('my-projects/', MyProjectsView.as_view(), name='my-projects'),
     path('my-issues/', MyIssuesView.as_view(), name='my-issues'),
+    path('my-issues/table/', MyIssuesTableView.as_view(), name='my-issues-table'),
     path('<str:username>/my-profile/', MyProfileView.as_view(), name='my-profile'),
     path('<str:username>/delete-profile/', ProfileDeleteView.as_view(), name='profile-delete'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('events/', EventStreamView.as_view(), name='events'),
+    path('request-metrics/', RequestMetricsView.as_view(), name='request-metrics'),
+    # Without a trailing slash, where Prometheus looks by default.
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('demo-login/', DemoLoginView.as_view(), name='demo-login')
 ]
@@ -1,10 +1,20 @@
+import datetime
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import User, Group
-from django.http import JsonResponse
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Prefetch, Q, Subquery
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
+from django.utils.html import escape, linebreaks
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.views.generic.base import View 
 from django.views.generic import (
     DetailView, 
@@ -15,6 +25,11 @@ from django.views.generic import (
     ListView
 )
 
+from . import attachments, events, instrumentation, metrics
+from .async_views import AsyncViewMixin
+from .cache import CACHE_TIMEOUT, bump_versions, get_or_set, get_versions, issue_scopes, project_scopes, versioned_key
+from .conditional import ConditionalGetMixin
+from .datatables import DataTableView, format_datetime, options_list
 from .forms import (
     UserGroupForm,
     UserForm,
@@ -29,10 +44,16 @@ from .models import (
     Project,
     Issue,
     Comment,
-    Reply
+    Reply,
+    Attachment
 )
+from .pagination import InvalidCursor, KeysetPaginator
+from .permissions import ADMIN_GROUP, MANAGER_GROUP
+from .search import excerpt, search
+from .signals import publish_assignments
+from .thumbnails import derivative_urls
+from .uploads import StreamingUploadHandler, discard_unused_uploads, presigned_post, sign_direct_upload
 
-import datetime
 
 def get_users_str(username_list):
     """Return a string of comma-separated user names for success messages."""
@@ -42,6 +63,106 @@ def get_users_str(username_list):
     return users_str
 
 
+def get_selected_users(user_ids, queryset=None):
+    """Fetch the users selected in an assignment form in one query, in the order they were listed."""
+    if queryset is None:
+        queryset = User.objects.all()
+    try:
+        users = queryset.in_bulk(user_ids)
+        return [users[int(user_id)] for user_id in user_ids]
+    except (KeyError, ValueError):
+        raise Http404('No such user.')
+
+
+def with_group_name(users):
+    """Annotate a queryset of users with the name of their group as 'group_name', in the query that loads them."""
+    groups = Group.objects.filter(user=OuterRef('pk')).order_by('pk').values('name')[:1]
+    return users.annotate(group_name=Subquery(groups))
+
+
+def get_issue_counts(issues):
+    """Count a queryset of issues in total, by status and by priority, in a single aggregate query."""
+    aggregates = {'total': Count('id')}
+    for value, _ in Issue.STATUS_CHOICES:
+        aggregates[f'status_{value}'] = Count('id', filter=Q(status=value))
+    for value, _ in Issue.PRIORITY_CHOICES:
+        aggregates[f'priority_{value}'] = Count('id', filter=Q(priority=value))
+    counts = issues.aggregate(**aggregates)
+    return {
+        'total': counts['total'],
+        'status': [(label, counts[f'status_{value}']) for value, label in Issue.STATUS_CHOICES],
+        'priority': [(label, counts[f'priority_{value}']) for value, label in Issue.PRIORITY_CHOICES]
+    }
+
+
+def get_comment_paginator(issue, per_page):
+    """Page through an issue's comments, newest first, with each comment's replies prefetched."""
+    comments = issue.comments.select_related('author').prefetch_related(
+        Prefetch('replies', queryset=Reply.objects.select_related('author').order_by('date_created'))
+    )
+    # Ties on date_created are broken newest first too, so that a comment posted after a cursor is always
+    # ahead of it.
+    return KeysetPaginator(comments, ['-date_created', '-id'], per_page)
+
+
+def get_attachments(issue):
+    """The issue's attachments, each with the URLs of its resized copies once they've been made."""
+    issue_attachments = list(issue.issue_attachments.select_related('attachment'))
+    for issue_attachment in issue_attachments:
+        attachment = issue_attachment.attachment
+        # Until then, only the link to the original is shown.
+        issue_attachment.derivatives = derivative_urls(attachment.file.name) if attachment.has_derivatives else None
+    return issue_attachments
+
+
+def render_comment_thread(request, comment, replies):
+    """Render a comment with its replies, as it appears in an issue's comment thread."""
+    context = {'comment': comment, 'replies': replies, 'reply_form': ReplyForm}
+    return render_to_string('issues/comment_thread.html', context, request=request)
+
+
+class ProjectIssueMixin:
+    """Resolve the project and issue named by the 'project_slug' and 'issue_num' URL kwargs.
+
+    Both are fetched in one joined query and cached on the view instance, so permission checks
+    and handlers can call get_project_object() and get_issue_object() as often as they like.
+    """
+
+    def get_issue_object(self):
+        if not hasattr(self, '_issue'):
+            self._issue = get_object_or_404(
+                Issue.objects.select_related('project', 'submitter', 'assignee'),
+                num=self.kwargs.get('issue_num'),
+                project__slug=self.kwargs.get('project_slug')
+            )
+        return self._issue
+
+    def get_project_object(self):
+        return self.get_issue_object().project
+
+    def get_object(self, queryset=None):
+        return self.get_issue_object()
+
+
+class RequestMetricsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Admins only: each view's request latency, queries, template time and response size, across all processes."""
+
+    def test_func(self):
+        return self.request.permissions.is_admin
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({'views': instrumentation.summarize(instrumentation.collect().views)})
+
+
+class MetricsView(View):
+    """The request, cache, attachment and queue metrics of every process, for Prometheus to scrape."""
+
+    def get(self, request, *args, **kwargs):
+        if not metrics.is_authorized(request):
+            return HttpResponseForbidden()
+        return HttpResponse(metrics.render(instrumentation.collect()), content_type=metrics.CONTENT_TYPE)
+
+
 class DemoLoginView(View):
     """Log user in as DemoUser and display message."""
     def get(self, request, *args, **kwargs):
@@ -53,22 +174,21 @@ class DemoLoginView(View):
 
 class ManageUsersView(LoginRequiredMixin, UserPassesTestMixin, FormView):
     template_name = 'issues/users_list.html'
-    # User table info is sometimes not completely up to date for some reason;
-    # Refresh from db to ensure accurate info is displayed.
-    User.refresh_from_db # TODO - doesn't seem to always work.
-    users = User.objects.filter(is_active=True)
     form_class = UserGroupForm
-    context = {
-        'users': users,
-        'form': form_class,
-        'user_type': 'admin'
-    }
 
     def test_func(self):
-        return self.request.user.groups.filter(name='Admin').exists()
+        return self.request.permissions.is_admin
+
+    def get_context(self, form):
+        # The users are queried for each request, so the table is never stale.
+        return {
+            'users': with_group_name(User.objects.filter(is_active=True)),
+            'form': form,
+            'user_type': 'admin'
+        }
 
     def get(self, request, *args, **kwargs):
-        return render(request, self.template_name, self.context)
+        return render(request, self.template_name, self.get_context(self.form_class))
     
     def form_valid(self, form):
         user_obj_set = form.cleaned_data.get('select_user')
@@ -87,8 +207,7 @@ class ManageUsersView(LoginRequiredMixin, UserPassesTestMixin, FormView):
             users_str = get_users_str(username_list)
             messages.success(self.request, f"The following users have been successfully added to group "
                 f"'{group_name}': {users_str}.")
-            self.context['form'] = self.form_class
-            return render(self.request, self.template_name, self.context)
+            return render(self.request, self.template_name, self.get_context(self.form_class))
 
         elif self.request.POST.get('action') == 'delete_users':
             for u in user_obj_set:
@@ -99,12 +218,10 @@ class ManageUsersView(LoginRequiredMixin, UserPassesTestMixin, FormView):
 
             users_str = get_users_str(username_list)
             messages.success(self.request, f"The following users are now inactive: {users_str}.")
-            self.context['form'] = self.form_class
-            return render(self.request, self.template_name, self.context)
+            return render(self.request, self.template_name, self.get_context(self.form_class))
     
     def form_invalid(self, form):
-        self.context['form'] = form
-        return render(self.request, self.template_name, self.context)
+        return render(self.request, self.template_name, self.get_context(form))
 
 
 class PasswordView(LoginRequiredMixin, UserPassesTestMixin, FormView):
@@ -114,7 +231,7 @@ class PasswordView(LoginRequiredMixin, UserPassesTestMixin, FormView):
     def test_func(self):
         user_type = self.kwargs.get('type')
         if user_type == 'admin':
-            return self.request.user.groups.filter(name='Admin').exists()
+            return self.request.permissions.is_admin
         elif user_type == 'std-user':
             return True if self.request.user == self.get_user_object() else False
 
@@ -158,7 +275,7 @@ class UserCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
     form_class = UserForm
 
     def test_func(self):
-        return self.request.user.groups.filter(name='Admin').exists()
+        return self.request.permissions.is_admin
     
     def form_valid(self, form):
         """Save the new user, then add the user to the selected group"""
@@ -181,7 +298,7 @@ class UserUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     def test_func(self):
         user_type = self.kwargs.get('type')
         if user_type == 'admin':
-            return self.request.user.groups.filter(name='Admin').exists()
+            return self.request.permissions.is_admin
         elif user_type == 'std-user':
             return True if self.request.user == self.get_object() else False
 
@@ -230,13 +347,47 @@ class UserUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         return render(self.request, self.template_name, context)
 
 
-class ProjectsListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
-    """Display all projects. Only Admins can view."""
+class ProjectsListView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Display all projects. Only Admins can view. The table rows are loaded from ProjectsTableView."""
     template_name = 'issues/projects_list.html'
-    queryset = Project.objects.all()
 
     def test_func(self):
-        return self.request.user.groups.filter(name='Admin').exists()
+        return self.request.permissions.is_admin
+
+    def get(self, request, *args, **kwargs):
+        context = {
+            'has_projects': Project.objects.exists()
+        }
+        return render(request, self.template_name, context)
+
+
+class ProjectsTableView(LoginRequiredMixin, UserPassesTestMixin, DataTableView):
+    """Serve pages of the projects table for ProjectsListView."""
+    columns = [
+        ('title', 'title'),
+        ('description', 'description'),
+        ('options', None)
+    ]
+    search_fields = ['title', 'description']
+
+    def test_func(self):
+        return self.request.permissions.is_admin
+
+    def get_queryset(self):
+        return Project.objects.only('title', 'description', 'slug')
+
+    def get_cache_key(self):
+        return versioned_key('projects-table', [('projects', None)], self.get_table_params())
+
+    def get_row(self, project):
+        return {
+            'title': escape(project.title),
+            'description': linebreaks(project.description, autoescape=True),
+            'options': options_list([
+                (reverse('issues:project-detail', kwargs={'slug': project.slug}), 'View Details'),
+                (reverse('issues:project-assign', kwargs={'slug': project.slug}), 'Assign Users')
+            ])
+        }
 
 
 class MyProjectsView(LoginRequiredMixin, ListView):
@@ -251,45 +402,110 @@ class MyProjectsView(LoginRequiredMixin, ListView):
         return render(request, self.template_name, context)
 
 
-class ProjectDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
+class ProjectDetailView(LoginRequiredMixin, UserPassesTestMixin, ConditionalGetMixin, DetailView):
     template_name = 'issues/project_detail.html'
     model = Project
 
     def test_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        assigned_user_access = True if self.request.user in self.get_object().assigned_users.all() else False
+        return self.request.permissions.can_view_project(self.get_object())
 
-        return admin_access or assigned_user_access
+    def get_object(self, queryset=None):
+        if not hasattr(self, '_project'):
+            self._project = super().get_object(queryset)
+        return self._project
+
+    def get_issue_stats(self):
+        if not hasattr(self, '_issue_stats'):
+            self._issue_stats = self.get_object().issues.aggregate(count=Count('id'), updated=Max('date_updated'))
+        return self._issue_stats
+
+    def get_etag_parts(self):
+        # Assignments and user details are only tracked by the cache versions, which a dummy cache doesn't keep.
+        project = self.get_object()
+        versions = get_versions(*project_scopes(project.id))
+        if None in versions:
+            return None
+        stats = self.get_issue_stats()
+        return [project.id, project.title, project.description, stats['count'], stats['updated'], *versions]
     
     def get(self, request, *args, **kwargs):
+        # The issues table is loaded page by page from ProjectIssuesTableView.
         project = self.get_object()
-        assigned_users = project.assigned_users.all()
-        issues = Issue.objects.filter(project=project.id)
+        assigned_users = with_group_name(project.assigned_users.all())
         context = {
             'assigned_users': assigned_users,
             'project': project,
-            'issues': issues
+            'has_issues': self.get_issue_stats()['count'] > 0,
+            # The assigned users table is cached, and only queried when the project or its users change.
+            'users_cache_key': versioned_key('project-users', project_scopes(project.id)),
+            'cache_timeout': CACHE_TIMEOUT
         }
         return render(request, self.template_name, context)
 
 
+class ProjectIssuesTableView(LoginRequiredMixin, UserPassesTestMixin, DataTableView):
+    """Serve pages of a project's issues table for ProjectDetailView."""
+    columns = [
+        ('num', 'num'),
+        ('title', 'title'),
+        ('submitter', 'submitter__username'),
+        ('assignee', 'assignee__username'),
+        ('status', 'status'),
+        ('date_created', 'date_created'),
+        ('options', None)
+    ]
+    search_fields = ['title', 'tag', 'submitter__username', 'assignee__username']
+
+    def test_func(self):
+        return self.request.permissions.can_view_project(self.get_project_object())
+
+    def get_project_object(self):
+        if not hasattr(self, '_project'):
+            self._project = get_object_or_404(Project.objects.only('slug'), slug=self.kwargs.get('slug'))
+        return self._project
+
+    def get_queryset(self):
+        return Issue.objects.filter(project=self.get_project_object()).select_related('submitter', 'assignee')
+
+    def get_cache_key(self):
+        # The options column depends on the user's role.
+        return versioned_key(
+            'project-issues-table',
+            project_scopes(self.get_project_object().id),
+            self.request.permissions.is_admin_or_manager,
+            self.get_table_params()
+        )
+
+    def get_row(self, issue):
+        url_kwargs = {'project_slug': self.get_project_object().slug, 'issue_num': issue.num}
+        links = [(reverse('issues:issue-detail', kwargs=url_kwargs), 'View details')]
+        if self.request.permissions.is_admin_or_manager:
+            links.append((reverse('issues:issue-assign', kwargs=url_kwargs), 'Assign users'))
+        return {
+            'num': issue.num,
+            'title': escape(issue.title),
+            'submitter': escape(issue.submitter),
+            'assignee': escape(issue.assignee),
+            'status': issue.get_status_display(),
+            'date_created': format_datetime(issue.date_created),
+            'options': options_list(links)
+        }
+
+
 class ProjectCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
     template_name = 'issues/project_create_or_update.html'
     model = Project
     form_class = ProjectForm
 
     def test_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        manager_access = self.request.user.groups.filter(name='Project Manager').exists()
-
-        return admin_access or manager_access
+        return self.request.permissions.is_admin_or_manager
     
     def form_valid(self, form):
         if self.request.user.email != 'demo@ex.com':
             new_proj = form.save()
 
             # Auto-assign managers to the projects they create.
-            if self.request.user.groups.filter(name='Project Manager').exists():
+            if self.request.permissions.is_manager:
                 new_proj.assigned_users.add(self.request.user)
     
             return redirect(reverse('issues:project-detail', kwargs={'slug': new_proj.slug}))
@@ -304,17 +520,14 @@ class ProjectDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = Project
 
     def test_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        assigned_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_object().assigned_users.all())
-
-        return admin_access or assigned_manager_access
+        return self.request.permissions.can_manage_project(self.get_object())
     
     def post(self, request, *args, **kwargs):
         project = self.get_object()
         if self.request.user.email != 'demo@ex.com':
             project.delete()
         messages.success(request, f"Project '{project.title}' has been successfully deleted.")
-        if self.request.user.groups.filter(name='Admin').exists():
+        if self.request.permissions.is_admin:
             return redirect(reverse('issues:projects-list'))
         else:
             return redirect(reverse('issues:my-projects'))
@@ -326,10 +539,7 @@ class ProjectUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     form_class = ProjectForm
 
     def test_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        assigned_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_object().assigned_users.all())
-
-        return admin_access or assigned_manager_access
+        return self.request.permissions.can_manage_project(self.get_object())
     
     def form_valid(self, form):
         title = form.cleaned_data.get('title')
@@ -343,18 +553,16 @@ class ProjectAssignView(LoginRequiredMixin, UserPassesTestMixin, View):
     template_name = 'issues/project_assign.html'
 
     def test_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        assigned_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_project_object().assigned_users.all())
-
-        return admin_access or assigned_manager_access
+        return self.request.permissions.can_manage_project(self.get_project_object())
 
     def get_project_object(self):
-        slug_ = self.kwargs.get('slug')
-        return get_object_or_404(Project, slug=slug_)
+        if not hasattr(self, '_project'):
+            self._project = get_object_or_404(Project, slug=self.kwargs.get('slug'))
+        return self._project
     
     def get(self, request, *args, **kwargs):
-        all_users = User.objects.filter(is_active=True)
-        assigned_users = self.get_project_object().assigned_users.all()
+        all_users = with_group_name(User.objects.filter(is_active=True))
+        assigned_users = with_group_name(self.get_project_object().assigned_users.all())
         context = {
             'project': self.get_project_object(),
             'all_users': all_users,
@@ -363,28 +571,55 @@ class ProjectAssignView(LoginRequiredMixin, UserPassesTestMixin, View):
         return render(request, self.template_name, context)
     
     def post(self, request, *args, **kwargs):
-        user_ids = request.POST.getlist('selection')
         project = self.get_project_object()
-        issues = project.issues.all()
         action = request.POST.get('action')
-        username_list = []
-        for user_id in user_ids:
-            # Get list of names to display in success message.
-            u = get_object_or_404(User, id=user_id)
-            username_list.append(f"{u.username}")
-
-            if action == 'assign' and not u in project.assigned_users.all() and self.request.user.email != 'demo@ex.com':
-                project.assigned_users.add(u)
-                # If the user is a project manager or admin, assign all project issues to them as well.
-                if u.groups.filter(name='Admin').exists() or u.groups.filter(name='Project Manager').exists():
-                    for issue in issues:
-                        issue.assigned_users.add(u)
-
-            elif action == 'unassign' and u in project.assigned_users.all() and self.request.user.email != 'demo@ex.com':
-                project.assigned_users.remove(u)
-                # Unassign the user from all project issues as well.
-                for issue in issues:
-                    issue.assigned_users.remove(u)
+        users = get_selected_users(request.POST.getlist('selection'), User.objects.prefetch_related('groups'))
+        # Get list of names to display in success message.
+        username_list = [f"{u.username}" for u in users]
+
+        if self.request.user.email != 'demo@ex.com':
+            # Work out the changes against the current memberships, then apply each in a single query.
+            with transaction.atomic():
+                assigned_ids = set(project.assigned_users.filter(id__in=[u.id for u in users]).values_list('id', flat=True))
+                IssueUser = Issue.assigned_users.through
+
+                if action == 'assign':
+                    new_users = {u.id: u for u in users if u.id not in assigned_ids}.values()
+                    project.assigned_users.add(*new_users)
+                    # If the user is a project manager or admin, assign all project issues to them as well.
+                    manager_ids = [
+                        u.id for u in new_users
+                        if any(g.name in (ADMIN_GROUP, MANAGER_GROUP) for g in u.groups.all())
+                    ]
+                    if manager_ids:
+                        issues = project.issues.only('id', 'num', 'status', 'project')
+                        existing = set(
+                            IssueUser.objects.filter(issue__project=project, user_id__in=manager_ids)
+                            .values_list('issue_id', 'user_id')
+                        )
+                        pairs = [
+                            (issue, user_id) for issue in issues for user_id in manager_ids
+                            if (issue.id, user_id) not in existing
+                        ]
+                        IssueUser.objects.bulk_create(
+                            [IssueUser(issue_id=issue.id, user_id=user_id) for issue, user_id in pairs],
+                            batch_size=1000,
+                            ignore_conflicts=True
+                        )
+                        publish_assignments(True, pairs)
+
+                elif action == 'unassign':
+                    project.assigned_users.remove(*assigned_ids)
+                    # Unassign the users from all project issues as well.
+                    assignments = IssueUser.objects.filter(issue__project=project, user_id__in=assigned_ids)
+                    issues = project.issues.only('id', 'num', 'status', 'project').in_bulk()
+                    pairs = [(issues[issue_id], user_id) for issue_id, user_id in assignments.values_list('issue_id', 'user_id')]
+                    assignments.delete()
+                    publish_assignments(False, pairs)
+
+                # The bulk queries above don't send m2m_changed, so invalidate the project's pages here,
+                # as the assignment events are published above for the pairs actually added or removed.
+                bump_versions(('project', project.id))
 
         users_str = get_users_str(username_list)
 
@@ -398,18 +633,148 @@ class ProjectAssignView(LoginRequiredMixin, UserPassesTestMixin, View):
 
 
 class MyIssuesView(LoginRequiredMixin, View):
-    """Display all issues that have been assigned to the current user."""
+    """Display all issues that have been assigned to the current user. The table rows are loaded from MyIssuesTableView."""
     template_name = 'issues/my_issues.html'
 
     def get(self, request, *args, **kwargs):
-        assigned_issues = self.request.user.assigned_issues.all()
+        issue_counts = get_issue_counts(self.request.user.assigned_issues.order_by())
         context = {
-            'issues': assigned_issues
+            'has_issues': issue_counts['total'] > 0,
+            'issue_counts': issue_counts,
+            'events_enabled': events.is_enabled()
         }
         return render(request, self.template_name, context)
 
 
-class IssueCreateView(LoginRequiredMixin, CreateView):
+class MyIssuesTableView(LoginRequiredMixin, DataTableView):
+    """Serve pages of the current user's issues table for MyIssuesView."""
+    columns = [
+        ('num', 'num'),
+        ('title', 'title'),
+        ('project', 'project__title'),
+        ('submitter', 'submitter__username'),
+        ('assignee', 'assignee__username'),
+        ('date_created', 'date_created'),
+        ('options', None)
+    ]
+    search_fields = ['title', 'tag', 'project__title', 'submitter__username', 'assignee__username']
+
+    def get_queryset(self):
+        # Only the columns shown in the table are loaded.
+        return self.request.user.assigned_issues.select_related('project', 'submitter', 'assignee').only(
+            'num', 'title', 'date_created', 'project__title', 'project__slug', 'submitter__username', 'assignee__username'
+        )
+
+    def get_row(self, issue):
+        url_kwargs = {'project_slug': issue.project.slug, 'issue_num': issue.num}
+        links = [(reverse('issues:issue-detail', kwargs=url_kwargs), 'View details')]
+        if self.request.permissions.is_admin_or_manager:
+            links.append((reverse('issues:issue-assign', kwargs=url_kwargs), 'Assign users'))
+        return {
+            'num': issue.num,
+            'title': escape(issue.title),
+            'project': escape(issue.project.title),
+            'submitter': escape(issue.submitter),
+            'assignee': escape(issue.assignee),
+            'date_created': format_datetime(issue.date_created),
+            'options': options_list(links)
+        }
+
+
+class StreamingUploadMixin:
+    """Write new attachments to storage while the request is received, instead of buffering them first.
+
+    The upload handler has to be installed before anything reads request.POST, which
+    CsrfViewMiddleware does, so the CSRF check is made here instead. Streamed files that aren't made
+    into attachments, because the form was invalid or the user is the demo user, are deleted again.
+
+    Place the mixin first, so its dispatch() is the view's, but the access checks of the mixins after
+    it are made first all the same: a request they refuse is refused before its body is read.
+    """
+
+    def may_upload(self):
+        if not self.request.user.is_authenticated:
+            return False
+        return not isinstance(self, UserPassesTestMixin) or self.get_test_func()()
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        if request.method == 'POST' and not self.may_upload():
+            # The access mixins refuse it without reading the body, and so without a CSRF check.
+            return super().dispatch(request, *args, **kwargs)
+        if settings.ATTACHMENT_STREAMING_UPLOADS and request.method == 'POST':
+            request.upload_handlers.insert(0, StreamingUploadHandler(
+                request, {'new_attachments'}, attachments.get_storage(), attachments.upload_name
+            ))
+        try:
+            return csrf_protect(super().dispatch)(request, *args, **kwargs)
+        finally:
+            discard_unused_uploads(request)
+
+
+class AttachmentUploadView(LoginRequiredMixin, View):
+    """Return where the browser can upload an attachment to directly, and the key to send the issue form.
+
+    If the browser sends the file's SHA-256, and the same file is already attached to an issue the user
+    can see, only the key is returned and the file needn't be uploaded at all.
+    """
+
+    def post(self, request, *args, **kwargs):
+        if not settings.ATTACHMENT_DIRECT_UPLOADS:
+            raise Http404('Direct uploads are disabled.')
+        if self.request.user.email == 'demo@ex.com':
+            return JsonResponse({'error': 'The demo user cannot upload attachments.'}, status=403)
+        file_name = request.POST.get('file-name', '')
+        content_type = request.POST.get('content-type', '')
+        if not file_name or not content_type.startswith('image/'):
+            return JsonResponse({'error': 'Only images can be attached.'}, status=400)
+        try:
+            size = int(request.POST.get('size', ''))
+        except ValueError:
+            return JsonResponse({'error': 'The file size is missing.'}, status=400)
+        if size > settings.ATTACHMENT_MAX_UPLOAD_SIZE:
+            return JsonResponse({'error': 'The attachment is too large.'}, status=400)
+
+        sha256 = request.POST.get('sha256', '').lower()
+        if sha256:
+            existing = Attachment.objects.filter(sha256=sha256, size=size)
+            # Knowing a file's hash mustn't be enough to get hold of it.
+            if not request.permissions.is_admin:
+                existing = existing.filter(uses__issue__project_id__in=request.permissions.project_ids)
+            attachment_id = existing.values_list('id', flat=True).first()
+            if attachment_id is not None:
+                key = sign_direct_upload({'attachment': attachment_id, 'file_name': file_name})
+                return JsonResponse({'key': key}, status=200)
+
+        name = attachments.upload_name(file_name)
+        upload = presigned_post(attachments.get_storage(), name, content_type, settings.ATTACHMENT_MAX_UPLOAD_SIZE)
+        key = sign_direct_upload({'name': name, 'file_name': file_name, 'content_type': content_type})
+        return JsonResponse({'url': upload['url'], 'fields': upload['fields'], 'key': key}, status=200)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class DirectUploadView(View):
+    """Receive direct uploads for storage_backends.LocalMediaStorage, checking its policies as S3 checks its own."""
+
+    def post(self, request, *args, **kwargs):
+        if not hasattr(default_storage, 'check_policy'):
+            raise Http404('The storage takes direct uploads itself.')
+        conditions = default_storage.check_policy(request.POST.get('policy', ''))
+        upload = request.FILES.get('file')
+        if conditions is None or upload is None:
+            return HttpResponse(status=403)
+        if (
+            request.POST.get('key') != conditions['key']
+            or request.POST.get('Content-Type') != conditions['content_type']
+            or not 0 < upload.size <= conditions['max_size']
+            or default_storage.exists(conditions['key'])
+        ):
+            return HttpResponse(status=400)
+        default_storage.save(conditions['key'], upload)
+        return HttpResponse(status=204)
+
+
+class IssueCreateView(StreamingUploadMixin, LoginRequiredMixin, CreateView):
     template_name = 'issues/issue_create_or_update.html'
     form_class = IssueForm
 
@@ -424,6 +789,7 @@ class IssueCreateView(LoginRequiredMixin, CreateView):
         if self.request.user.email != 'demo@ex.com':
             new_issue.submitter = self.request.user
             new_issue.save()
+            form.save_attachments(new_issue)
 
             # Assign all project managers (group id=2), the submitter, and the assignee to the new issue.
             project_managers = new_issue.project.assigned_users.filter(groups__in=[2])
@@ -445,7 +811,7 @@ class IssueCreateView(LoginRequiredMixin, CreateView):
             return redirect(reverse('issues:my-issues'))
 
 
-class ProjectIssueCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
+class ProjectIssueCreateView(StreamingUploadMixin, LoginRequiredMixin, UserPassesTestMixin, CreateView):
     template_name = 'issues/issue_create_or_update.html'
     model = Issue
     form_class = ProjectIssueForm
@@ -454,13 +820,12 @@ class ProjectIssueCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView
     }
 
     def test_func(self):
-        Admin_access = self.request.user.groups.filter(name='Admin').exists()
-        assigned_user_access = True if self.request.user in self.get_project_object().assigned_users.all() else False
-        return Admin_access or assigned_user_access
+        return self.request.permissions.can_view_project(self.get_project_object())
 
     def get_project_object(self):
-        slug_ = self.kwargs.get('slug')
-        return get_object_or_404(Project, slug=slug_)
+        if not hasattr(self, '_project'):
+            self._project = get_object_or_404(Project, slug=self.kwargs.get('slug'))
+        return self._project
 
     def get(self, request, *args, **kwargs):
         self.context['project'] = self.get_project_object()
@@ -473,6 +838,7 @@ class ProjectIssueCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView
             new_issue.submitter = self.request.user
             new_issue.project = project
             new_issue.save()
+            form.save_attachments(new_issue)
 
             # Assign all project managers (group id=2), the submitter, and the assignee to the new issue.
             project_managers = project.assigned_users.filter(groups__in=[2])
@@ -494,24 +860,13 @@ class ProjectIssueCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView
             return redirect(reverse('issues:project-detail', kwargs={'slug': project.slug}))
             
 
-class IssueUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class IssueUpdateView(StreamingUploadMixin, LoginRequiredMixin, ProjectIssueMixin, UserPassesTestMixin, UpdateView):
     template_name = 'issues/issue_create_or_update.html'
     form_class = ProjectIssueForm
 
     def test_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        project_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_project_object().assigned_users.all())
-        assigned_user_access = True if self.request.user in self.get_object().assigned_users.all() else False
-        return admin_access or project_manager_access or assigned_user_access
+        return self.request.permissions.can_edit_issue(self.get_object())
 
-    def get_object(self):
-        issue_num = self.kwargs.get('issue_num')
-        return get_object_or_404(Issue, num=issue_num, project=self.get_project_object().id)
-    
-    def get_project_object(self):
-        slug_ = self.kwargs.get('project_slug')
-        return get_object_or_404(Project, slug=slug_)
-    
     def get(self, request, *args, **kwargs):
         issue = self.get_object()
         f = self.form_class(instance=issue)
@@ -529,55 +884,124 @@ class IssueUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
                 # Unassign all users from the issue, so that their my-issues page isn't cluttered.
                 issue.assigned_users.clear()
             issue.save()
+            form.save_attachments(issue)
         messages.success(self.request, f"Issue #{issue.num} has been successfully updated.")
         return redirect(reverse('issues:issue-detail', kwargs={'project_slug': self.get_project_object().slug, 'issue_num': issue.num}))
 
 
-class IssueDetailView(LoginRequiredMixin, DetailView):
+class IssueDetailView(LoginRequiredMixin, ProjectIssueMixin, ConditionalGetMixin, DetailView):
     template_name = 'issues/issue_detail.html'
     comment_form = CommentForm
     reply_form = ReplyForm
+    comments_per_page = 25
+
+    def get_comment_stats(self):
+        """Count the issue's comments and replies, and find when they were last changed, in one query."""
+        if not hasattr(self, '_comment_stats'):
+            self._comment_stats = self.get_object().comments.aggregate(
+                comments=Count('id', distinct=True),
+                replies=Count('replies'),
+                comment_updated=Max('date_updated'),
+                reply_updated=Max('replies__date_updated')
+            )
+        return self._comment_stats
+
+    def get_etag_parts(self):
+        # The counts catch deletions, which leave no timestamp behind. As for projects, assignments and
+        # user details are only tracked by the cache versions.
+        issue = self.get_object()
+        versions = get_versions(*issue_scopes(issue.project_id, issue.id))
+        if None in versions:
+            return None
+        stats = self.get_comment_stats()
+        return [
+            issue.id, issue.date_updated, issue.project.title, stats['comments'], stats['replies'],
+            stats['comment_updated'], stats['reply_updated'], *versions
+        ]
 
-    def get_object(self):
-        issue_num = self.kwargs.get('issue_num')
-        return get_object_or_404(Issue, num=issue_num, project=self.get_project_object().id)
-    
-    def get_project_object(self):
-        slug_ = self.kwargs.get('project_slug')
-        return get_object_or_404(Project, slug=slug_)
-    
     def get(self, request, *args, **kwargs):
         issue = self.get_object()
-        issue_user_list = issue.assigned_users.all()
-        comments = issue.comments.all().order_by('-date_created')
-        replies = [Reply.objects.filter(comment=comment).order_by('date_created') for comment in comments]
+        issue_user_list = with_group_name(issue.assigned_users.all())
+        # Load a page of the thread up front; the template then walks comment.replies without further queries.
+        paginator = get_comment_paginator(issue, self.comments_per_page)
+        cursor = request.GET.get('cursor')
+        scopes = issue_scopes(issue.project_id, issue.id)
+        try:
+            # The page is cached until the issue, its comments or the users shown change.
+            comments = get_or_set('issue-comments', scopes, lambda: paginator.get_page(cursor), cursor)
+        except InvalidCursor:
+            raise Http404('Invalid comment page.')
         context = {
-            'issue': self.get_object(),
+            'issue': issue,
             'issue_user_list': issue_user_list,
             'comment_form': self.comment_form,
             'reply_form': self.reply_form,
             'comments': comments,
-            'replies': replies
+            'users_cache_key': versioned_key('issue-users', scopes),
+            'cache_timeout': CACHE_TIMEOUT,
+            'attachments': get_attachments(issue),
+            'events_enabled': events.is_enabled()
         }
+        # The newest page fetches comments posted after it was loaded from CommentsSinceView.
+        if not comments.has_previous():
+            context['comments_since'] = paginator.make_cursor(comments[0], 'previous') if comments else ''
         return render(request, self.template_name, context)
-    
 
-class IssueDeleteView(LoginRequiredMixin, UserPassesTestMixin, View):
 
-    def test_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        project_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_project_object().assigned_users.all())
-        assigned_user_access = True if self.request.user in self.get_object().assigned_users.all() else False
-        return admin_access or project_manager_access or assigned_user_access
+class CommentsSinceView(AsyncViewMixin, LoginRequiredMixin, ProjectIssueMixin, View):
+    """Return the comments posted to an issue since a page of its thread was loaded, rendered as on the page.
+
+    'since' is the cursor the page was given, or empty if it showed no comments. The response holds
+    the comments newest first, and the cursor to send next time. At most a page of comments is sent
+    at once, starting from the oldest, and 'more' says whether newer ones are left to fetch.
+    """
+
+    def get(self, request, *args, **kwargs):
+        paginator = get_comment_paginator(self.get_issue_object(), IssueDetailView.comments_per_page)
+        cursor = request.GET.get('since')
+        try:
+            if cursor and paginator.read_cursor(cursor)[1] != 'previous':
+                raise InvalidCursor('The cursor does not point to newer comments.')
+            page = paginator.get_page(cursor)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse({
+            'comments': [
+                {'id': comment.id, 'html': render_comment_thread(request, comment, comment.replies.all())}
+                for comment in page
+            ],
+            'since': paginator.make_cursor(page[0], 'previous') if page else (cursor or ''),
+            'more': bool(cursor) and page.has_previous()
+        })
     
-    def get_object(self):
-        issue_num = self.kwargs.get('issue_num')
-        return get_object_or_404(Issue, num=issue_num, project=self.get_project_object().id)
 
-    def get_project_object(self):
-        slug_ = self.kwargs.get('project_slug')
-        return get_object_or_404(Project, slug=slug_)
+class CommentThreadView(AsyncViewMixin, LoginRequiredMixin, ProjectIssueMixin, View):
+    """Return a comment of the issue with its replies, rendered as in the thread, for pages to refresh it in place."""
+
+    def get(self, request, *args, **kwargs):
+        comment = get_object_or_404(
+            Comment.objects.select_related('author'), id=request.GET.get('comment-id'), issue=self.get_issue_object()
+        )
+        replies = comment.replies.select_related('author')
+        return JsonResponse({'id': comment.id, 'html': render_comment_thread(request, comment, replies)})
+
+
+class EventStreamView(View):
+    """The path of the issue activity stream, which tracker.asgi serves itself (see events.EventStreamApp).
+
+    Under WSGI, a stream would hold a worker for as long as it was open, so pages don't open one, and
+    a browser that asks anyway is told there's no content, which stops it reconnecting.
+    """
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(status=204)
+
 
+class IssueDeleteView(LoginRequiredMixin, ProjectIssueMixin, UserPassesTestMixin, View):
+
+    def test_func(self):
+        return self.request.permissions.can_edit_issue(self.get_object())
+    
     def post(self, request, *args, **kwargs):
         issue = self.get_object()
         issue_num = issue.num
@@ -587,27 +1011,17 @@ class IssueDeleteView(LoginRequiredMixin, UserPassesTestMixin, View):
         return redirect(reverse('issues:project-detail', kwargs={'slug': issue.project.slug}))
 
 
-class IssueAssignView(LoginRequiredMixin, UserPassesTestMixin, FormView):
+class IssueAssignView(LoginRequiredMixin, ProjectIssueMixin, UserPassesTestMixin, FormView):
     template_name = 'issues/issue_assign.html'
 
     def test_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        assigned_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_project_object().assigned_users.all())
-        return admin_access or assigned_manager_access
+        return self.request.permissions.can_manage_project(self.get_project_object())
 
-    def get_project_object(self):
-        slug_ = self.kwargs.get('project_slug')
-        return get_object_or_404(Project, slug=slug_)
-    
-    def get_issue_object(self):
-        issue_num = self.kwargs.get('issue_num')
-        return get_object_or_404(Issue, num=issue_num, project=self.get_project_object().id)
-    
     def get(self, request, *args, **kwargs):
         project = self.get_project_object()
         issue = self.get_issue_object()
-        issue_user_list = issue.assigned_users.all()
-        project_user_list = project.assigned_users.all()
+        issue_user_list = with_group_name(issue.assigned_users.all())
+        project_user_list = with_group_name(project.assigned_users.all())
         context = {
             'issue': issue,
             'issue_user_list': issue_user_list,
@@ -616,24 +1030,22 @@ class IssueAssignView(LoginRequiredMixin, UserPassesTestMixin, FormView):
         return render(request, self.template_name, context)
     
     def post(self, request, *args, **kwargs):
-        user_ids = request.POST.getlist('selection')
         project = self.get_project_object()
         issue = self.get_issue_object()
         action = request.POST.get('action')
-        username_list = []
-        for user_id in user_ids:
-            # Get list of names to display in success message.
-            user = get_object_or_404(User, id=user_id)
-            username = f"{user.username}"
-            username_list.append(username)
+        users = get_selected_users(request.POST.getlist('selection'))
+        # Get list of names to display in success message.
+        username_list = [f"{user.username}" for user in users]
 
-            if action == 'assign' and not user in issue.assigned_users.all() and self.request.user.email != 'demo@ex.com':
-                issue.assigned_users.add(user)
-                if not user in project.assigned_users.all():
-                    project.assigned_users.add(user)
-
-            elif action == 'unassign' and user in issue.assigned_users.all() and self.request.user.email != 'demo@ex.com':
-                issue.assigned_users.remove(user)
+        if self.request.user.email != 'demo@ex.com':
+            # add() and remove() skip existing or missing memberships themselves, in one query per relation.
+            with transaction.atomic():
+                if action == 'assign':
+                    issue.assigned_users.add(*users)
+                    project.assigned_users.add(*users)
+                elif action == 'unassign':
+                    issue.assigned_users.remove(*users)
+                bump_versions(('project', project.id), ('issue', issue.id))
 
         users_str = get_users_str(username_list)
         if action == 'assign':
@@ -644,35 +1056,27 @@ class IssueAssignView(LoginRequiredMixin, UserPassesTestMixin, FormView):
         return redirect(reverse('issues:issue-assign', kwargs={'project_slug': project.slug, 'issue_num': issue.num}))
 
 
-class CommentCreateView(LoginRequiredMixin, View):
+class CommentCreateView(AsyncViewMixin, LoginRequiredMixin, ProjectIssueMixin, View):
+    """Create a comment, and return it rendered for adding to the top of the thread."""
     form_class = CommentForm
 
     def access_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        project_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_project_object().assigned_users.all())
-        assigned_user_access = True if self.request.user in self.get_issue_object().assigned_users.all() else False
-        return admin_access or project_manager_access or assigned_user_access
-    
-    def get_project_object(self):
-        slug_ = self.kwargs.get('project_slug')
-        return get_object_or_404(Project, slug=slug_)
-    
-    def get_issue_object(self):
-        issue_num = self.kwargs.get('issue_num')
-        return get_object_or_404(Issue, num=issue_num, project=self.get_project_object().id)
+        return self.request.permissions.can_edit_issue(self.get_issue_object())
     
     def post(self, request, *args, **kwargs):
         if self.access_func() == False:
             return JsonResponse({'error': 'Only users assigned to this issue can leave comments.'}, status=403)
         elif request.is_ajax:
             form = self.form_class(request.POST)
-            if form.is_valid:
+            if form.is_valid():
                 if self.request.user.email != 'demo@ex.com':
                     issue = self.get_issue_object()
                     new_comment = form.save(commit=False)
                     new_comment.author = request.user
                     new_comment.issue = issue
                     new_comment.save()
+                    html = render_comment_thread(request, new_comment, [])
+                    return JsonResponse({'id': new_comment.id, 'html': html}, status=200)
                 return JsonResponse({}, status=200)
             else:
                 return JsonResponse({'error': form.errors}, status=400)
@@ -680,26 +1084,26 @@ class CommentCreateView(LoginRequiredMixin, View):
             return JsonResponse({'error': 'Error: Request is not AJAX'}, status=400)
 
 
-class CommentUpdateView(LoginRequiredMixin, View):
+class CommentPostMixin:
+    """Look up the comment named by the 'comment-id' POST parameter once, for both the access check and the handler."""
+
+    def get_comment(self):
+        if not hasattr(self, '_comment'):
+            self._comment = get_object_or_404(Comment.objects.select_related('author'), id=self.request.POST.get('comment-id'))
+        return self._comment
+
+    def render_comment(self):
+        comment = self.get_comment()
+        html = render_to_string('issues/comment.html', {'comment': comment}, request=self.request)
+        return JsonResponse({'id': comment.id, 'html': html}, status=200)
+
+
+class CommentUpdateView(AsyncViewMixin, LoginRequiredMixin, ProjectIssueMixin, CommentPostMixin, View):
+    """Update a comment, and return it rendered for replacing the old one on the page."""
     form_class = CommentForm
 
     def access_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        project_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_project_object().assigned_users.all())
-        
-        comment_id = self.request.POST.get('comment-id')
-        comment_author = Comment.objects.get(id=comment_id).author
-        author_access = True if self.request.user == comment_author else False
-
-        return admin_access or project_manager_access or author_access
-    
-    def get_project_object(self):
-        slug_ = self.kwargs.get('project_slug')
-        return get_object_or_404(Project, slug=slug_)
-    
-    def get_issue_object(self):
-        issue_num = self.kwargs.get('issue_num')
-        return get_object_or_404(Issue, num=issue_num, project=self.get_project_object().id)
+        return self.request.permissions.can_edit_post(self.get_comment(), self.get_project_object())
     
     def post(self, request, *args, **kwargs):
         if self.access_func() == False:
@@ -707,82 +1111,57 @@ class CommentUpdateView(LoginRequiredMixin, View):
         elif request.is_ajax:
             # Construct a form instance from the posted data to validate the updated comment.
             updated_text = request.POST.get('updated-text')
-            comment_id = request.POST.get('comment-id')
-            comment = get_object_or_404(Comment, id=comment_id)
-            form = self.form_class({'text': updated_text}, instance=comment)
-            if form.is_valid:
+            form = self.form_class({'text': updated_text}, instance=self.get_comment())
+            if form.is_valid():
                 if self.request.user.email != 'demo@ex.com':
                     form.save()
-                return JsonResponse({}, status=200)
+                return self.render_comment()
             else:
                 return JsonResponse({'error': form.errors}, status=400)
         else:
             return JsonResponse({'error': 'Error: Request is not AJAX'}, status=400)
 
 
-class CommentDeleteView(LoginRequiredMixin, View):
+class CommentDeleteView(AsyncViewMixin, LoginRequiredMixin, ProjectIssueMixin, CommentPostMixin, View):
+    """Blank out a comment, keeping its replies, and return it rendered for replacing the old one on the page."""
     
     def access_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        project_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_project_object().assigned_users.all())
-
-        comment_id = self.request.POST.get('comment-id')
-        comment_author = Comment.objects.get(id=comment_id).author
-        author_access = True if self.request.user == comment_author else False
-
-        return admin_access or project_manager_access or author_access
-    
-    def get_project_object(self):
-        slug_ = self.kwargs.get('project_slug')
-        return get_object_or_404(Project, slug=slug_)
-    
-    def get_issue_object(self):
-        issue_num = self.kwargs.get('issue_num')
-        return get_object_or_404(Issue, num=issue_num, project=self.get_project_object().id)
+        return self.request.permissions.can_edit_post(self.get_comment(), self.get_project_object())
     
     def post(self, request, *args, **kwargs):
         if self.access_func() == False:
             return JsonResponse({'error': 'Only Admins, Project Managers, and comment authors may delete comments.'}, status=403)
         elif request.is_ajax:
             if self.request.user.email != 'demo@ex.com':
-                comment_id = request.POST.get('comment-id')
-                comment = get_object_or_404(Comment, id=comment_id)
+                comment = self.get_comment()
                 comment.text = "[deleted]"
                 comment.save()
-            return JsonResponse({}, status=200)
+            return self.render_comment()
         else:
             return JsonResponse({'error': 'Error: Request is not AJAX'}, status=400)
 
 
-class ReplyCreateView(LoginRequiredMixin, View):
+class ReplyCreateView(AsyncViewMixin, LoginRequiredMixin, ProjectIssueMixin, View):
+    """Create a reply, and return it rendered for adding to the end of its comment's replies."""
     form_class = ReplyForm
 
     def access_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        project_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_project_object().assigned_users.all())
-        assigned_user_access = True if self.request.user in self.get_issue_object().assigned_users.all() else False
-        return admin_access or project_manager_access or assigned_user_access
+        return self.request.permissions.can_edit_issue(self.get_issue_object())
 
-    def get_project_object(self):
-        slug_ = self.kwargs.get('project_slug')
-        return get_object_or_404(Project, slug=slug_)
-    
-    def get_issue_object(self):
-        issue_num = self.kwargs.get('issue_num')
-        return get_object_or_404(Issue, num=issue_num, project=self.get_project_object().id)
-    
     def post(self, request, *args, **kwargs):
         if self.access_func() == False:
             return JsonResponse({'error': 'Only users assigned to this issue can leave comments.'}, status=403)
         elif request.is_ajax:
             form = self.form_class(request.POST)
-            if form.is_valid:
+            if form.is_valid():
                 if self.request.user.email != 'demo@ex.com':
                     comment_id = request.POST.get("comment-id")
                     new_reply = form.save(commit=False)
                     new_reply.author = request.user
-                    new_reply.comment = get_object_or_404(Comment, id=comment_id)
+                    new_reply.comment = get_object_or_404(Comment.objects.only('issue'), id=comment_id)
                     new_reply.save()
+                    html = render_to_string('issues/reply.html', {'reply': new_reply}, request=request)
+                    return JsonResponse({'id': new_reply.id, 'comment_id': new_reply.comment_id, 'html': html}, status=200)
                 return JsonResponse({}, status=200)
             else:
                 return JsonResponse({'error': form.errors}, status=400)
@@ -790,60 +1169,48 @@ class ReplyCreateView(LoginRequiredMixin, View):
             return JsonResponse({'error': 'Error: Request is not AJAX'}, status=400)
 
 
-class ReplyDeleteView(LoginRequiredMixin, View):
-    
-    def access_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        project_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_project_object().assigned_users.all())
-        
-        reply_id = self.request.POST.get('reply-id')
-        reply_author = Reply.objects.get(id=reply_id).author
-        author_access = True if self.request.user == reply_author else False
+class ReplyPostMixin:
+    """Look up the reply named by the 'reply-id' POST parameter once, for both the access check and the handler."""
 
-        return admin_access or project_manager_access or author_access
-    
-    def get_project_object(self):
-        slug_ = self.kwargs.get('project_slug')
-        return get_object_or_404(Project, slug=slug_)
+    def get_reply(self):
+        if not hasattr(self, '_reply'):
+            self._reply = get_object_or_404(
+                Reply.objects.select_related('author', 'comment'),
+                id=self.request.POST.get('reply-id')
+            )
+        return self._reply
+
+    def render_reply(self):
+        reply = self.get_reply()
+        html = render_to_string('issues/reply.html', {'reply': reply}, request=self.request)
+        return JsonResponse({'id': reply.id, 'comment_id': reply.comment_id, 'html': html}, status=200)
+
+
+class ReplyDeleteView(AsyncViewMixin, LoginRequiredMixin, ProjectIssueMixin, ReplyPostMixin, View):
+    """Blank out a reply, and return it rendered for replacing the old one on the page."""
     
-    def get_issue_object(self):
-        issue_num = self.kwargs.get('issue_num')
-        return get_object_or_404(Issue, num=issue_num, project=self.get_project_object().id)
+    def access_func(self):
+        return self.request.permissions.can_edit_post(self.get_reply(), self.get_project_object())
     
     def post(self, request, *args, **kwargs):
         if self.access_func() == False:
             return JsonResponse({'error': 'Only Admins, Project Managers, and comment authors may delete comments.'}, status=403)
         elif request.is_ajax:
             if self.request.user.email != 'demo@ex.com':
-                reply_id = request.POST.get('reply-id')
-                reply = get_object_or_404(Reply, id=reply_id)
+                reply = self.get_reply()
                 reply.text = "[deleted]"
                 reply.save()
-            return JsonResponse({}, status=200)
+            return self.render_reply()
         else:
             return JsonResponse({'error': 'Error: Request is not AJAX'}, status=400)
 
 
-class ReplyUpdateView(LoginRequiredMixin, View):
+class ReplyUpdateView(AsyncViewMixin, LoginRequiredMixin, ProjectIssueMixin, ReplyPostMixin, View):
+    """Update a reply, and return it rendered for replacing the old one on the page."""
     form_class = ReplyForm
 
     def access_func(self):
-        admin_access = self.request.user.groups.filter(name='Admin').exists()
-        project_manager_access = self.request.user.groups.filter(name='Project Manager').exists() and (self.request.user in self.get_project_object().assigned_users.all())
-
-        reply_id = self.request.POST.get('reply-id')
-        reply_author = Reply.objects.get(id=reply_id).author
-        author_access = True if self.request.user == reply_author else False
-
-        return admin_access or project_manager_access or author_access
-    
-    def get_project_object(self):
-        slug_ = self.kwargs.get('project_slug')
-        return get_object_or_404(Project, slug=slug_)
-    
-    def get_issue_object(self):
-        issue_num = self.kwargs.get('issue_num')
-        return get_object_or_404(Issue, num=issue_num, project=self.get_project_object().id)
+        return self.request.permissions.can_edit_post(self.get_reply(), self.get_project_object())
     
     def post(self, request, *args, **kwargs):
         if self.access_func() == False:
@@ -851,19 +1218,53 @@ class ReplyUpdateView(LoginRequiredMixin, View):
         elif request.is_ajax:
             # Construct a form instance from the posted data to validate the updated reply.
             updated_text = request.POST.get('updated-text')
-            reply_id = request.POST.get('reply-id')
-            reply = get_object_or_404(Reply, id=reply_id)
-            form = self.form_class({'text': updated_text}, instance=reply)
-            if form.is_valid:
+            form = self.form_class({'text': updated_text}, instance=self.get_reply())
+            if form.is_valid():
                 if self.request.user.email != 'demo@ex.com':
                     form.save()
-                return JsonResponse({}, status=200)
+                return self.render_reply()
             else:
                 return JsonResponse({'error': form.errors}, status=400)
         else:
             return JsonResponse({'error': 'Error: Request is not AJAX'}, status=400)
 
 
+class SearchView(LoginRequiredMixin, View):
+    """Search the issues, comments and replies of the projects the user can see."""
+    template_name = 'issues/search.html'
+    per_page = 20
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '').strip()
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+
+        results = []
+        has_next = False
+        if query:
+            documents = search(query, request.permissions).select_related(
+                'issue__project', 'comment__author', 'reply__author'
+            )
+            # One extra row tells whether there's a next page, without counting every match.
+            offset = (page - 1) * self.per_page
+            results = list(documents[offset:offset + self.per_page + 1])
+            has_next = len(results) > self.per_page
+            results = results[:self.per_page]
+            for document in results:
+                document.excerpt = excerpt(document.body, query)
+
+        context = {
+            'query': query,
+            'results': results,
+            'page': page,
+            'has_next': has_next,
+            'has_previous': page > 1
+        }
+        return render(request, self.template_name, context)
+
+
 class MyProfileView(LoginRequiredMixin, UserPassesTestMixin, View):
     template_name = 'issues/my_profile.html'
 
@@ -876,7 +1277,7 @@ class MyProfileView(LoginRequiredMixin, UserPassesTestMixin, View):
 
     def get(self, request, *args, **kwargs):
         context = {
-            'user': self.get_user_object,
+            'user': self.get_user_object(),
             'user_type': 'std-user'
         }
         return render(request, self.template_name, context)
@@ -0,0 +1,215 @@
+// The comment thread of the issue detail page. The page gives the URLs of the issue's endpoints as
+// data attributes of #issue-detail.
+var issue_urls = $("#issue-detail").data();
+
+// Comment and reply actions return the affected item rendered, which replaces or is added to the
+// thread in place, so the page is never reloaded.
+
+// Send an ajax request to create and display a new comment.
+$("#top-comment-form").submit(function (event) {
+  // Prevent the page from reloading and performing the default actions.
+  event.preventDefault();
+  // Create a POST ajax call
+  $.ajax({
+    type: "POST",
+    url: issue_urls.commentCreateUrl,
+    data: $("#top-comment-form").serialize(),
+    success: function (data) {
+      $("#top-comment-form").trigger("reset");
+      // Only the newest page of the thread shows new comments.
+      if (data.html && $("#comment-threads").attr("data-since-url")) {
+        $("#comment-threads").children(".empty-msg").remove();
+        $("#comment-threads").prepend(data.html);
+      }
+    },
+    error: function (data) {
+      alert(data.responseJSON["error"]);
+    }
+  })
+});
+
+// Fetch comments that other users have posted since the thread was loaded, and add them to the top.
+function load_new_comments() {
+  var threads = $("#comment-threads");
+  $.get(threads.attr("data-since-url"), {since: threads.attr("data-since")}, function (data) {
+    threads.attr("data-since", data.since);
+    if (data.comments.length) {
+      threads.children(".empty-msg").remove();
+    }
+    // The comments come newest first, so add them oldest first. The user's own are already shown.
+    $.each(data.comments.reverse(), function (i, comment) {
+      if (!$("#comment-thread-" + comment.id).length) {
+        threads.prepend(comment.html);
+      }
+    });
+    if (data.more) {
+      load_new_comments();
+    }
+  });
+};
+
+// Replace a comment's thread with its current version, when it or one of its replies has changed.
+function reload_comment_thread(id) {
+  var thread = $("#comment-thread-" + id);
+  if (!thread.length) {
+    return;
+  }
+  $.get(issue_urls.commentThreadUrl, {"comment-id": id}, function (data) {
+    thread.replaceWith(data.html);
+  });
+};
+
+// Under ASGI, activity on the issue is pushed to the page as it happens. The stream is reopened by
+// the browser whenever it drops, and new comments are fetched then, in case any were missed in
+// between. Otherwise the page polls for new comments.
+if (window.EventSource && issue_urls.eventsUrl) {
+  var issue_events = new EventSource(issue_urls.eventsUrl);
+  if ($("#comment-threads").attr("data-since-url")) {
+    issue_events.addEventListener("open", load_new_comments);
+    issue_events.addEventListener("comment.created", load_new_comments);
+  }
+  $.each(["comment.updated", "reply.created", "reply.updated"], function (i, type) {
+    issue_events.addEventListener(type, function (event) {
+      reload_comment_thread(JSON.parse(event.data).comment);
+    });
+  });
+  $.each(["issue.updated", "issue.closed", "issue.assigned", "issue.unassigned"], function (i, type) {
+    issue_events.addEventListener(type, function () {
+      $("#issue-changed").removeClass("d-none");
+    });
+  });
+} else if ($("#comment-threads").attr("data-since-url")) {
+  setInterval(function () {
+    if (!document.hidden) {
+      load_new_comments();
+    }
+  }, 30000);
+}
+
+// Send ajax request to update a comment.
+function update_comment(id) {
+  $.ajax({
+    type: "POST",
+    url: issue_urls.commentUpdateUrl,
+    data: $("#comment-form-" + id).serialize(),
+    success: function (data) {
+      $("#comment-item-" + id).replaceWith(data.html);
+    },
+    error: function (data) {
+      alert(data.responseJSON["error"]);
+    }
+  })
+};
+
+// Send ajax request to create and display a new reply. Reply forms can be added to the page
+// with new comments, so the handler is attached to the document.
+$(document).on("submit", ".new-reply-form", function (event) {
+  // Prevent the page from reloading and performing the default actions.
+  event.preventDefault();
+  var form = $(this);
+  // Create a POST ajax call
+  $.ajax({
+    type: "POST",
+    url: issue_urls.replyCreateUrl,
+    data: form.serialize(),
+    success: function (data) {
+      form.trigger("reset");
+      if (data.html) {
+        $("#replies-" + data.comment_id).append(data.html);
+      }
+      toggle_reply_form(form.find("input[name='comment-id']").val());
+    },
+    error: function (data) {
+      alert(data.responseJSON["error"]);
+    }
+  })
+});
+
+// Send ajax request to update a reply.
+function update_reply(id) {
+  $.ajax({
+    type: "POST",
+    url: issue_urls.replyUpdateUrl,
+    data: $("#reply-form-" + id).serialize(),
+    success: function (data) {
+      $("#reply-item-" + id).replaceWith(data.html);
+    },
+    error: function (data) {
+      alert(data.responseJSON["error"]);
+    }
+  })
+};
+
+// Send ajax request to delete a comment given its id.
+function delete_comment(id) {
+  var con = confirm("Click 'OK' to delete this comment, or click 'Cancel' to go back.");
+  if (con == false) {
+    return false
+  }
+  $.ajax({
+    type: "POST",
+    url: issue_urls.commentDeleteUrl,
+    data: $("#comment-form-" + id).serialize(),
+    success: function (data) {
+      $("#comment-item-" + id).replaceWith(data.html);
+    },
+    error: function (data) {
+      alert(data.responseJSON["error"]);
+    }
+  })
+};
+
+// Send ajax request to delete a reply given its id.
+function delete_reply(id) {
+  var con = confirm("Click 'OK' to delete this comment, or click 'Cancel' to go back.");
+  if (con == false) {
+    return false
+  }
+  $.ajax({
+    type: "POST",
+    url: issue_urls.replyDeleteUrl,
+    data: $("#reply-form-" + id).serialize(),
+    success: function (data) {
+      $("#reply-item-" + id).replaceWith(data.html);
+    },
+    error: function (data) {
+      alert(data.responseJSON["error"]);
+    }
+  })
+};
+
+// Toggle display a form for creating a new reply.
+function toggle_reply_form(id) {
+  var form = $("#new-reply-form-" + id);
+  form.toggle();
+  $("#reply-toggle-" + id).html(form.is(":visible") ? "Cancel" : "Leave a reply");
+};
+
+// Toggle a form and submit button for editing a comment.
+function toggle_comment_edit(id, comment_text) {
+  toggle_edit("comment", id, comment_text);
+};
+
+// Toggle a form and submit button for editing a reply.
+function toggle_reply_edit(id, reply_text) {
+  toggle_edit("reply", id, reply_text);
+};
+
+// Swap the text of a comment or reply for a textarea to edit it in, or back again.
+function toggle_edit(kind, id, text) {
+  var button = $("#edit-" + kind + "-btn-" + id);
+  var container = $("div#" + kind + "-container-" + id);
+  if (button.attr("value") == "Edit") {
+    var editor = $('<div class="comment-text-container" id="' + kind + '-editor-' + id + '"><textarea id="' + kind + '-edit-' + id + '" cols="70" rows="10" name="updated-text"></textarea></div>');
+    editor.find("textarea").val(text);
+    container.hide().after(editor);
+    button.attr("value", "Cancel");
+    $("#" + kind + "-edit-submit-" + id).removeAttr("hidden");
+  }
+  else {
+    $("#" + kind + "-editor-" + id).remove();
+    container.show();
+    button.attr("value", "Edit");
+    $("#" + kind + "-edit-submit-" + id).attr("hidden", true);
+  }
+};
@@ -0,0 +1,15 @@
+// Under ASGI, changes to the user's issues are pushed to the page. The table is refreshed in place;
+// being assigned or unassigned changes the counts too, so the page is reloaded for those.
+if (window.EventSource && $("#my-issues").data("events-url")) {
+  var issue_events = new EventSource($("#my-issues").data("events-url"));
+  $.each(["issue.updated", "issue.closed"], function (i, type) {
+    issue_events.addEventListener(type, function () {
+      $("table.server-side-table").DataTable().ajax.reload(null, false);
+    });
+  });
+  $.each(["issue.assigned", "issue.unassigned"], function (i, type) {
+    issue_events.addEventListener(type, function () {
+      location.reload();
+    });
+  });
+}
@@ -1,5 +1,88 @@
 $(document).ready(function () {
-  $('table.table').DataTable();
+  $('table.table').not('.server-side-table, .issue-counts table').DataTable();
+
+  // Tables with a data source are searched, sorted and paged by the server, one page at a time.
+  $('table.server-side-table').each(function () {
+    // The server describes the page after the one shown. Asking for it with its cursor lets the
+    // server seek straight to those rows rather than counting past every row before them.
+    var next = null;
+    $(this).DataTable({
+      serverSide: true,
+      processing: true,
+      ajax: {
+        url: $(this).data('source'),
+        data: function (params) {
+          if (next && next.start === params.start) {
+            params.cursor = next.cursor;
+          }
+        },
+        dataSrc: function (json) {
+          next = json.next;
+          return json.data;
+        }
+      },
+      columnDefs: [{ targets: '_all', className: 'align-middle' }]
+    });
+  });
+
+  // With direct uploads, the browser sends each attachment straight to storage, and the form is
+  // submitted with the keys they were stored under instead of the files. Files the server already
+  // has, going by their SHA-256, aren't sent at all.
+  function sha256(file) {
+    if (!window.crypto || !crypto.subtle || !file.arrayBuffer) {
+      return $.Deferred().resolve('').promise();
+    }
+    return $.when(file.arrayBuffer().then(function (buffer) {
+      return crypto.subtle.digest('SHA-256', buffer);
+    }).then(function (digest) {
+      return Array.prototype.map.call(new Uint8Array(digest), function (byte) {
+        return ('0' + byte.toString(16)).slice(-2);
+      }).join('');
+    }));
+  }
+
+  function directUpload(file, csrfToken) {
+    return sha256(file).then(function (hash) {
+      return $.post($('#direct-upload').data('url'), {
+        'file-name': file.name,
+        'content-type': file.type,
+        'size': file.size,
+        'sha256': hash,
+        'csrfmiddlewaretoken': csrfToken
+      });
+    }).then(function (upload) {
+      if (!upload.url) {
+        return upload.key;
+      }
+      var data = new FormData();
+      $.each(upload.fields, function (name, value) {
+        data.append(name, value);
+      });
+      // Storage expects the file after the policy fields.
+      data.append('file', file);
+      return $.ajax({ url: upload.url, type: 'POST', data: data, processData: false, contentType: false })
+        .then(function () { return upload.key; });
+    });
+  }
+
+  $('#direct-upload').closest('form').submit(function (e) {
+    var form = this;
+    var input = $(form).find('input[name=new_attachments]')[0];
+    if (!input || !input.files.length) {
+      return true;
+    }
+    e.preventDefault();
+    var csrfToken = $(form).find('input[name=csrfmiddlewaretoken]').val();
+    $.when.apply($, $.map(input.files, function (file) {
+      return directUpload(file, csrfToken);
+    })).then(function () {
+      $(form).find('input[name=attachment_keys]').val(Array.prototype.join.call(arguments, ','));
+      input.value = '';
+      form.submit();
+    }, function (xhr) {
+      alert((xhr && xhr.responseJSON && xhr.responseJSON.error) || 'The attachments could not be uploaded.');
+    });
+  });
 
   // Ensure current user selects a user before assigning or unassigning to a project.
   $('#project-assign-btn, #project-unassign-btn').click(function () {
@@ -1,5 +1,32 @@
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
 from storages.backends.s3boto3 import S3Boto3Storage
 
 class MediaStorage(S3Boto3Storage):
     location = 'media'
-    file_overwrite = False
\ No newline at end of file
+    file_overwrite = False
+
+
+class LocalMediaStorage(FileSystemStorage):
+    """Local stand-in for MediaStorage that also takes direct uploads, as S3 does with presigned POSTs.
+
+    The policy is signed instead of S3's, and checked by DirectUploadView.
+    """
+    policy_salt = 'storage_backends.LocalMediaStorage'
+
+    def presigned_post(self, name, content_type, max_size, expires):
+        policy = signing.dumps({'key': name, 'content_type': content_type, 'max_size': max_size, 'expires': expires}, salt=self.policy_salt)
+        return {
+            'url': reverse('issues:direct-upload'),
+            'fields': {'key': name, 'Content-Type': content_type, 'policy': policy}
+        }
+
+    def check_policy(self, policy):
+        """The conditions of a presigned_post(), or None if the policy is forged or has expired."""
+        try:
+            # The first load checks the signature, so the expiry it reads can be trusted for the second.
+            expires = signing.loads(policy, salt=self.policy_salt)['expires']
+            return signing.loads(policy, salt=self.policy_salt, max_age=expires)
+        except signing.BadSignature:
+            return None
@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.test import AsyncClient, RequestFactory, TransactionTestCase, override_settings
+from django.urls import reverse
+from issues.models import Project, Issue, Comment, Reply
+from issues.permissions import ADMIN_GROUP, UserPermissions
+from issues.views import (
+    CommentsSinceView,
+    CommentCreateView,
+    CommentUpdateView,
+    CommentDeleteView,
+    ReplyCreateView,
+    ReplyUpdateView,
+    ReplyDeleteView
+)
+
+
+def create_issue():
+    # The views run in other threads, with their own database connections, which only see committed
+    # data. So these tests can't use TestCase, and make their own data rather than flushing and
+    # reloading the fixture's content types for every test.
+    test_admin = User.objects.create_user(username='admin1', email='admin1@ex.com', password='test')
+    test_admin.groups.add(Group.objects.create(name=ADMIN_GROUP))
+    User.objects.create_user(username='dev2', email='dev2@ex.com', password='test')
+    project = Project.objects.create(title='Project1', description='A project.')
+    issue = Issue.objects.create(
+        project=project, title='Issue1', description='An issue.', submitter=test_admin,
+        priority=3, status='open', issue_type='bug', tag='test'
+    )
+    Comment.objects.create(issue=issue, author=test_admin, text='A comment.')
+    return issue
+
+
+@override_settings(ASYNC_VIEWS=True)
+class TestAsyncViews(TransactionTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.issue1 = create_issue()
+        self.p1 = self.issue1.project
+        self.test_admin = User.objects.get(username='admin1')
+        self.kwargs = {'project_slug': self.p1.slug, 'issue_num': self.issue1.num}
+
+    def call(self, view_class, data=None, method='post', user=None):
+        view = view_class.as_view()
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        request = getattr(self.factory, method)('/', data or {})
+        request.user = user or self.test_admin
+        request.permissions = UserPermissions(request.user)
+        return async_to_sync(view)(request, **self.kwargs)
+
+    def test_comments(self):
+        response = self.call(CommentCreateView, {'text': 'An async comment.'})
+        self.assertEqual(response.status_code, 200)
+        comment = Comment.objects.get(text='An async comment.')
+        self.assertEqual(comment.author, self.test_admin)
+
+        self.call(CommentUpdateView, {'updated-text': 'An updated comment.', 'comment-id': comment.id})
+        comment.refresh_from_db()
+        self.assertEqual(comment.text, 'An updated comment.')
+
+        self.call(CommentDeleteView, {'comment-id': comment.id})
+        comment.refresh_from_db()
+        self.assertEqual(comment.text, '[deleted]')
+
+    def test_replies(self):
+        comment = Comment.objects.filter(issue=self.issue1).first()
+        response = self.call(ReplyCreateView, {'text': 'An async reply.', 'comment-id': comment.id})
+        self.assertEqual(response.status_code, 200)
+        reply = Reply.objects.get(text='An async reply.')
+        self.assertEqual(reply.comment, comment)
+
+        self.call(ReplyUpdateView, {'updated-text': 'An updated reply.', 'reply-id': reply.id})
+        reply.refresh_from_db()
+        self.assertEqual(reply.text, 'An updated reply.')
+
+        self.call(ReplyDeleteView, {'reply-id': reply.id})
+        reply.refresh_from_db()
+        self.assertEqual(reply.text, '[deleted]')
+
+    def test_comments_since(self):
+        response = self.call(CommentsSinceView, method='get')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('comments', json.loads(response.content))
+
+    def test_access_is_checked(self):
+        response = self.call(CommentCreateView, {'text': 'Anonymous comment.'}, user=AnonymousUser())
+        self.assertEqual(response.status_code, 302)
+        response = self.call(CommentCreateView, {'text': 'Unassigned comment.'}, user=User.objects.get(username='dev2'))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Comment.objects.filter(text__in=['Anonymous comment.', 'Unassigned comment.']).exists())
+
+    @override_settings(ASYNC_VIEWS=False)
+    def test_sync_by_default(self):
+        self.assertFalse(asyncio.iscoroutinefunction(CommentCreateView.as_view()))
+
+
+class TestASGIRequests(TransactionTestCase):
+
+    def setUp(self):
+        self.issue1 = create_issue()
+        self.async_client = AsyncClient()
+        self.async_client.force_login(User.objects.get(username='admin1'))
+
+    async def test_middleware_runs_async(self):
+        url = reverse('issues:comments-since', kwargs={'project_slug': self.issue1.project.slug, 'issue_num': self.issue1.num})
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('A comment.', response.json()['comments'][0]['html'])
@@ -0,0 +1,115 @@
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from issues import attachments
+from issues.models import Attachment, IssueAttachment, Project, Issue
+from PIL import Image
+
+
+def make_image(name='screenshot.png', color=(30, 30, 200)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (200, 100), color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class TestAttachments(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, ATTACHMENT_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client.force_login(user=User.objects.get(username='admin1'))
+        self.p1 = Project.objects.get(title='Project1')
+        self.issue1 = Issue.objects.get(project=self.p1, num=1)
+        self.issue2 = Issue.objects.get(project=self.p1, num=2)
+
+    def update_issue(self, issue, **data):
+        return self.client.post(
+            reverse('issues:issue-update', kwargs={'project_slug': self.p1.slug, 'issue_num': issue.num}),
+            data={
+                'title': issue.title, 'description': issue.description, 'priority': issue.priority,
+                'status': 'open', 'issue_type': issue.issue_type, 'tag': issue.tag, **data
+            }
+        )
+
+    def test_same_file_stored_once(self):
+        self.update_issue(self.issue1, new_attachments=make_image('first.png'))
+        self.update_issue(self.issue2, new_attachments=make_image('second.png'))
+        attachment = Attachment.objects.get()
+        self.assertEqual(attachment.ref_count, 2)
+        self.assertEqual(
+            list(attachment.uses.order_by('issue_id').values_list('name', flat=True)), ['first.png', 'second.png']
+        )
+        directory, file_name = attachment.file.name.rsplit('/', 1)
+        self.assertEqual(default_storage.listdir(directory)[1], [file_name])
+
+    def test_multiple_files(self):
+        self.update_issue(self.issue1, new_attachments=[make_image('blue.png'), make_image('red.png', (200, 30, 30))])
+        self.assertEqual(list(self.issue1.issue_attachments.values_list('name', flat=True)), ['blue.png', 'red.png'])
+        response = self.client.get(reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': 1}))
+        self.assertContains(response, 'blue.png')
+        self.assertContains(response, 'red.png')
+
+    def test_same_file_twice_on_one_issue(self):
+        self.update_issue(self.issue1, new_attachments=make_image())
+        self.update_issue(self.issue1, new_attachments=make_image('again.png'))
+        self.assertEqual(self.issue1.issue_attachments.count(), 1)
+        self.assertEqual(Attachment.objects.get().ref_count, 1)
+
+    def test_remove(self):
+        self.update_issue(self.issue1, new_attachments=make_image())
+        issue_attachment = self.issue1.issue_attachments.get()
+        self.update_issue(self.issue1, remove_attachments=[issue_attachment.id])
+        self.assertFalse(self.issue1.issue_attachments.exists())
+        attachment = Attachment.objects.get()
+        self.assertEqual(attachment.ref_count, 0)
+        self.assertEqual(attachments.collect_garbage(), 1)
+        self.assertFalse(default_storage.exists(attachment.file.name))
+
+    def test_remove_only_own_attachments(self):
+        self.update_issue(self.issue2, new_attachments=make_image())
+        response = self.update_issue(self.issue1, remove_attachments=[self.issue2.issue_attachments.get().id])
+        self.assertIn('remove_attachments', response.context['form'].errors)
+        self.assertTrue(self.issue2.issue_attachments.exists())
+
+    def test_collected_when_issue_deleted(self):
+        self.update_issue(self.issue1, new_attachments=make_image())
+        self.update_issue(self.issue2, new_attachments=make_image())
+        attachment = Attachment.objects.get()
+
+        self.client.post(reverse('issues:issue-delete', kwargs={'project_slug': self.p1.slug, 'issue_num': 1}))
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.ref_count, 1)
+        self.assertEqual(attachments.collect_garbage(), 0)
+        self.assertTrue(default_storage.exists(attachment.file.name))
+
+        self.client.post(reverse('issues:issue-delete', kwargs={'project_slug': self.p1.slug, 'issue_num': 2}))
+        self.assertEqual(attachments.collect_garbage(), 1)
+        self.assertFalse(Attachment.objects.exists())
+        self.assertFalse(default_storage.exists(attachment.file.name))
+
+    def test_collect_command_recounts(self):
+        attachment = attachments.store_upload(make_image())
+        attachments.attach(self.issue1, attachment, 'screenshot.png')
+        Attachment.objects.filter(id=attachment.id).update(ref_count=0)
+        call_command('collect_attachments', '--recount', stdout=io.StringIO())
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.ref_count, 1)
+        self.assertTrue(default_storage.exists(attachment.file.name))
+
+    def test_demo_user(self):
+        self.client.force_login(user=User.objects.get(email='demo@ex.com'))
+        self.update_issue(self.issue1, new_attachments=make_image())
+        self.assertFalse(Attachment.objects.exists())
+        self.assertFalse(IssueAttachment.objects.exists())
@@ -0,0 +1,52 @@
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from issues import benchmark
+from issues.models import Issue
+
+
+class TestBenchmark(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = os.path.join(directory.name, 'results.json')
+
+    def run_benchmark(self, *args):
+        stdout = io.StringIO()
+        call_command(
+            'benchmark', '--users=10', '--projects=2', '--issues=20', '--comments=30', '--replies=30',
+            '--thread=10', '--repeat=2', '--warmup=0', f'--output={self.output}', *args, stdout=stdout
+        )
+        with open(self.output) as f:
+            return json.load(f), stdout.getvalue()
+
+    def test_results(self):
+        results, _ = self.run_benchmark()
+        self.assertEqual(results['dataset']['issues'], 20)
+        self.assertEqual(
+            {key.split('/')[0] for key in results['requests']}, set(benchmark.SCENARIOS)
+        )
+        result = results['requests']['issue-detail/issue detail']
+        self.assertEqual(result['requests'], 2)
+        self.assertEqual(set(result['latency_ms']), {'p50', 'p90', 'p95', 'p99', 'mean', 'max'})
+        self.assertGreater(result['queries']['max'], result['queries']['session'])
+        self.assertGreater(result['peak_memory_kb'], 0)
+        # The dataset is rolled back.
+        self.assertFalse(User.objects.filter(username__startswith=benchmark.USERNAME_PREFIX).exists())
+        self.assertFalse(Issue.objects.exists())
+
+    def test_compare(self):
+        self.run_benchmark('--scenario=issue-detail')
+        _, stdout = self.run_benchmark('--scenario=issue-detail', f'--compare={self.output}')
+        self.assertIn('issue-detail/issue detail queries', stdout)
+
+    def test_percentile(self):
+        self.assertEqual(benchmark.percentile([5, 1, 4, 2, 3], 50), 3)
+        self.assertEqual(benchmark.percentile([5, 1, 4, 2, 3], 99), 5)
+        self.assertEqual(benchmark.percentile([7], 95), 7)
@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.staticfiles import finders
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import SimpleTestCase, override_settings
+from issues import bundles
+
+PLAIN_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
+
+def render_bundle(name):
+    return Template("{% load bundles %}{% bundle name %}").render(Context({'name': name}))
+
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STORAGE)
+class TestBundles(SimpleTestCase):
+
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.static_dir, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_sources_until_built(self):
+        html = render_bundle('base.js')
+        # Vendored files are served from here once they're fetched, and from their CDN until then.
+        self.assertIn('<script src="/static/vendor/jquery/jquery-3.5.1.min.js"></script>', html)
+        self.assertIn('<script src="/static/vendor/popper.js/popper-1.16.1.min.js"></script>', html)
+        url, integrity = bundles.VENDOR_FILES['vendor/bootstrap/bootstrap-4.5.2.min.js']
+        if finders.find('vendor/bootstrap/bootstrap-4.5.2.min.js') is None:
+            self.assertIn(f'<script src="{url}" integrity="{integrity}" crossorigin="anonymous"></script>', html)
+        self.assertTrue(html.endswith('<script src="/static/js/script.js"></script>'))
+
+    def test_every_source_is_loaded(self):
+        # Nothing is left out: files without a hash are loaded from their CDN, in their place in the bundle.
+        with override_settings(STATICFILES_DIRS=[self.static_dir]):
+            html = render_bundle('base.js')
+        self.assertEqual(html.count('<script'), len(bundles.BUNDLES['base.js']))
+        datatables = '<script src="https://cdn.datatables.net/1.10.22/js/jquery.dataTables.min.js"></script>'
+        self.assertIn(datatables, html)
+        self.assertLess(html.index('jquery-3.5.1.min.js'), html.index(datatables))
+        self.assertLess(html.index(datatables), html.index('js/script.js'))
+
+    def test_vendored_files_match_their_hashes(self):
+        for name, (url, integrity) in bundles.VENDOR_FILES.items():
+            path = finders.find(name)
+            if path is not None:
+                with open(path, 'rb') as f:
+                    self.assertTrue(bundles.check_integrity(f.read(), integrity), name)
+        self.assertFalse(bundles.check_integrity(b'tampered', bundles.VENDOR_FILES['vendor/jquery/jquery-3.5.1.min.js'][1]))
+        # A file is only trusted with a hash pinned for it.
+        self.assertFalse(bundles.check_integrity(b'anything', None))
+        self.assertTrue(finders.find('vendor/jquery/jquery-3.5.1.min.js'))
+        self.assertTrue(finders.find('vendor/popper.js/popper-1.16.1.min.js'))
+
+    def pin(self, name, content):
+        """Write a vendored file, pinning its hash for the rest of the test."""
+        self.write(name, content)
+        url = bundles.VENDOR_FILES[name][0]
+        patcher = mock.patch.dict(bundles.VENDOR_FILES, {name: (url, bundles.integrity(content.encode()))})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_build(self):
+        self.pin('vendor/bootstrap/bootstrap-4.5.2.min.css', '/*! Bootstrap */ body { margin: 0; }')
+        self.pin(
+            'vendor/datatables/css/jquery.dataTables-1.10.22.min.css',
+            'table.dataTable thead .sorting { background-image: url("../images/sort_both.png"); }'
+        )
+        self.write('css/style.css', '.logo {\n  background: url(data:image/png;base64,AAAA);\n}\n')
+        with override_settings(STATICFILES_DIRS=[self.static_dir]):
+            self.assertEqual(render_bundle('base.css').count('<link'), 3)
+            bundles.build('base.css')
+            self.assertEqual(render_bundle('base.css'), '<link rel="stylesheet" href="/static/bundles/base.css">')
+
+        with open(os.path.join(self.static_dir, 'bundles', 'base.css')) as f:
+            css = f.read()
+        self.assertIn('/*! Bootstrap */', css)
+        self.assertIn('url("../vendor/datatables/images/sort_both.png")', css)
+        self.assertIn('url(data:image/png;base64,AAAA)', css)
+        if bundles.rcssmin is not None:
+            self.assertIn('.logo{background:', css)
+
+    def test_build_needs_every_source(self):
+        with override_settings(STATICFILES_DIRS=[self.static_dir]):
+            with self.assertRaisesMessage(ValueError, 'js/issue_detail.js is missing'):
+                bundles.build('issue-detail.js')
+
+    def test_build_checks_vendored_files(self):
+        self.write('vendor/bootstrap/bootstrap-4.5.2.min.css', '/*! Bootstrap, tampered with */')
+        self.write('vendor/datatables/css/jquery.dataTables-1.10.22.min.css', 'table.dataTable {}')
+        self.write('css/style.css', 'body {}')
+        with override_settings(STATICFILES_DIRS=[self.static_dir]):
+            with self.assertRaisesMessage(ValueError, 'bootstrap-4.5.2.min.css does not match its pinned integrity hash'):
+                bundles.build('base.css')
+            self.pin('vendor/bootstrap/bootstrap-4.5.2.min.css', '/*! Bootstrap */')
+            # Nor is a file trusted with no hash pinned for it.
+            with self.assertRaisesMessage(ValueError, 'jquery.dataTables-1.10.22.min.css does not match'):
+                bundles.build('base.css')
+
+    def test_build_assets_skips_bundles_loaded_from_cdns(self):
+        self.write('js/issue_detail.js', 'var a = 1;')
+        self.write('js/my_issues.js', 'var b = 2;')
+        out = StringIO()
+        with override_settings(STATICFILES_DIRS=[self.static_dir]), \
+                mock.patch.dict(bundles.BUNDLES, {name: bundles.BUNDLES[name] for name in ('base.js', 'issue-detail.js', 'my-issues.js')}, clear=True):
+            call_command('build_assets', stdout=out)
+            self.assertTrue(bundles.is_built('issue-detail.js'))
+            self.assertFalse(bundles.is_built('base.js'))
+        self.assertIn('Not building base.js: vendor/datatables/js/jquery.dataTables-1.10.22.min.js', out.getvalue())
+
+    def test_fetch_skips_unpinned_files(self):
+        with override_settings(STATICFILES_DIRS=[self.static_dir]), \
+                mock.patch('urllib.request.urlopen', side_effect=AssertionError('Nothing is downloaded.')):
+            for name in bundles.VENDOR_FILES:
+                if bundles.is_pinned(name):
+                    self.pin(name, '')
+            self.assertEqual(list(bundles.fetch_vendor_files()), [])
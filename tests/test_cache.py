@@ -0,0 +1,147 @@
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from issues.cache import get_versions, version_key
+from issues.models import (
+    Project,
+    Issue,
+    Comment,
+    Reply
+)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestCache(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        cache.clear()
+        self.test_admin = User.objects.get(username='admin1')
+        self.client.force_login(user=self.test_admin)
+        self.p1 = Project.objects.get(title='Project1')
+        self.issue1 = Issue.objects.get(project=self.p1, num=1)
+        self.issue_url = reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': 1})
+        self.project_url = reverse('issues:project-detail', kwargs={'slug': self.p1.slug})
+        self.table_url = reverse('issues:project-issues-table', kwargs={'slug': self.p1.slug})
+
+    def count_queries(self, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_cached_pages_use_fewer_queries(self):
+        for url in (self.issue_url, self.project_url, self.table_url):
+            first_count = self.count_queries(url)[1]
+            self.assertLess(self.count_queries(url)[1], first_count)
+
+    def test_comment_changes(self):
+        self.client.get(self.issue_url)
+        comment = Comment.objects.create(text='A new comment.', author=self.test_admin, issue=self.issue1)
+        self.assertContains(self.client.get(self.issue_url), 'A new comment.')
+
+        comment.text = 'An edited comment.'
+        comment.save()
+        self.assertContains(self.client.get(self.issue_url), 'An edited comment.')
+
+        Reply.objects.create(text='A new reply.', author=self.test_admin, comment=comment)
+        self.assertContains(self.client.get(self.issue_url), 'A new reply.')
+
+        comment.delete()
+        self.assertNotContains(self.client.get(self.issue_url), 'An edited comment.')
+
+    def test_issue_changes(self):
+        self.client.get(self.table_url)
+        self.issue1.title = 'A renamed issue'
+        self.issue1.save()
+        response = self.client.get(self.table_url, {'draw': 5})
+        self.assertIn('A renamed issue', [row['title'] for row in response.json()['data']])
+        self.assertEqual(response.json()['draw'], 5)
+
+    def test_assignment_changes(self):
+        dev2 = User.objects.get(username='dev2')
+        dev2_row = '<td class="align-middle">dev2</td>'
+        self.client.get(self.project_url)
+        self.client.get(self.issue_url)
+        self.client.post(
+            reverse('issues:issue-assign', kwargs={'project_slug': self.p1.slug, 'issue_num': 1}),
+            data={'selection': [dev2.id], 'action': 'assign'}
+        )
+        self.assertContains(self.client.get(self.project_url), dev2_row)
+        self.assertContains(self.client.get(self.issue_url), dev2_row)
+
+        self.client.post(
+            reverse('issues:project-assign', kwargs={'slug': self.p1.slug}),
+            data={'selection': [dev2.id], 'action': 'unassign'}
+        )
+        self.assertNotContains(self.client.get(self.project_url), dev2_row)
+        self.assertNotContains(self.client.get(self.issue_url), dev2_row)
+
+    def test_user_changes(self):
+        self.client.get(self.project_url)
+        dev1 = User.objects.get(username='dev1')
+        dev1.groups.set([Group.objects.get(name='Submitter')])
+        self.assertContains(self.client.get(self.project_url), '<td class="align-middle">Submitter</td>', count=2)
+
+    def test_login_keeps_cache(self):
+        # Logging in only updates last_login, which doesn't invalidate anything.
+        versions = get_versions(('users', None))
+        self.client.login(username='admin1', password='testing321')
+        self.assertEqual(get_versions(('users', None)), versions)
+
+    def test_evicted_version(self):
+        # A counter that's evicted starts again past the value it had reached.
+        get_versions(('issue', self.issue1.id))
+        Comment.objects.create(text='A new comment.', author=self.test_admin, issue=self.issue1)
+        bumped_version = get_versions(('issue', self.issue1.id))[0]
+        cache.delete(version_key('issue', self.issue1.id))
+        self.assertGreater(get_versions(('issue', self.issue1.id))[0], bumped_version)
+
+    def add_comments(self, issue, count):
+        for number in range(count):
+            comment = Comment.objects.create(text=f'Comment {number}', author=self.test_admin, issue=issue)
+            Reply.objects.bulk_create(
+                Reply(text=f'Reply {reply_number}', author=self.test_admin, comment=comment) for reply_number in range(5)
+            )
+
+    def test_issue_deletion(self):
+        # Deleting an issue takes as many queries, and bumps its version once, however many comments and replies it has.
+        self.add_comments(self.issue1, 3)
+        scopes = (('project', self.p1.id), ('issue', self.issue1.id))
+        versions = get_versions(*scopes)
+        with CaptureQueriesContext(connection) as queries:
+            self.issue1.delete()
+        self.assertEqual([version - 1 for version in get_versions(*scopes)], versions)
+
+        issue2 = Issue.objects.get(project=self.p1, num=2)
+        self.add_comments(issue2, 20)
+        with self.assertNumQueries(len(queries)):
+            issue2.delete()
+
+    def test_failed_issue_deletion(self):
+        # A deletion rolled back halfway leaves no note of the issue to skip later bumps.
+        comment = Comment.objects.create(text='A new comment.', author=self.test_admin, issue=self.issue1)
+        Reply.objects.create(text='A new reply.', author=self.test_admin, comment=comment)
+
+        def fail(**kwargs):
+            raise DatabaseError
+        post_delete.connect(fail, sender=Reply)
+        self.addCleanup(post_delete.disconnect, fail, sender=Reply)
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            Issue.objects.get(id=self.issue1.id).delete()
+        post_delete.disconnect(fail, sender=Reply)
+
+        version = get_versions(('issue', self.issue1.id))[0]
+        comment.delete()
+        self.assertGreater(get_versions(('issue', self.issue1.id))[0], version)
+
+    def test_reply_deletion(self):
+        comment = Comment.objects.create(text='A new comment.', author=self.test_admin, issue=self.issue1)
+        reply = Reply.objects.create(text='A new reply.', author=self.test_admin, comment=comment)
+        self.client.get(self.issue_url)
+        Reply.objects.get(id=reply.id).delete()
+        self.assertNotContains(self.client.get(self.issue_url), 'A new reply.')
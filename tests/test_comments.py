@@ -1,5 +1,7 @@
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from issues.models import (
     Project,
@@ -166,3 +168,100 @@ class TestReplies(TestCase):
 
         self.assertEqual(post_response.status_code, 200)
         self.assertEqual(Reply.objects.get(id=1).text, 'This is an updated reply.')
+
+
+class TestCommentThread(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        self.test_admin = User.objects.get(username='admin1')
+        self.client.force_login(user=self.test_admin)
+        self.p1 = Project.objects.get(title='Project1')
+        self.issue1 = Issue.objects.get(project=self.p1, num=1)
+        self.url = reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': self.issue1.num})
+
+    def add_thread(self, num_comments, num_replies):
+        authors = list(User.objects.all())
+        for i in range(num_comments):
+            comment = Comment.objects.create(text=f'Comment {i}', author=authors[i % len(authors)], issue=self.issue1)
+            for j in range(num_replies):
+                Reply.objects.create(text=f'Reply {j}', author=authors[j % len(authors)], comment=comment)
+
+    def get_query_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_thread_query_count(self):
+        # The number of queries shouldn't grow with the number of comments and replies.
+        short_thread_count = self.get_query_count()
+        self.add_thread(num_comments=20, num_replies=5)
+        self.assertEqual(self.get_query_count(), short_thread_count)
+
+    def test_reply_order(self):
+        # Replies are displayed oldest first beneath their comment.
+        self.add_thread(num_comments=1, num_replies=3)
+        response = self.client.get(self.url)
+        comment = response.context['comments'][0]
+        self.assertEqual([reply.text for reply in comment.replies.all()], ['Reply 0', 'Reply 1', 'Reply 2'])
+
+    def test_actions_return_fragments(self):
+        kwargs = {'project_slug': self.p1.slug, 'issue_num': self.issue1.num}
+        data = self.client.post(reverse('issues:comment-create', kwargs=kwargs), {'text': 'A new comment.'}).json()
+        self.assertIn(f'id="comment-thread-{data["id"]}"', data['html'])
+        self.assertIn('A new comment.', data['html'])
+
+        data = self.client.post(reverse('issues:comment-update', kwargs=kwargs), {'updated-text': 'An updated comment.', 'comment-id': data['id']}).json()
+        self.assertIn(f'id="comment-item-{data["id"]}"', data['html'])
+        self.assertIn('An updated comment.', data['html'])
+        comment_id = data['id']
+
+        data = self.client.post(reverse('issues:reply-create', kwargs=kwargs), {'text': 'A new reply.', 'comment-id': comment_id}).json()
+        self.assertEqual(data['comment_id'], comment_id)
+        self.assertIn(f'id="reply-item-{data["id"]}"', data['html'])
+
+        data = self.client.post(reverse('issues:reply-delete', kwargs=kwargs), {'reply-id': data['id']}).json()
+        self.assertIn('[deleted]', data['html'])
+
+    def test_invalid_comment(self):
+        kwargs = {'project_slug': self.p1.slug, 'issue_num': self.issue1.num}
+        response = self.client.post(reverse('issues:comment-create', kwargs=kwargs), {'text': ''})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Comment.objects.filter(text='').exists())
+
+    def test_comments_since(self):
+        since_url = reverse('issues:comments-since', kwargs={'project_slug': self.p1.slug, 'issue_num': self.issue1.num})
+        since = self.client.get(self.url).context['comments_since']
+        data = self.client.get(since_url, {'since': since}).json()
+        self.assertEqual(data['comments'], [])
+        self.assertEqual(data['since'], since)
+
+        self.add_thread(num_comments=3, num_replies=1)
+        data = self.client.get(since_url, {'since': since}).json()
+        self.assertEqual(len(data['comments']), 3)
+        self.assertIn('Comment 2', data['comments'][0]['html'])
+        self.assertIn('Reply 0', data['comments'][0]['html'])
+        self.assertFalse(data['more'])
+        self.assertEqual(self.client.get(since_url, {'since': data['since']}).json()['comments'], [])
+
+    def test_comments_since_in_batches(self):
+        since_url = reverse('issues:comments-since', kwargs={'project_slug': self.p1.slug, 'issue_num': self.issue1.num})
+        since = self.client.get(self.url).context['comments_since']
+        self.add_thread(num_comments=30, num_replies=0)
+        data = self.client.get(since_url, {'since': since}).json()
+        # The oldest batch comes first.
+        self.assertEqual(len(data['comments']), 25)
+        self.assertIn('Comment 0', data['comments'][-1]['html'])
+        self.assertTrue(data['more'])
+        data = self.client.get(since_url, {'since': data['since']}).json()
+        self.assertEqual(len(data['comments']), 5)
+        self.assertFalse(data['more'])
+
+    def test_comments_since_invalid_cursor(self):
+        since_url = reverse('issues:comments-since', kwargs={'project_slug': self.p1.slug, 'issue_num': self.issue1.num})
+        self.assertEqual(self.client.get(since_url, {'since': 'invalid'}).status_code, 400)
+        # A cursor to older comments can't be used either.
+        self.add_thread(num_comments=30, num_replies=0)
+        next_cursor = self.client.get(self.url).context['comments'].next_cursor
+        self.assertEqual(self.client.get(since_url, {'since': next_cursor}).status_code, 400)
@@ -0,0 +1,118 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from issues.models import (
+    Project,
+    Issue,
+    Comment,
+    Reply
+)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestConditionalGet(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        cache.clear()
+        self.test_admin = User.objects.get(username='admin1')
+        self.client.force_login(user=self.test_admin)
+        self.p1 = Project.objects.get(title='Project1')
+        self.issue1 = Issue.objects.get(project=self.p1, num=1)
+        self.issue_url = reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': 1})
+        self.project_url = reverse('issues:project-detail', kwargs={'slug': self.p1.slug})
+        # The first page a client gets sets its CSRF cookie, which is part of the ETag.
+        self.client.get(self.project_url)
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response.get('ETag', '"none"'))
+
+    def test_issue_not_modified(self):
+        response = self.client.get(self.issue_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(5):
+            # Session, user, issue, comment stats and the viewer's groups. Nothing is rendered.
+            not_modified = self.revalidate(self.issue_url, response)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        # A date can't tell that the viewer's groups or the assignments changed, so it is never enough.
+        response = self.client.get(self.issue_url, HTTP_IF_MODIFIED_SINCE='Sun, 01 Jan 2040 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_issue_changes(self):
+        response = self.client.get(self.issue_url)
+        comment = Comment.objects.create(text='A new comment.', author=self.test_admin, issue=self.issue1)
+        self.assertEqual(self.revalidate(self.issue_url, response).status_code, 200)
+
+        response = self.client.get(self.issue_url)
+        Reply.objects.create(text='A new reply.', author=self.test_admin, comment=comment)
+        self.assertEqual(self.revalidate(self.issue_url, response).status_code, 200)
+
+        response = self.client.get(self.issue_url)
+        comment.delete()
+        self.assertEqual(self.revalidate(self.issue_url, response).status_code, 200)
+
+        response = self.client.get(self.issue_url)
+        self.issue1.status = Issue.STATUS_CLOSED
+        self.issue1.save()
+        self.assertEqual(self.revalidate(self.issue_url, response).status_code, 200)
+
+    def test_viewer_changes(self):
+        # Users see different options, so one user's copy of a page is never current for another.
+        response = self.client.get(self.issue_url)
+        self.client.force_login(user=User.objects.get(username='dev1'))
+        self.assertEqual(self.revalidate(self.issue_url, response).status_code, 200)
+
+    def test_project_not_modified(self):
+        response = self.client.get(self.project_url)
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.revalidate(self.project_url, response).status_code, 304)
+
+        self.p1.description = 'A new description.'
+        self.p1.save()
+        self.assertEqual(self.revalidate(self.project_url, response).status_code, 200)
+
+        response = self.client.get(self.project_url)
+        Issue.objects.create(title='A new issue', description='A test issue.', submitter=self.test_admin, project=self.p1)
+        self.assertEqual(self.revalidate(self.project_url, response).status_code, 200)
+
+    def test_assignment_changes(self):
+        response = self.client.get(self.issue_url)
+        self.client.post(
+            reverse('issues:issue-assign', kwargs={'project_slug': self.p1.slug, 'issue_num': 1}),
+            data={'selection': [User.objects.get(username='dev2').id], 'action': 'assign'}
+        )
+        # Show the message the assignment left, then check the page again.
+        self.client.get(self.issue_url)
+        self.assertEqual(self.revalidate(self.issue_url, response).status_code, 200)
+
+    def test_pending_messages(self):
+        # A page with a message waiting to be shown is always rendered. The demo user's
+        # assignments leave a message without changing anything.
+        self.client.force_login(user=User.objects.get(email='demo@ex.com'))
+        self.client.get(self.issue_url)
+        response = self.client.get(self.issue_url)
+        self.assertEqual(self.revalidate(self.issue_url, response).status_code, 304)
+        self.client.post(
+            reverse('issues:issue-assign', kwargs={'project_slug': self.p1.slug, 'issue_num': 1}),
+            data={'selection': [User.objects.get(username='dev2').id], 'action': 'assign'}
+        )
+        self.assertEqual(self.revalidate(self.issue_url, response).status_code, 200)
+
+    def test_no_cache(self):
+        # Without a cache to keep versions in, assignments can't be tracked, so pages are always sent.
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            response = self.client.get(self.issue_url)
+            self.assertNotIn('ETag', response)
+            self.assertEqual(self.revalidate(self.issue_url, response).status_code, 200)
+
+    def test_no_access(self):
+        response = self.client.get(self.project_url)
+        self.client.force_login(user=User.objects.get(username='manager2'))
+        self.assertEqual(self.revalidate(self.project_url, response).status_code, 403)
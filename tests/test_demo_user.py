@@ -147,7 +147,7 @@ class TestDemoIssue(TestCase):
             data={'title': 'New Test Issue', 'description': 'A test issue.', 'assignee': assignee.id, 'priority': 3, 'status': 'open', 'issue_type': 'bug', 'tag': 'test', 'attachment': ''}
         )
         self.assertRedirects(post_response, reverse('issues:project-detail', kwargs={'slug': self.p1.slug}))
-        self.assertFalse(Issue.objects.filter(title='New Test Issue', description='A test issue.', assignee=assignee.id, priority=3, status='open', issue_type='bug', tag='test', attachment='').exists())
+        self.assertFalse(Issue.objects.filter(title='New Test Issue', description='A test issue.', assignee=assignee.id, priority=3, status='open', issue_type='bug', tag='test').exists())
     
     def test_create_issue(self):
         assignee = User.objects.get(username='dev1')
@@ -155,7 +155,7 @@ class TestDemoIssue(TestCase):
             reverse('issues:issue-create'),
             data={'title': 'New Test Issue', 'description': 'A test issue.', 'assignee': assignee.id, 'project': self.p1.id, 'priority': 3, 'status': 'open', 'issue_type': 'bug', 'tag': 'test', 'attachment': ''}
         )
-        self.assertFalse(Issue.objects.filter(title='New Test Issue', description='A test issue.', assignee=assignee, project=self.p1, priority=3, status='open', issue_type='bug', tag='test', attachment='').exists())
+        self.assertFalse(Issue.objects.filter(title='New Test Issue', description='A test issue.', assignee=assignee, project=self.p1, priority=3, status='open', issue_type='bug', tag='test').exists())
         self.assertRedirects(post_response, reverse('issues:my-issues'))
     
     def test_edit_issue(self):
@@ -166,7 +166,7 @@ class TestDemoIssue(TestCase):
             data={'title': 'Updated Issue', 'description': 'A test issue.', 'assignee': assignee.id, 'project': self.p1.id, 'priority': 3, 'status': 'open', 'issue_type': 'bug', 'tag': 'test', 'attachment': ''}
         )
         self.assertRedirects(post_response, reverse('issues:issue-detail', kwargs={'project_slug': self.issue1.project.slug, 'issue_num': self.issue1.num}))
-        self.assertFalse(Issue.objects.filter(title='Updated Issue', description='A test issue.', assignee=assignee, project=self.p1, priority=3, status='open', issue_type='bug', tag='test', attachment='').exists())
+        self.assertFalse(Issue.objects.filter(title='Updated Issue', description='A test issue.', assignee=assignee, project=self.p1, priority=3, status='open', issue_type='bug', tag='test').exists())
     
     def test_delete_issue(self):
         post_response = self.client.post(reverse('issues:issue-delete', kwargs={'project_slug': self.p1.slug, 'issue_num': self.issue1.num}))
@@ -0,0 +1,228 @@
+import asyncio
+import json
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from issues import events
+from issues.models import Project, Issue, Comment, Reply
+from issues.permissions import UserPermissions
+
+
+class OnCommitMixin:
+    """Run the callbacks TestCase's transaction would have run as it committed.
+
+    Loading the fixture leaves callbacks of its own waiting, so only those added by the test are run.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.committed = len(connection.run_on_commit)
+
+    def run_on_commit(self):
+        callbacks = connection.run_on_commit[self.committed:]
+        self.committed = len(connection.run_on_commit)
+        for _, callback in callbacks:
+            callback()
+
+
+def parse(chunk):
+    """The event in a chunk of an event stream, or None for anything else."""
+    lines = dict(line.split(': ', 1) for line in chunk.decode().strip().split('\n') if ': ' in line)
+    return json.loads(lines['data']) if 'data' in lines else None
+
+
+class TestBroadcaster(TestCase):
+
+    def test_delivered_to_subscribed_channels_only(self):
+        broadcaster = events.Broadcaster()
+        backend = events.LocalBackend(broadcaster)
+        issue_subscription = events.Subscription(['issue:1'])
+        user_subscription = events.Subscription(['user:2'])
+        broadcaster.subscribe(issue_subscription)
+        broadcaster.subscribe(user_subscription)
+
+        backend.publish(['issue:1', 'user:3'], {'id': 'a', 'type': 'issue.updated'})
+        self.assertEqual(issue_subscription.get(0)['id'], 'a')
+        self.assertIsNone(user_subscription.get(0))
+
+        broadcaster.unsubscribe(issue_subscription)
+        backend.publish(['issue:1'], {'id': 'b', 'type': 'issue.updated'})
+        self.assertIsNone(issue_subscription.get(0))
+        self.assertEqual(broadcaster.subscriptions, {'user:2': {user_subscription}})
+
+    def test_slow_subscription_overflows(self):
+        subscription = events.Subscription(['issue:1'])
+        for i in range(events.QUEUE_SIZE + 1):
+            subscription.put({'id': i})
+        self.assertTrue(subscription.overflowed)
+
+
+class TestIssueEvents(OnCommitMixin, TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        super().setUp()
+        self.p1 = Project.objects.get(title='Project1')
+        self.issue1 = Issue.objects.get(project=self.p1, num=1)
+        self.dev1 = User.objects.get(username='dev1')
+        self.submitter1 = User.objects.get(username='submitter1')
+        self.subscription = events.subscribe(events.Subscription([events.issue_channel(self.issue1.id)]))
+        self.addCleanup(events.unsubscribe, self.subscription)
+
+    def received(self):
+        self.run_on_commit()
+        received = []
+        while (event := self.subscription.get(0)) is not None:
+            received.append(event)
+        return received
+
+    def test_channels(self):
+        factory = RequestFactory()
+        request = factory.get('/')
+        request.user = self.dev1
+        request.permissions = UserPermissions(request.user)
+        self.assertEqual(
+            events.get_channels(request, self.issue1.id), [f'user:{self.dev1.id}', f'issue:{self.issue1.id}']
+        )
+        request.user = User.objects.get(username='dev2')
+        request.permissions = UserPermissions(request.user)
+        self.assertEqual(events.get_channels(request, self.issue1.id), [f'user:{request.user.id}'])
+
+    def test_comment_and_reply_events(self):
+        comment = Comment.objects.create(issue=self.issue1, author=self.dev1, text='A comment.')
+        reply = Reply.objects.create(comment=comment, author=self.dev1, text='A reply.')
+        reply.text = 'An edited reply.'
+        reply.save()
+        received = self.received()
+        self.assertEqual([event['type'] for event in received], ['comment.created', 'reply.created', 'reply.updated'])
+        self.assertEqual(received[2], {'id': received[2]['id'], 'type': 'reply.updated', 'issue': self.issue1.id,
+                                       'comment': comment.id, 'reply': reply.id})
+        # Only what changed, not the text.
+        self.assertNotIn('A reply.', json.dumps(received))
+
+    def test_issue_events(self):
+        user_subscription = events.subscribe(events.Subscription([events.user_channel(self.submitter1.id)]))
+        self.addCleanup(events.unsubscribe, user_subscription)
+        self.issue1.assigned_users.add(self.submitter1)
+        self.issue1.status = Issue.STATUS_CLOSED
+        self.issue1.save()
+        self.submitter1.assigned_issues.remove(self.issue1)
+
+        types = ['issue.assigned', 'issue.closed', 'issue.unassigned']
+        self.assertEqual([event['type'] for event in self.received()], types)
+        user_events = [user_subscription.get(0) for _ in types]
+        self.assertEqual([event['type'] for event in user_events], types)
+        self.assertEqual(user_events[0]['project'], self.p1.slug)
+
+    def test_project_assignment_events(self):
+        # Assigning a manager to a project assigns them its issues in bulk, without m2m_changed.
+        manager2 = User.objects.get(username='manager2')
+        self.issue1.assigned_users.add(manager2)
+        self.received()
+        user_subscription = events.subscribe(events.Subscription([events.user_channel(manager2.id)]))
+        self.addCleanup(events.unsubscribe, user_subscription)
+        self.client.force_login(User.objects.get(username='admin1'))
+        url = reverse('issues:project-assign', kwargs={'slug': self.p1.slug})
+
+        self.client.post(url, data={'selection': [manager2.id], 'action': 'assign'})
+        self.run_on_commit()
+        assigned = []
+        while (event := user_subscription.get(0)) is not None:
+            assigned.append((event['type'], event['num']))
+        # Not issue 1, which they were already assigned.
+        other_nums = Issue.objects.filter(project=self.p1).exclude(id=self.issue1.id).values_list('num', flat=True)
+        self.assertEqual(sorted(assigned), [('issue.assigned', num) for num in sorted(other_nums)])
+
+        self.client.post(url, data={'selection': [manager2.id], 'action': 'unassign'})
+        self.run_on_commit()
+        unassigned = []
+        while (event := user_subscription.get(0)) is not None:
+            unassigned.append(event['type'])
+        self.assertEqual(unassigned, ['issue.unassigned'] * (len(other_nums) + 1))
+
+    def test_nothing_sent_before_commit(self):
+        Comment.objects.create(issue=self.issue1, author=self.dev1, text='A comment.')
+        self.assertIsNone(self.subscription.get(0))
+
+
+class TestEventStreamView(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        self.p1 = Project.objects.get(title='Project1')
+        self.issue1 = Issue.objects.get(project=self.p1, num=1)
+        self.client.force_login(user=User.objects.get(username='dev1'))
+
+    def test_no_stream_under_wsgi(self):
+        # Browsers don't reconnect after a 204.
+        response = self.client.get(reverse('issues:events') + f'?issue={self.issue1.id}')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(events.broadcaster.subscriptions, {})
+
+        for url in (reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': 1}),
+                    reverse('issues:my-issues')):
+            self.assertNotContains(self.client.get(url), 'data-events-url')
+
+    @override_settings(ASYNC_VIEWS=True)
+    def test_pages_open_stream_under_asgi(self):
+        response = self.client.get(reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': 1}))
+        self.assertContains(response, f'data-events-url="{reverse("issues:events")}?issue={self.issue1.id}"')
+        self.assertContains(self.client.get(reverse('issues:my-issues')), 'data-events-url')
+
+
+async def noop_application(scope, receive, send):
+    pass
+
+
+def asgi_scope(cookies=''):
+    return {'type': 'http', 'method': 'GET', 'path': '/events/', 'query_string': b'',
+            'headers': [(b'cookie', cookies.encode())] if cookies else []}
+
+
+class TestEventStreamApp(TransactionTestCase):
+    # The app looks up the session in another thread, with its own connection, which only sees
+    # committed data.
+
+    def test_stream(self):
+        user = User.objects.create_user(username='dev1', email='dev1@ex.com', password='test')
+        self.client.force_login(user)
+        scope = asgi_scope(self.client.cookies.output(header='', sep=';').strip())
+
+        async def run():
+            messages = asyncio.Queue()
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            app = asyncio.ensure_future(events.EventStreamApp(noop_application, '/events/')(scope, receive, messages.put))
+            start = await asyncio.wait_for(messages.get(), 5)
+            first = await asyncio.wait_for(messages.get(), 5)
+            events.broadcaster.deliver([events.user_channel(user.id)], {'id': 'a', 'type': 'issue.assigned'})
+            event = await asyncio.wait_for(messages.get(), 5)
+            disconnected.set()
+            await asyncio.wait_for(app, 5)
+            return start, first, event
+
+        start, first, event = async_to_sync(run)()
+        self.assertEqual(start['status'], 200)
+        self.assertEqual(first['body'], events.STREAM_START)
+        self.assertEqual(parse(event['body'])['type'], 'issue.assigned')
+        # The stream stops following the user's channel once the browser disconnects.
+        self.assertEqual(events.broadcaster.subscriptions, {})
+
+    def test_login_required(self):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            sent.append(message)
+
+        async_to_sync(events.EventStreamApp(noop_application, '/events/'))(asgi_scope(), receive, send)
+        self.assertEqual(sent[0]['status'], 403)
@@ -89,7 +89,7 @@ class TestProjectIssueForm(TestCase):
         self.assertIn('This field is required.', invalid_form.errors['description'])
         self.assertNotIn('assignee', invalid_form.errors)
         self.assertNotIn('tag', invalid_form.errors)
-        self.assertNotIn('attachment', invalid_form.errors)
+        self.assertNotIn('new_attachments', invalid_form.errors)
     
 
 class TestIssueForm(TestCase):
@@ -114,7 +114,7 @@ class TestIssueForm(TestCase):
         self.assertIn('This field is required.', invalid_form.errors['project'])
         self.assertNotIn('assignee', invalid_form.errors)
         self.assertNotIn('tag', invalid_form.errors)
-        self.assertNotIn('attachment', invalid_form.errors)
+        self.assertNotIn('new_attachments', invalid_form.errors)
 
 
 class TestCommentsForm(TestCase):
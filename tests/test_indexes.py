@@ -0,0 +1,42 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from issues.models import (
+    Project,
+    Issue,
+    Comment,
+    Reply
+)
+
+
+class TestIndexes(TestCase):
+    fixtures = ['fixture.json']
+
+    def test_indexes_exist(self):
+        with connection.cursor() as cursor:
+            for model in (Issue, Comment, Reply):
+                constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                for index in model._meta.indexes:
+                    self.assertIn(index.name, constraints)
+
+    def test_explain_queries(self):
+        out = StringIO()
+        call_command('explain_queries', issues=50, comments=1, repeat=1, stdout=out)
+        self.assertIn('Issue by (project, num)', out.getvalue())
+        self.assertIn('Without indexes', out.getvalue())
+
+        # The generated data and dropped indexes are rolled back.
+        self.assertEqual(Issue.objects.count(), 3)
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Issue._meta.db_table)
+        self.assertIn('issue_project_status_idx', constraints)
+
+    def test_explain_queries_with_leftover_data(self):
+        # Each run names its users and projects afresh, so data from an earlier run doesn't clash with them.
+        User.objects.create(username='explain-user-0')
+        Project.objects.create(title='Explain Project 0', description='Generated.')
+        call_command('explain_queries', issues=50, comments=1, repeat=1, stdout=StringIO())
+        self.assertEqual(Project.objects.filter(title__startswith='Explain Project').count(), 1)
@@ -0,0 +1,159 @@
+import io
+import json
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from issues import instrumentation, metrics
+from issues.models import Project
+
+
+class TestHistogram(SimpleTestCase):
+
+    def test_percentile(self):
+        histogram = instrumentation.Histogram((1, 5, 10, instrumentation.INF))
+        for value in (0.5, 3, 4, 7, 50):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.percentile(50), 5)
+        self.assertEqual(histogram.percentile(80), 10)
+        # Past the last finite bucket there is no bound to give.
+        self.assertIsNone(histogram.percentile(100))
+        self.assertAlmostEqual(histogram.mean(), 12.9)
+
+
+class TestInstrumentationMiddleware(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        instrumentation.registry.reset()
+        self.addCleanup(instrumentation.registry.reset)
+        p1 = Project.objects.get(title='Project1')
+        self.url = reverse('issues:issue-detail', kwargs={'project_slug': p1.slug, 'issue_num': 1})
+        self.client.force_login(user=User.objects.get(username='dev1'))
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing(self):
+        response = self.client.get(self.url)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", template;dur=[\d.]+, total;dur=[\d.]+$')
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_off(self):
+        self.assertNotIn('Server-Timing', self.client.get(self.url))
+
+    def test_recorded_by_view(self):
+        response = self.client.get(self.url)
+        histograms = instrumentation.collect().views['issues:issue-detail']
+        self.assertEqual(histograms['latency_ms'].count, 1)
+        self.assertGreater(histograms['queries'].total, 0)
+        self.assertGreater(histograms['template_ms'].total, 0)
+        self.assertEqual(histograms['response_bytes'].total, len(response.content))
+
+    def test_merges_other_processes(self):
+        self.client.get(self.url)
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            other = instrumentation.Registry()
+            other.started -= 1
+            other.observe('issues:issue-detail', {'latency_ms': 20, 'queries': 3, 'query_ms': 2, 'template_ms': 4,
+                                                  'response_bytes': 1000})
+            other.write()
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertEqual(instrumentation.collect().views['issues:issue-detail']['latency_ms'].count, 2)
+
+            instrumentation.clear()
+            self.assertEqual(os.listdir(directory), [])
+            self.assertEqual(instrumentation.collect().views, {})
+
+    def test_prunes_exited_processes(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            exited = os.path.join(directory, f'requests-{2 ** 22 + 1}-1000.json')
+            running = os.path.join(directory, f'requests-{os.getpid()}-1000.json')
+            recent = os.path.join(directory, f'requests-{2 ** 22 + 2}-1000.json')
+            for path in (exited, running, recent):
+                with open(path, 'w') as f:
+                    json.dump({'pid': int(os.path.basename(path).split('-')[1])}, f)
+            two_days_ago = time.time() - 2 * 24 * 60 * 60
+            for path in (exited, running):
+                os.utime(path, (two_days_ago, two_days_ago))
+
+            instrumentation.collect()
+            self.assertEqual(sorted(os.listdir(directory)), sorted(os.path.basename(path) for path in (running, recent)))
+
+    def test_command(self):
+        self.client.get(self.url)
+        out = io.StringIO()
+        call_command('request_metrics', '--json', stdout=out)
+        summary = json.loads(out.getvalue())
+        self.assertEqual(summary['issues:issue-detail']['requests'], 1)
+        out = io.StringIO()
+        call_command('request_metrics', '--reset', stdout=out)
+        self.assertIn('issues:issue-detail (1 requests)', out.getvalue())
+        self.assertEqual(instrumentation.collect().views, {})
+
+
+class TestRequestMetricsView(TestCase):
+    fixtures = ['fixture.json']
+
+    def test_admin_only(self):
+        url = reverse('issues:request-metrics')
+        self.client.force_login(user=User.objects.get(username='dev1'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(user=User.objects.get(username='admin1'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('views', response.json())
+
+
+class TestMetricsView(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        instrumentation.registry.reset()
+        self.addCleanup(instrumentation.registry.reset)
+        self.url = reverse('issues:metrics')
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_exposition(self):
+        self.client.force_login(user=User.objects.get(username='dev1'))
+        self.client.get(reverse('issues:my-issues'))
+        instrumentation.registry.increment('cache_lookups', ('issue-comments', 'hit'), 3)
+        instrumentation.registry.increment('cache_lookups', ('issue-comments', 'miss'))
+        instrumentation.registry.observe_value('upload_bytes', 20000)
+
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE tracker_request_duration_seconds histogram', lines)
+        self.assertIn('tracker_request_duration_seconds_count{view="issues:my-issues"} 1', lines)
+        self.assertIn('tracker_request_duration_seconds_bucket{view="issues:my-issues",le="+Inf"} 1', lines)
+        self.assertIn('tracker_requests_total{view="issues:my-issues",status="200"} 1', lines)
+        self.assertIn('tracker_cache_lookups_total{name="issue-comments",result="hit"} 3', lines)
+        self.assertIn('tracker_cache_hit_ratio{name="issue-comments"} 0.75', lines)
+        self.assertIn('tracker_attachment_upload_size_bytes_bucket{le="16384"} 0', lines)
+        self.assertIn('tracker_attachment_upload_size_bytes_bucket{le="65536"} 1', lines)
+        self.assertIn('tracker_attachment_queue_depth 0', lines)
+
+    def test_gauges_of_running_processes_only(self):
+        running = {'pid': os.getpid(), 'gauges': {'attachment_queue': 2}, 'counters': {'requests': [[['a', '200'], 1]]}}
+        exited = {'pid': 2 ** 22 + 1, 'gauges': {'attachment_queue': 5}, 'counters': {'requests': [[['a', '200'], 2]]}}
+        merged = instrumentation.merge_snapshots([running, exited])
+        self.assertEqual(merged.gauges, {'attachment_queue': 2})
+        self.assertEqual(merged.counters, {'requests': {('a', '200'): 3}})
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_forbidden_without_token(self):
+        # As a request passed on by a reverse proxy on the same host looks.
+        response = self.client.get(self.url, REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.5')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_PUBLIC=True)
+    def test_public(self):
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='203.0.113.5').status_code, 200)
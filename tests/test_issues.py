@@ -1,10 +1,12 @@
 from django.contrib.auth.models import User
+from django.db import IntegrityError
 from django.test import TestCase, Client
 from django.urls import reverse
 from issues.models import (
     Project,
     Issue
 )
+from issues.views import IssueDetailView, ProjectIssueCreateView
 import datetime
 
 
@@ -51,7 +53,7 @@ class TestIssues(TestCase):
             data={'title': 'New Test Issue', 'description': 'A test issue.', 'assignee': assignee.id, 'priority': 3, 'status': 'open', 'issue_type': 'bug', 'tag': 'test', 'attachment': ''}
         )
         # Project1 already has 2 issues in the fixture, so the new issue should be #3.
-        self.assertTrue(Issue.objects.filter(title='New Test Issue', description='A test issue.', assignee=assignee.id, priority=3, status='open', issue_type='bug', tag='test', attachment='').exists())
+        self.assertTrue(Issue.objects.filter(title='New Test Issue', description='A test issue.', assignee=assignee.id, priority=3, status='open', issue_type='bug', tag='test').exists())
         self.assertRedirects(post_response, reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': 3}))
 
         # Ensure that the submitter, assignee, and any project managers are assigned to the new issue.
@@ -73,7 +75,7 @@ class TestIssues(TestCase):
             reverse('issues:issue-create'),
             data={'title': 'New Test Issue', 'description': 'A test issue.', 'assignee': assignee.id, 'project': self.p1.id, 'priority': 3, 'status': 'open', 'issue_type': 'bug', 'tag': 'test', 'attachment': ''}
         )
-        self.assertTrue(Issue.objects.filter(title='New Test Issue', description='A test issue.', assignee=assignee, project=self.p1, priority=3, status='open', issue_type='bug', tag='test', attachment='').exists())
+        self.assertTrue(Issue.objects.filter(title='New Test Issue', description='A test issue.', assignee=assignee, project=self.p1, priority=3, status='open', issue_type='bug', tag='test').exists())
         self.assertRedirects(post_response, reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': 3}))
 
         issue = Issue.objects.get(project=self.p1.id, num=3)
@@ -96,7 +98,7 @@ class TestIssues(TestCase):
             data={'title': 'Updated Issue', 'description': 'A test issue.', 'assignee': assignee.id, 'project': self.p1.id, 'priority': 3, 'status': 'open', 'issue_type': 'bug', 'tag': 'test', 'attachment': ''}
         )
         self.assertRedirects(post_response, reverse('issues:issue-detail', kwargs={'project_slug': self.issue1.project.slug, 'issue_num': self.issue1.num}))
-        self.assertTrue(Issue.objects.filter(title='Updated Issue', description='A test issue.', assignee=assignee, project=self.p1, priority=3, status='open', issue_type='bug', tag='test', attachment='').exists())
+        self.assertTrue(Issue.objects.filter(title='Updated Issue', description='A test issue.', assignee=assignee, project=self.p1, priority=3, status='open', issue_type='bug', tag='test').exists())
     
     def test_issue_assign(self):
         user1 = User.objects.get(id=4)
@@ -121,3 +123,42 @@ class TestIssues(TestCase):
         self.assertRedirects(post_response, reverse('issues:issue-assign', kwargs={'project_slug': self.p1.slug, 'issue_num': self.issue1.num}))
         self.assertNotIn(user1, self.issue1.assigned_users.all())
         self.assertNotIn(user2, self.issue1.assigned_users.all())
+
+    def test_issue_num_counter(self):
+        # Numbers come from the project's counter, so they aren't reused after the newest issue is deleted.
+        submitter = User.objects.get(username='submitter1')
+        Issue.objects.get(project=self.p1, num=2).delete()
+        new_issue = Issue.objects.create(title='Counter Issue', description='A test issue.', submitter=submitter, project=self.p1)
+        self.assertEqual(new_issue.num, 3)
+        self.p1.refresh_from_db()
+        self.assertEqual(self.p1.next_issue_num, 4)
+
+        # Each project keeps its own count.
+        p2 = Project.objects.get(title='Project2')
+        p2_issue = Issue.objects.create(title='Counter Issue', description='A test issue.', submitter=submitter, project=p2)
+        self.assertEqual(p2_issue.num, 2)
+
+    def test_issue_num_unique(self):
+        duplicate = Issue(title='Duplicate', description='A test issue.', submitter=self.test_admin, project=self.p1, num=1)
+        with self.assertRaises(IntegrityError):
+            duplicate.save()
+
+    def test_issue_lookup(self):
+        # The project and issue are resolved in one query and reused for the rest of the request.
+        view = IssueDetailView()
+        view.kwargs = {'project_slug': self.p1.slug, 'issue_num': self.issue1.num}
+        with self.assertNumQueries(1):
+            issue = view.get_issue_object()
+            self.assertEqual(view.get_object(), issue)
+            self.assertEqual(view.get_project_object(), self.p1)
+            issue.submitter.username
+
+        view = ProjectIssueCreateView()
+        view.kwargs = {'slug': self.p1.slug}
+        with self.assertNumQueries(1):
+            self.assertEqual(view.get_project_object(), self.p1)
+            self.assertIs(view.get_project_object(), view.get_project_object())
+
+        # Issue numbers are only looked up within the project in the URL.
+        get_response = self.client.get(reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': 99}))
+        self.assertEqual(get_response.status_code, 404)
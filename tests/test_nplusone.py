@@ -0,0 +1,76 @@
+import io
+import logging
+import unittest
+
+from django.contrib.auth.models import User
+from django.template import engines
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from issues import nplusone
+from issues.models import Comment
+
+LOOP = engines['django'].from_string('{% for comment in comments %}{{ comment.author.username }}{% endfor %}')
+
+
+class TestNormalize(SimpleTestCase):
+
+    def test_literals_and_lists(self):
+        self.assertEqual(
+            nplusone.normalize('SELECT "a"  FROM "t" WHERE "b" = \'x\' AND "c" IN (%s, %s, %s) LIMIT 21'),
+            'SELECT "a" FROM "t" WHERE "b" = ? AND "c" IN (%s, ...) LIMIT ?'
+        )
+        self.assertEqual(nplusone.normalize('SELECT "a" FROM "t" WHERE "c" IN (%s)'), 'SELECT "a" FROM "t" WHERE "c" IN (%s)')
+
+
+class TestDetector(TestCase):
+    fixtures = ['fixture.json']
+
+    def test_template_loop(self):
+        with nplusone.Detector(threshold=1) as detector:
+            LOOP.render({'comments': Comment.objects.all()})
+        repetitions = detector.repetitions()
+        self.assertEqual(len(repetitions), 1)
+        self.assertEqual(repetitions[0].count, Comment.objects.count())
+        self.assertEqual(repetitions[0].template, '<unknown source>:1')
+        self.assertIn('FROM "auth_user"', repetitions[0].sql)
+
+    def test_loaded_with_the_rows(self):
+        with nplusone.Detector(threshold=1) as detector:
+            LOOP.render({'comments': Comment.objects.select_related('author')})
+        self.assertEqual(detector.repetitions(), [])
+
+    def test_report(self):
+        with nplusone.Detector(threshold=1) as detector:
+            LOOP.render({'comments': Comment.objects.all()})
+        with self.assertLogs('issues.nplusone', logging.WARNING) as logs:
+            detector.report('warn', 'A test')
+        self.assertIn('A test made 4 queries from template <unknown source>:1', logs.output[0])
+        with self.assertRaises(nplusone.NPlusOneError):
+            detector.report('raise', 'A test')
+
+    @override_settings(NPLUSONE_DETECTION='warn', NPLUSONE_THRESHOLD=1)
+    def test_requests(self):
+        self.client.force_login(user=User.objects.get(username='admin1'))
+        with nplusone.Detector() as detector:
+            self.client.get(reverse('issues:users-list'))
+        self.assertTrue(any(
+            repetition.template.startswith('issues/users_list.html:') and 'FROM "auth_group"' in repetition.sql
+            for repetition in detector.repetitions() if repetition.template
+        ))
+
+
+class TestRunner(SimpleTestCase):
+
+    def test_failed_with_raise(self):
+        class Test(unittest.TestCase):
+            def test_repeats(self):
+                nplusone.current_detector.get().adopt([nplusone.Repetition('SELECT 1', None, 'issues/views.py:1')])
+
+            def test_fine(self):
+                pass
+
+        result_class = nplusone.NPlusOneTestRunner(nplusone='raise').get_resultclass()
+        result = result_class(unittest.runner._WritelnDecorator(io.StringIO()), False, 0)
+        unittest.defaultTestLoader.loadTestsFromTestCase(Test).run(result)
+        self.assertEqual(result.testsRun, 2)
+        self.assertEqual([test.id().rsplit('.', 1)[1] for test, _ in result.failures], ['test_repeats'])
@@ -0,0 +1,79 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from issues.models import (
+    Project,
+    Issue,
+    Comment
+)
+from issues.pagination import InvalidCursor, KeysetPaginator
+
+
+class TestKeysetPaginator(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        self.test_admin = User.objects.get(username='admin1')
+        self.client.force_login(user=self.test_admin)
+        self.p1 = Project.objects.get(title='Project1')
+        self.issue1 = Issue.objects.get(project=self.p1, num=1)
+        for i in range(10):
+            Issue.objects.create(title=f'Issue {i}', description='A test issue.', submitter=self.test_admin, project=self.p1, priority=i % 3 + 1)
+
+    def test_pages(self):
+        # Stepping through the pages by cursor visits every row once, in order.
+        queryset = Issue.objects.filter(project=self.p1)
+        paginator = KeysetPaginator(queryset, ['priority', '-date_created'], 5)
+        expected = list(queryset.order_by('priority', '-date_created', 'id'))
+
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual([issue for page in pages for issue in page], expected)
+        self.assertFalse(pages[0].has_previous())
+
+        # Going back from the last page returns the page before it.
+        previous_page = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual(previous_page.object_list, pages[1].object_list)
+        self.assertEqual(paginator.get_page(previous_page.previous_cursor).object_list, pages[0].object_list)
+
+    def test_invalid_cursor(self):
+        queryset = Issue.objects.filter(project=self.p1)
+        cursor = KeysetPaginator(queryset, ['num'], 5).get_page().next_cursor
+        with self.assertRaises(InvalidCursor):
+            KeysetPaginator(queryset, ['-num'], 5).get_page(cursor)
+        with self.assertRaises(InvalidCursor):
+            KeysetPaginator(queryset, ['num'], 5).get_page(cursor + 'x')
+
+    def test_nullable_ordering(self):
+        with self.assertRaises(ValueError):
+            KeysetPaginator(Issue.objects.all(), ['assignee__username'], 5)
+
+    def test_table_cursor(self):
+        # The table endpoints hand out a cursor for the next page and accept it in place of an offset.
+        url = reverse('issues:project-issues-table', kwargs={'slug': self.p1.slug})
+        params = {'start': 0, 'length': 5, 'order[0][column]': 0, 'order[0][dir]': 'asc'}
+        first = self.client.get(url, params).json()
+        self.assertEqual(first['next']['start'], 5)
+
+        by_offset = self.client.get(url, {**params, 'start': 5}).json()
+        by_cursor = self.client.get(url, {**params, 'start': 5, 'cursor': first['next']['cursor']}).json()
+        self.assertEqual(by_cursor['data'], by_offset['data'])
+        self.assertEqual([row['num'] for row in by_cursor['data']], [6, 7, 8, 9, 10])
+
+    def test_comment_pages(self):
+        for i in range(30):
+            Comment.objects.create(text=f'Comment {i}', author=self.test_admin, issue=self.issue1)
+        url = reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': self.issue1.num})
+        first = self.client.get(url).context['comments']
+        self.assertEqual(len(first), 25)
+        self.assertTrue(first.has_next())
+
+        # 30 new comments plus the 2 on Issue 1 in the fixture.
+        second = self.client.get(url, {'cursor': first.next_cursor}).context['comments']
+        self.assertEqual(len(second), 7)
+        self.assertFalse(second.has_next())
+
+        response = self.client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,60 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from issues.models import (
+    Project,
+    Issue,
+    Comment
+)
+from issues.permissions import UserPermissions
+
+
+class TestUserPermissions(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        self.p1 = Project.objects.get(title='Project1')
+        self.p2 = Project.objects.get(title='Project2')
+        self.issue1 = Issue.objects.get(project=self.p1, num=1)
+        self.issue2 = Issue.objects.get(project=self.p1, num=2)
+
+    def test_roles(self):
+        admin_perms = UserPermissions(User.objects.get(username='admin1'))
+        self.assertTrue(admin_perms.is_admin)
+        self.assertTrue(admin_perms.can_manage_project(self.p2))
+        self.assertTrue(admin_perms.can_edit_issue(Issue.objects.get(project=self.p2, num=1)))
+
+        # 'manager1' is assigned to Project1 only.
+        manager_perms = UserPermissions(User.objects.get(username='manager1'))
+        self.assertTrue(manager_perms.is_manager)
+        self.assertTrue(manager_perms.can_manage_project(self.p1))
+        self.assertFalse(manager_perms.can_manage_project(self.p2))
+
+        # 'dev1' is assigned to Issue 1 of Project1, but not Issue 2.
+        dev_perms = UserPermissions(User.objects.get(username='dev1'))
+        self.assertFalse(dev_perms.is_admin_or_manager)
+        self.assertTrue(dev_perms.can_view_project(self.p1))
+        self.assertFalse(dev_perms.can_manage_project(self.p1))
+        self.assertTrue(dev_perms.can_edit_issue(self.issue1))
+        self.assertFalse(dev_perms.can_edit_issue(self.issue2))
+
+        # 'dev1' has authored comment id=2 but not comment id=1.
+        self.assertTrue(dev_perms.can_edit_post(Comment.objects.get(id=2), self.p1))
+        self.assertFalse(dev_perms.can_edit_post(Comment.objects.get(id=1), self.p1))
+
+    def test_lookups_are_memoized(self):
+        perms = UserPermissions(User.objects.get(username='manager1'))
+        with self.assertNumQueries(3):
+            perms.can_manage_project(self.p1)
+            perms.can_edit_issue(self.issue1)
+            perms.can_edit_issue(self.issue2)
+            perms.can_view_project(self.p2)
+            perms.is_assigned_to_issue(self.issue2)
+
+    def test_request_permissions(self):
+        # The middleware attaches the current user's permissions to the request.
+        self.client.force_login(user=User.objects.get(username='dev1'))
+        response = self.client.get(reverse('issues:my-issues'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.wsgi_request.permissions.is_admin)
+        self.assertIn(self.issue1.id, response.wsgi_request.permissions.issue_ids)
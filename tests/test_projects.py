@@ -1,5 +1,7 @@
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from issues.models import (
     Project,
@@ -146,3 +148,70 @@ class TestProjects(TestCase):
         for issue in issues:
             self.assertNotIn(user1, issue.assigned_users.all())
             self.assertNotIn(user2, issue.assigned_users.all())
+
+    def test_project_assign_query_count(self):
+        # Assigning and unassigning users takes the same number of queries however many issues the project has.
+        users = list(User.objects.filter(username__in=['dev2', 'manager2']))
+        url = reverse('issues:project-assign', kwargs={'slug': self.p1.slug})
+
+        def get_query_counts():
+            counts = []
+            for action in ('assign', 'unassign'):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.post(url, data={'selection': [u.id for u in users], 'action': action})
+                counts.append(len(queries))
+            return counts
+
+        small_project_counts = get_query_counts()
+        submitter = User.objects.get(username='submitter1')
+        for i in range(50):
+            Issue.objects.create(title=f'Issue {i}', description='A test issue.', submitter=submitter, project=self.p1)
+        self.assertEqual(get_query_counts(), small_project_counts)
+
+        # The manager was given every issue, and had them taken away again.
+        self.client.post(url, data={'selection': [u.id for u in users], 'action': 'assign'})
+        manager2 = User.objects.get(username='manager2')
+        self.assertEqual(manager2.assigned_issues.filter(project=self.p1).count(), 52)
+        self.client.post(url, data={'selection': [u.id for u in users], 'action': 'unassign'})
+        self.assertFalse(manager2.assigned_issues.filter(project=self.p1).exists())
+
+    def test_project_assign_unknown_user(self):
+        post_response = self.client.post(
+            reverse('issues:project-assign', kwargs={'slug': self.p1.slug}),
+            data={'selection': [999], 'action': 'assign'}
+        )
+        self.assertEqual(post_response.status_code, 404)
+
+    def test_user_tables_query_count(self):
+        # Showing each user's group takes no extra queries per user.
+        issue = self.p1.issues.get(num=1)
+        issue_kwargs = {'project_slug': self.p1.slug, 'issue_num': issue.num}
+        urls = [
+            reverse('issues:project-detail', kwargs={'slug': self.p1.slug}),
+            reverse('issues:project-assign', kwargs={'slug': self.p1.slug}),
+            reverse('issues:issue-detail', kwargs=issue_kwargs),
+            reverse('issues:issue-assign', kwargs=issue_kwargs),
+            reverse('issues:users-list'),
+        ]
+
+        def get_query_counts():
+            counts = []
+            for url in urls:
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                counts.append(len(queries))
+            return counts
+
+        self.client.get(urls[0])
+        counts = get_query_counts()
+        developers = Group.objects.get(name='Developer')
+        for i in range(20):
+            user = User.objects.create(username=f'member{i}', email=f'member{i}@ex.com')
+            user.groups.add(developers)
+            self.p1.assigned_users.add(user)
+            issue.assigned_users.add(user)
+        self.assertEqual(get_query_counts(), counts)
+
+        response = self.client.get(urls[0])
+        self.assertContains(response, '<td class="align-middle">Developer</td>', count=21)
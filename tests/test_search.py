@@ -0,0 +1,149 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from issues import search
+from issues.models import (
+    Project,
+    Issue,
+    Comment,
+    Reply,
+    SearchDocument,
+    SearchTerm
+)
+
+
+class TestSearch(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        # Fixtures are loaded without indexing.
+        search.rebuild_index()
+        self.test_admin = User.objects.get(username='admin1')
+        self.client.force_login(user=self.test_admin)
+        self.p1 = Project.objects.get(title='Project1')
+        self.p2 = Project.objects.get(title='Project2')
+        self.issue1 = Issue.objects.get(project=self.p1, num=1)
+        self.url = reverse('issues:search')
+
+    def results(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.context['results']
+
+    def test_rebuild_index(self):
+        self.assertEqual(SearchDocument.objects.filter(kind=SearchDocument.KIND_ISSUE).count(), 3)
+        self.assertEqual(SearchDocument.objects.filter(kind=SearchDocument.KIND_COMMENT).count(), 4)
+        self.assertEqual(SearchDocument.objects.filter(kind=SearchDocument.KIND_REPLY).count(), 3)
+
+    def test_matches_issues_comments_and_replies(self):
+        self.issue1.description = 'The login page crashes on submit.'
+        self.issue1.save()
+        comment = Comment.objects.create(text='Reproduced the crash in Firefox.', author=self.test_admin, issue=self.issue1)
+        Reply.objects.create(text='Firefox only, Chrome is fine.', author=self.test_admin, comment=comment)
+
+        results = self.results('login crashes')
+        self.assertEqual([document.issue_id for document in results], [self.issue1.id])
+        self.assertIn('login page crashes', results[0].excerpt)
+
+        kinds = {document.kind for document in self.results('firefox')}
+        self.assertEqual(kinds, {SearchDocument.KIND_COMMENT, SearchDocument.KIND_REPLY})
+
+        response = self.client.get(self.url, {'q': 'firefox'})
+        self.assertContains(response, reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': 1}))
+        self.assertContains(response, 'Reply by admin1')
+
+    def test_issue_tag(self):
+        self.issue1.tag = 'Frontend'
+        self.issue1.save()
+        self.assertEqual([document.issue_id for document in self.results('frontend')], [self.issue1.id])
+
+    def test_ranking(self):
+        Comment.objects.create(text='Timeout.', author=self.test_admin, issue=self.issue1)
+        busy = Comment.objects.create(text='Timeout after timeout after timeout.', author=self.test_admin, issue=self.issue1)
+        self.assertEqual(self.results('timeout')[0].comment_id, busy.id)
+
+    def test_updates(self):
+        comment = Comment.objects.create(text='A flaky migration.', author=self.test_admin, issue=self.issue1)
+        self.assertEqual(len(self.results('flaky')), 1)
+
+        comment.text = 'A broken migration.'
+        comment.save()
+        self.assertEqual(len(self.results('flaky')), 0)
+        self.assertEqual(len(self.results('broken')), 1)
+        self.assertEqual(SearchDocument.objects.filter(comment=comment).count(), 1)
+
+        comment.delete()
+        self.assertEqual(len(self.results('broken')), 0)
+        self.assertFalse(SearchDocument.objects.filter(body__contains='broken').exists())
+
+    def test_issue_delete(self):
+        Comment.objects.create(text='Unrepeatable words.', author=self.test_admin, issue=self.issue1)
+        self.issue1.delete()
+        self.assertEqual(len(self.results('unrepeatable')), 0)
+        self.assertFalse(SearchDocument.objects.filter(issue_id=self.issue1.id).exists())
+
+    def test_permissions(self):
+        # comment4 is on Project2's issue; dev1 is only assigned to Project1.
+        self.assertEqual({document.project_id for document in self.results('comment1')}, {self.p1.id, self.p2.id})
+        self.client.force_login(user=User.objects.get(username='dev1'))
+        self.assertEqual({document.project_id for document in self.results('comment1')}, {self.p1.id})
+        self.client.force_login(user=User.objects.get(username='dev2'))
+        self.assertEqual({document.project_id for document in self.results('comment1')}, {self.p2.id})
+
+    def test_pagination(self):
+        Comment.objects.bulk_create([
+            Comment(text=f'Paged result {i}.', author=self.test_admin, issue=self.issue1) for i in range(25)
+        ])
+        search.rebuild_index()
+        response = self.client.get(self.url, {'q': 'paged'})
+        self.assertEqual(len(response.context['results']), 20)
+        self.assertTrue(response.context['has_next'])
+        self.assertFalse(response.context['has_previous'])
+
+        response = self.client.get(self.url, {'q': 'paged', 'page': 2})
+        self.assertEqual(len(response.context['results']), 5)
+        self.assertFalse(response.context['has_next'])
+        self.assertTrue(response.context['has_previous'])
+
+    def test_query_syntax_is_ignored(self):
+        Comment.objects.create(text='Quotes "and" parentheses.', author=self.test_admin, issue=self.issue1)
+        for query in ('"quotes', 'quotes AND (NOT', 'quotes*', "quotes' OR 1=1 --"):
+            self.assertEqual(self.client.get(self.url, {'q': query}).status_code, 200)
+        self.assertEqual(len(self.results('"parentheses)')), 1)
+        self.assertEqual(len(self.results('!!!')), 0)
+        self.assertEqual(len(self.results('')), 0)
+
+    def test_query_count(self):
+        self.client.get(self.url, {'q': 'comment1'})
+        with self.assertNumQueries(4):
+            # Session, user, the viewer's groups and the results.
+            self.client.get(self.url, {'q': 'comment1'})
+
+    def test_fallback_backend(self):
+        with mock.patch('issues.search.get_backend', return_value=search.SearchBackend()):
+            search.rebuild_index()
+            self.assertTrue(SearchTerm.objects.filter(term='comment1').exists())
+
+            comment = Comment.objects.create(text='Deadlock, deadlock.', author=self.test_admin, issue=self.issue1)
+            self.assertEqual(SearchTerm.objects.get(document__comment=comment, term='deadlock').count, 2)
+            self.assertEqual(len(self.results('deadlock')), 1)
+            self.assertEqual(len(self.results('deadlock missing')), 0)
+
+            comment.text = 'Livelock.'
+            comment.save()
+            self.assertEqual(len(self.results('deadlock')), 0)
+            self.assertEqual(len(self.results('livelock')), 1)
+
+            self.client.force_login(user=User.objects.get(username='dev2'))
+            self.assertEqual({document.project_id for document in self.results('comment1')}, {self.p2.id})
+
+    def test_database_index_in_use(self):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                if search.has_fts5(cursor):
+                    self.assertIsInstance(search.get_backend(), search.SQLiteBackend)
+        elif connection.vendor == 'postgresql':
+            self.assertIsInstance(search.get_backend(), search.PostgresBackend)
@@ -0,0 +1,58 @@
+import io
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessions'}}
+
+
+class TestSessionStores(TestCase):
+    fixtures = ['fixture.json']
+
+    def session_queries(self):
+        """The queries of the session table made by loading a page as a logged-in user."""
+        self.client.force_login(User.objects.get(username='dev1'))
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('issues:my-issues'))
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in captured if Session._meta.db_table in query['sql']]
+
+    def test_db(self):
+        self.assertEqual(len(self.session_queries()), 1)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db', CACHES=LOCMEM_CACHE)
+    def test_cached_db(self):
+        self.assertEqual(self.session_queries(), [])
+        # The table is still written to, for when the cache loses the session.
+        self.assertTrue(Session.objects.exists())
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookies(self):
+        self.assertEqual(self.session_queries(), [])
+        self.assertFalse(Session.objects.exists())
+
+
+class TestPruneSessions(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+
+    def test_expired_sessions_deleted(self):
+        stdout = io.StringIO()
+        call_command('prune_sessions', '--batch-size=2', stdout=stdout)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+        self.assertIn('Deleted 5 sessions.', stdout.getvalue())
+
+    def test_all(self):
+        call_command('prune_sessions', '--all', stdout=io.StringIO())
+        self.assertFalse(Session.objects.exists())
@@ -0,0 +1,84 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from issues.models import (
+    Project,
+    Issue
+)
+
+
+class TestTables(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        self.test_admin = User.objects.get(username='admin1')
+        self.client.force_login(user=self.test_admin)
+        self.p1 = Project.objects.get(title='Project1')
+        self.url = reverse('issues:project-issues-table', kwargs={'slug': self.p1.slug})
+
+    def test_project_issues_page(self):
+        response = self.client.get(self.url, {'draw': 3, 'start': 0, 'length': 1, 'order[0][column]': 0, 'order[0][dir]': 'desc'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['draw'], 3)
+        self.assertEqual(data['recordsTotal'], 2)
+        self.assertEqual(data['recordsFiltered'], 2)
+        self.assertEqual([row['num'] for row in data['data']], [2])
+
+        # The second page picks up where the first left off.
+        response = self.client.get(self.url, {'start': 1, 'length': 1, 'order[0][column]': 0, 'order[0][dir]': 'desc'})
+        self.assertEqual([row['num'] for row in response.json()['data']], [1])
+
+    def test_project_issues_search(self):
+        response = self.client.get(self.url, {'search[value]': 'Issue 2'})
+        data = response.json()
+        self.assertEqual(data['recordsTotal'], 2)
+        self.assertEqual(data['recordsFiltered'], 1)
+        self.assertEqual(data['data'][0]['title'], 'Issue 2')
+
+    def test_project_issues_escaped(self):
+        Issue.objects.create(title='<script>alert(1)</script>', description='A test issue.', submitter=self.test_admin, project=self.p1)
+        response = self.client.get(self.url, {'search[value]': 'script'})
+        self.assertEqual(response.json()['data'][0]['title'], '&lt;script&gt;alert(1)&lt;/script&gt;')
+
+    def test_project_issues_access(self):
+        # 'manager2' is not assigned to Project1.
+        self.client.force_login(user=User.objects.get(username='manager2'))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_my_issues(self):
+        # 'dev1' is only assigned to Issue 1 of Project1.
+        self.client.force_login(user=User.objects.get(username='dev1'))
+        response = self.client.get(reverse('issues:my-issues-table'))
+        data = response.json()
+        self.assertEqual(data['recordsTotal'], 1)
+        self.assertEqual(data['data'][0]['project'], 'Project1')
+        self.assertNotIn('Assign users', data['data'][0]['options'])
+
+    def test_my_issues_counts(self):
+        self.p1.issues.update(status=Issue.STATUS_CLOSED, priority=1)
+        with self.assertNumQueries(4):
+            # Session, user, the aggregate query and the group names for the navigation bar.
+            response = self.client.get(reverse('issues:my-issues'))
+        counts = response.context['issue_counts']
+        self.assertEqual(counts['total'], 2)
+        self.assertEqual(dict(counts['status']), {'Open': 0, 'Closed': 2})
+        self.assertEqual(dict(counts['priority'])['1 - Very High'], 2)
+
+    def test_my_issues_query_count(self):
+        for i in range(5):
+            issue = Issue.objects.create(title=f'Extra {i}', description='A test issue.', submitter=self.test_admin, project=self.p1)
+            issue.assigned_users.add(self.test_admin)
+        with self.assertNumQueries(5):
+            # Session, user, group names for the options column, the count and the page of rows.
+            response = self.client.get(reverse('issues:my-issues-table'), {'length': 100})
+        self.assertEqual(response.json()['recordsTotal'], 7)
+
+    def test_projects(self):
+        response = self.client.get(reverse('issues:projects-table'), {'order[0][column]': 0, 'order[0][dir]': 'asc'})
+        self.assertEqual([row['title'] for row in response.json()['data']], ['Project1', 'Project2'])
+
+        self.client.force_login(user=User.objects.get(username='manager1'))
+        response = self.client.get(reverse('issues:projects-table'))
+        self.assertEqual(response.status_code, 403)
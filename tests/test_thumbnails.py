@@ -0,0 +1,108 @@
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from issues import attachments, thumbnails
+from issues.models import Project, Issue
+from PIL import Image
+
+
+def make_image(size, mode='RGB', fmt='JPEG'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class TestThumbnails(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, ATTACHMENT_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.test_admin = User.objects.get(username='admin1')
+        self.client.force_login(user=self.test_admin)
+        self.p1 = Project.objects.get(title='Project1')
+        self.issue1 = Issue.objects.get(project=self.p1, num=1)
+        self.storage = thumbnails.get_storage()
+
+    def attach(self, issue, name, content):
+        self.attachment = attachments.store_upload(SimpleUploadedFile(name, content))
+        attachments.attach(issue, self.attachment, name)
+        return self.attachment.file.name
+
+    def test_derivatives(self):
+        name = self.attach(self.issue1, 'screenshot.jpg', make_image((3000, 2000)))
+        self.assertFalse(self.attachment.has_derivatives)
+        thumbnails.schedule(name)
+
+        for size, (width, height) in thumbnails.SIZES.items():
+            for fmt in thumbnails.FORMATS:
+                with self.storage.open(thumbnails.derivative_name(name, size, fmt)) as derivative:
+                    image = Image.open(derivative)
+                    self.assertEqual(image.format, fmt.upper())
+                    self.assertEqual(image.width, width)
+                    self.assertLess(image.height, height)
+
+        self.attachment.refresh_from_db()
+        self.assertTrue(self.attachment.has_derivatives)
+        response = self.client.get(reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': 1}))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, self.storage.url(thumbnails.derivative_name(name, 'thumbnail', 'webp')))
+
+    def test_deterministic_names(self):
+        name = self.attach(self.issue1, 'screenshot.jpg', make_image((800, 600)))
+        self.assertEqual(
+            thumbnails.derivative_name(name, 'preview', 'webp'),
+            thumbnails.derivative_name(name, 'preview', 'webp')
+        )
+        self.assertNotEqual(
+            thumbnails.derivative_name(name, 'preview', 'webp'),
+            thumbnails.derivative_name(name + 'x', 'preview', 'webp')
+        )
+        thumbnails.process_attachment(name)
+        directory = thumbnails.derivative_name(name, 'preview', 'webp').rsplit('/', 1)[0]
+        files = self.storage.listdir(directory)[1]
+        # Running again finds them all in storage, rather than saving copies under new names.
+        thumbnails.process_attachment(name)
+        self.assertEqual(self.storage.listdir(directory)[1], files)
+        self.assertEqual(len(files), len(thumbnails.SIZES) * len(thumbnails.FORMATS))
+
+    def test_transparent_image(self):
+        name = self.attach(self.issue1, 'diagram.png', make_image((600, 400), mode='RGBA', fmt='PNG'))
+        thumbnails.process_attachment(name)
+        with self.storage.open(thumbnails.derivative_name(name, 'thumbnail', 'jpeg')) as derivative:
+            self.assertEqual(Image.open(derivative).mode, 'RGB')
+
+    def test_unreadable_attachment(self):
+        name = self.attach(self.issue1, 'broken.jpg', b'not an image')
+        with self.assertLogs('issues.thumbnails', 'WARNING'):
+            thumbnails.process_attachment(name)
+        self.attachment.refresh_from_db()
+        self.assertFalse(self.attachment.has_derivatives)
+        response = self.client.get(reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': 1}))
+        self.assertNotContains(response, '<picture>')
+        self.assertContains(response, self.attachment.file.url)
+
+    def test_same_file_reuses_derivatives(self):
+        content = make_image((800, 600))
+        name = self.attach(self.issue1, 'screenshot.jpg', content)
+        thumbnails.process_attachment(name)
+        issue2 = Issue.objects.get(project=self.p1, num=2)
+        self.assertEqual(self.attach(issue2, 'copy.jpg', content), name)
+        self.assertTrue(self.attachment.has_derivatives)
+
+    def test_deleted_with_attachment(self):
+        name = self.attach(self.issue1, 'screenshot.jpg', make_image((800, 600)))
+        thumbnails.process_attachment(name)
+        self.issue1.issue_attachments.all().delete()
+        attachments.collect_garbage()
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(self.storage.exists(thumbnails.derivative_name(name, 'preview', 'webp')))
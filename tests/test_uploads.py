@@ -0,0 +1,292 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from botocore.stub import ANY, Stubber
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from issues import attachments, uploads
+from issues.models import Attachment, Project, Issue
+from PIL import Image
+from storages.backends.s3boto3 import S3Boto3Storage
+
+
+def stored_files(root):
+    return sorted(
+        os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/')
+        for directory, _, names in os.walk(root) for name in names
+    )
+
+
+def make_image(name='screenshot.png', size=(400, 300)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (30, 30, 200)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class TestStreamingUploads(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, ATTACHMENT_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.test_admin = User.objects.get(username='admin1')
+        self.client.force_login(user=self.test_admin)
+        self.p1 = Project.objects.get(title='Project1')
+        self.create_url = reverse('issues:project-issue-create', kwargs={'slug': self.p1.slug})
+
+    def issue_data(self, **data):
+        return {
+            'title': 'Attachment Issue', 'description': 'An issue with an attachment.', 'priority': 3,
+            'status': 'open', 'issue_type': 'bug', 'tag': 'test', **data
+        }
+
+    def stored_files(self):
+        return stored_files(self.media_root)
+
+    def make_handler(self):
+        return uploads.StreamingUploadHandler(None, {'new_attachments'}, default_storage, lambda name: f'uploads/{name}')
+
+    def test_upload(self):
+        image = make_image()
+        response = self.client.post(self.create_url, data=self.issue_data(new_attachments=image))
+        issue = Issue.objects.get(title='Attachment Issue')
+        self.assertRedirects(response, reverse('issues:issue-detail', kwargs={'project_slug': self.p1.slug, 'issue_num': issue.num}))
+        issue_attachment = issue.issue_attachments.get()
+        self.assertEqual(issue_attachment.name, 'screenshot.png')
+        image.seek(0)
+        content = image.read()
+        # The streamed file was moved to its content address, leaving nothing else behind.
+        self.assertEqual(issue_attachment.attachment.file.name, attachments.content_name(hashlib.sha256(content).hexdigest(), 'screenshot.png'))
+        self.assertEqual(self.stored_files(), [issue_attachment.attachment.file.name])
+        with default_storage.open(issue_attachment.attachment.file.name) as stored:
+            self.assertEqual(stored.read(), content)
+
+    def test_written_while_received(self):
+        # Each chunk goes straight to the file in storage; only the start is kept in memory.
+        handler = self.make_handler()
+        with self.assertRaises(uploads.StopFutureHandlers):
+            handler.new_file('new_attachments', 'big.png', 'image/png', None)
+        chunk = b'x' * 65536
+        for i in range(8):
+            self.assertIsNone(handler.receive_data_chunk(chunk, i * len(chunk)))
+        with open(default_storage.path('uploads/big.png'), 'rb') as partial:
+            self.assertEqual(len(partial.read()), 8 * len(chunk))
+        self.assertEqual(len(handler.head), uploads.HEAD_SIZE)
+
+        stored = handler.file_complete(8 * len(chunk))
+        self.assertEqual(stored.storage_name, 'uploads/big.png')
+        self.assertEqual(stored.size, 8 * len(chunk))
+        self.assertEqual(stored.sha256, hashlib.sha256(chunk * 8).hexdigest())
+
+    def test_other_fields_pass_through(self):
+        handler = self.make_handler()
+        handler.new_file('other', 'other.txt', 'text/plain', None)
+        self.assertEqual(handler.receive_data_chunk(b'data', 0), b'data')
+        self.assertIsNone(handler.file_complete(4))
+
+    def test_invalid_image(self):
+        response = self.client.post(self.create_url, data=self.issue_data(
+            new_attachments=SimpleUploadedFile('notes.png', b'not an image', content_type='image/png')
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('new_attachments', response.context['form'].errors)
+        self.assertEqual(self.stored_files(), [])
+
+    @override_settings(ATTACHMENT_MAX_UPLOAD_SIZE=1024)
+    def test_too_large(self):
+        response = self.client.post(self.create_url, data=self.issue_data(new_attachments=make_image(size=(1000, 1000))))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('at most 1.0\xa0KB', str(response.context['form'].errors['new_attachments']))
+        self.assertEqual(self.stored_files(), [])
+
+    def test_demo_user(self):
+        self.client.force_login(user=User.objects.get(email='demo@ex.com'))
+        self.client.post(self.create_url, data=self.issue_data(new_attachments=make_image()))
+        self.assertFalse(Issue.objects.filter(title='Attachment Issue').exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(user=self.test_admin)
+        response = client.post(self.create_url, data=self.issue_data(new_attachments=make_image()))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_refused_before_upload(self):
+        # A user who can't create issues in a project is refused before anything is streamed.
+        p2 = Project.objects.get(title='Project2')
+        self.client.force_login(user=User.objects.get(username='dev1'))
+        with mock.patch('issues.views.StreamingUploadHandler') as handler:
+            response = self.client.post(
+                reverse('issues:project-issue-create', kwargs={'slug': p2.slug}),
+                data=self.issue_data(new_attachments=make_image())
+            )
+        self.assertEqual(response.status_code, 403)
+        handler.assert_not_called()
+
+        self.client.logout()
+        with mock.patch('issues.views.StreamingUploadHandler') as handler:
+            response = self.client.post(self.create_url, data=self.issue_data(new_attachments=make_image()))
+        self.assertEqual(response.status_code, 302)
+        handler.assert_not_called()
+
+    def test_update(self):
+        issue = Issue.objects.get(project=self.p1, num=1)
+        self.client.post(
+            reverse('issues:issue-update', kwargs={'project_slug': self.p1.slug, 'issue_num': 1}),
+            data=self.issue_data(new_attachments=make_image('update.png'))
+        )
+        self.assertEqual(list(issue.issue_attachments.values_list('name', flat=True)), ['update.png'])
+
+    @override_settings(ATTACHMENT_STREAMING_UPLOADS=False)
+    def test_buffered(self):
+        self.client.post(self.create_url, data=self.issue_data(new_attachments=make_image()))
+        issue = Issue.objects.get(title='Attachment Issue')
+        self.assertEqual(issue.issue_attachments.get().name, 'screenshot.png')
+        self.assertEqual(self.stored_files(), [issue.attachments.get().file.name])
+
+
+class TestS3MultipartWriter(TestCase):
+
+    def test_parts(self):
+        storage = S3Boto3Storage(bucket_name='attachments', access_key='test', secret_key='test', region_name='us-east-1')
+        client = storage.bucket.meta.client
+        part_size = uploads.S3_MIN_PART_SIZE
+        with Stubber(client) as stubber:
+            stubber.add_response(
+                'create_multipart_upload', {'UploadId': 'upload-1'},
+                {'Bucket': 'attachments', 'Key': 'attachments/big.png', 'ContentType': 'image/png'}
+            )
+            for number in (1, 2):
+                stubber.add_response(
+                    'upload_part', {'ETag': f'"etag-{number}"'},
+                    {'Bucket': 'attachments', 'Key': 'attachments/big.png', 'UploadId': 'upload-1', 'PartNumber': number, 'Body': ANY}
+                )
+            stubber.add_response(
+                'complete_multipart_upload', {},
+                {
+                    'Bucket': 'attachments', 'Key': 'attachments/big.png', 'UploadId': 'upload-1',
+                    'MultipartUpload': {'Parts': [{'ETag': '"etag-1"', 'PartNumber': 1}, {'ETag': '"etag-2"', 'PartNumber': 2}]}
+                }
+            )
+
+            writer = uploads.S3MultipartWriter(storage, 'attachments/big.png', 'image/png', 1024)
+            for _ in range(part_size // 65536):
+                writer.write(b'x' * 65536)
+            # A full part has been sent, so nothing is held in memory.
+            self.assertEqual(len(writer.buffer), 0)
+            writer.write(b'x' * 10)
+            self.assertEqual(writer.complete(), 'attachments/big.png')
+            stubber.assert_no_pending_responses()
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE='storage_backends.LocalMediaStorage',
+    ATTACHMENT_DIRECT_UPLOADS=True,
+    ATTACHMENT_WORKERS=0
+)
+class TestDirectUploads(TestCase):
+    fixtures = ['fixture.json']
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client.force_login(user=User.objects.get(username='admin1'))
+        self.p1 = Project.objects.get(title='Project1')
+        self.create_url = reverse('issues:project-issue-create', kwargs={'slug': self.p1.slug})
+
+    def request_upload(self, image, **data):
+        response = self.client.post(reverse('issues:attachment-upload'), {
+            'file-name': image.name, 'content-type': image.content_type, 'size': image.size, **data
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def create_issue(self, key):
+        return self.client.post(self.create_url, data={
+            'title': 'Direct Issue', 'description': 'A directly uploaded attachment.', 'priority': 3,
+            'status': 'open', 'issue_type': 'bug', 'tag': 'test', 'attachment_keys': key
+        })
+
+    def test_direct_upload(self):
+        image = make_image()
+        upload = self.request_upload(image)
+        response = Client().post(upload['url'], {**upload['fields'], 'file': image})
+        self.assertEqual(response.status_code, 204)
+
+        self.assertTrue(upload['fields']['key'].startswith(attachments.UPLOAD_DIRECTORY + '/'))
+        self.create_issue(upload['key'])
+        issue = Issue.objects.get(title='Direct Issue')
+        attachment = issue.attachments.get()
+        self.assertEqual(issue.issue_attachments.get().name, 'screenshot.png')
+        self.assertEqual(stored_files(self.media_root), [attachment.file.name])
+
+    def test_known_file_is_not_uploaded(self):
+        image = make_image()
+        content = image.read()
+        first = self.request_upload(image)
+        image.seek(0)
+        Client().post(first['url'], {**first['fields'], 'file': image})
+        self.create_issue(first['key'])
+
+        upload = self.request_upload(image, sha256=hashlib.sha256(content).hexdigest())
+        self.assertNotIn('url', upload)
+        self.create_issue(upload['key'])
+        attachment = Attachment.objects.get()
+        self.assertEqual(attachment.ref_count, 2)
+        self.assertEqual(Issue.objects.filter(title='Direct Issue', attachments=attachment).count(), 2)
+
+    def test_hash_of_unseen_file(self):
+        # A file attached only in a project the user isn't assigned to must still be uploaded.
+        image = make_image()
+        attachment = attachments.store_upload(image)
+        attachments.attach(Issue.objects.get(project__title='Project2', num=1), attachment, image.name)
+        self.client.force_login(user=User.objects.get(username='submitter1'))
+        upload = self.request_upload(image, sha256=attachment.sha256)
+        self.assertIn('url', upload)
+
+    def test_policy_is_checked(self):
+        image = make_image()
+        upload = self.request_upload(image)
+        tampered = {**upload['fields'], 'key': 'attachments/elsewhere.png'}
+        self.assertEqual(Client().post(upload['url'], {**tampered, 'file': image}).status_code, 400)
+        forged = {**upload['fields'], 'policy': 'forged'}
+        self.assertEqual(Client().post(upload['url'], {**forged, 'file': image}).status_code, 403)
+        self.assertFalse(default_storage.exists('attachments/elsewhere.png'))
+
+    def test_key_is_checked(self):
+        upload = self.request_upload(make_image())
+        # Nothing was uploaded under the key.
+        response = self.create_issue(upload['key'])
+        self.assertIn('new_attachments', response.context['form'].errors)
+        response = self.create_issue('attachments/uploads/screenshot.png')
+        self.assertIn('new_attachments', response.context['form'].errors)
+        self.assertFalse(Issue.objects.filter(title='Direct Issue').exists())
+
+    def test_only_images(self):
+        response = self.client.post(reverse('issues:attachment-upload'), {
+            'file-name': 'notes.txt', 'content-type': 'text/plain', 'size': 10
+        })
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(ATTACHMENT_DIRECT_UPLOADS=False)
+    def test_disabled(self):
+        response = self.client.post(reverse('issues:attachment-upload'), {
+            'file-name': 'a.png', 'content-type': 'image/png', 'size': 10
+        })
+        self.assertEqual(response.status_code, 404)
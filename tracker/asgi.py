@@ -11,6 +11,15 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tracker.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tracker.settings.production')
+# Serve the JSON endpoints as coroutines (see issues.async_views).
+os.environ.setdefault('ASYNC_VIEWS', 'true')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up. The issue activity stream is served outside Django's request
+# handling, which can't hold a response open without tying up a thread.
+from django.urls import reverse  # noqa: E402
+from issues.events import EventStreamApp  # noqa: E402
+
+application = EventStreamApp(django_application, reverse('issues:events'))
@@ -12,8 +12,10 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 
 
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 import environ
 import os
+import tempfile
 
 BASE_DIR = environ.Path(__file__) - 3
 env = environ.Env(
@@ -35,16 +37,19 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'storages',
     'accounts',
-    'issues'
+    'issues.apps.IssuesConfig'
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'issues.middleware.AsyncWhiteNoiseMiddleware',
+    'issues.instrumentation.InstrumentationMiddleware',
+    'issues.nplusone.NPlusOneMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'issues.middleware.PermissionsMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -53,7 +58,8 @@ ROOT_URLCONF = 'tracker.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'issues.instrumentation.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -70,6 +76,30 @@ TEMPLATES = [
 WSGI_APPLICATION = 'tracker.wsgi.application'
 
 
+# Caches
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+# Cached pages are invalidated by bumping versions kept in the cache, so every worker must share
+# it: with a local-memory cache, an edit made through one worker would leave the others serving
+# the old pages. The default is a table in the database, made by createcachetable on release;
+# rediscache://host:6379/1 saves the query each lookup costs there.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='dbcache://tracker_cache')
+}
+
+# Every logged-in request loads its session. SESSION_STORE picks where sessions are kept:
+#   db: the django_session table, read on every request.
+#   cached_db: the cache, falling back to the table, which is still written to. Only safe with a
+#     shared CACHE_URL; with a per-process cache, a session ended in one worker lives on in the others.
+#   signed_cookies: the session cookie itself, signed with SECRET_KEY, so nothing is stored. Sessions
+#     can't then be ended from the server other than by changing SECRET_KEY.
+# Expired sessions are deleted from the table by the prune_sessions command.
+SESSION_STORE = env.str('SESSION_STORE', default='cached_db' if 'CACHE_URL' in os.environ else 'db')
+if SESSION_STORE not in ('db', 'cached_db', 'signed_cookies'):
+    raise ImproperlyConfigured(f"SESSION_STORE must be db, cached_db or signed_cookies, not '{SESSION_STORE}'.")
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_STORE}'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -113,6 +143,57 @@ STATICFILES_DIRS = (
     os.path.join(BASE_DIR, 'static'),
 )
 
+# Pages load the bundles built by the build_assets command (see issues.bundles). collectstatic names
+# each file with a hash of its content, so a file by that name never changes, and is served to be
+# cached for good. WhiteNoise would otherwise look the name up in the manifest, which it only does
+# with DEBUG off.
+WHITENOISE_IMMUTABLE_FILE_TEST = r'\.[0-9a-f]{12}\.\w+$'
+
+# Threads resizing attachments in the background. With 0, they're resized during the request instead.
+ATTACHMENT_WORKERS = env.int('ATTACHMENT_WORKERS', default=2)
+
+# Attachments are written to storage as they're received, holding at most the buffer size of each in
+# memory (5 MB at least on S3, whose multipart uploads need parts that big). With direct uploads, the
+# browser sends them to storage itself and the form only gets back where they were put.
+ATTACHMENT_STREAMING_UPLOADS = env.bool('ATTACHMENT_STREAMING_UPLOADS', default=True)
+ATTACHMENT_UPLOAD_BUFFER_SIZE = env.int('ATTACHMENT_UPLOAD_BUFFER_SIZE', default=8 * 1024 * 1024)
+ATTACHMENT_MAX_UPLOAD_SIZE = env.int('ATTACHMENT_MAX_UPLOAD_SIZE', default=50 * 1024 * 1024)
+ATTACHMENT_DIRECT_UPLOADS = env.bool('ATTACHMENT_DIRECT_UPLOADS', default=False)
+
+# tracker.asgi turns this on, serving the views that use issues.async_views.AsyncViewMixin as
+# coroutines, with their database work run in a pool of ASGI_THREADS threads.
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
+# Under ASGI, issue activity is pushed to open pages over Server-Sent Events (see issues.events);
+# under WSGI, where each stream would hold a worker, pages poll for new comments instead.
+# LocalBackend only reaches pages connected to the same process; with more than one, use PostgresBackend.
+EVENTS_BACKEND = env.str('EVENTS_BACKEND', default='issues.events.LocalBackend')
+
+# Each request's latency, queries, template time and response size are measured and added up by
+# view (see issues.instrumentation). Every process writes its numbers to METRICS_DIR, for the
+# request_metrics command and the admins' /request-metrics/ endpoint to add up; empty, they're kept in
+# memory only. SERVER_TIMING sends each request's timings back in a Server-Timing header, for the
+# browser's developer tools to show; it's on with the DEBUG environment variable, as the timings
+# tell anyone how long the server takes over what.
+METRICS_DIR = env.str('METRICS_DIR', default=os.path.join(tempfile.gettempdir(), 'tracker-metrics'))
+METRICS_WRITE_INTERVAL = env.int('METRICS_WRITE_INTERVAL', default=10)
+# The files of processes that have exited are deleted after this many seconds without being written.
+METRICS_RETENTION = env.int('METRICS_RETENTION', default=24 * 60 * 60)
+SERVER_TIMING = env.bool('SERVER_TIMING', default=env('DEBUG'))
+# Prometheus scrapes /metrics with this as its bearer token. Unset, /metrics is forbidden, unless
+# METRICS_PUBLIC opens it to anyone, for when only the scraper can reach the server.
+METRICS_TOKEN = env.str('METRICS_TOKEN', default='')
+METRICS_PUBLIC = env.bool('METRICS_PUBLIC', default=False)
+
+# Looks for N+1 queries (see issues.nplusone): a request or test that makes the same query more than
+# NPLUSONE_THRESHOLD times from the same template line or line of code is logged with 'warn', and
+# fails with 'raise'. For tests, `manage.py test --nplusone warn` does the same for one run.
+NPLUSONE_DETECTION = env.str('NPLUSONE_DETECTION', default='')
+if NPLUSONE_DETECTION not in ('', 'warn', 'raise'):
+    raise ImproperlyConfigured(f"NPLUSONE_DETECTION must be warn, raise or empty, not '{NPLUSONE_DETECTION}'.")
+NPLUSONE_THRESHOLD = env.int('NPLUSONE_THRESHOLD', default=3)
+TEST_RUNNER = 'issues.nplusone.NPlusOneTestRunner'
+
 FIXTURE_DIRS = [
     os.path.join(BASE_DIR, 'fixtures'),
 ]
@@ -10,6 +10,17 @@ ALLOWED_HOSTS = ['127.0.0.1', 'jf-issue-tracker.herokuapp.com']
 CSRF_COOKIE_SECURE = True
 SESSION_COOKIE_SECURE = True
 
+if 'test' in sys.argv:
+    # Each test's database changes are rolled back, but cached pages would outlive them.
+    # Tests of the caching itself switch to a real cache with override_settings.
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }
+    }
+    # Nor should their requests' metrics be added to a running server's.
+    METRICS_DIR = ''
+
 if 'test' in sys.argv or SECRET_KEY=="travis":
     DATABASES = {
         'default': {